@@ -3,11 +3,15 @@
     It initializes the Flask app, sets up logging, and imports the routes.
 '''
 import logging
+import os
 import time
 
-from logging.handlers import RotatingFileHandler
+from threading import Lock
 from flask import Flask
 from app.data_ingestor import DataIngestor
+from app.log_pipeline import setup_logging
+from app.result_cache import ResultCache
+from app.result_store import make_result_store
 from app.task_runner import ThreadPool
 
 webserver = None
@@ -25,22 +29,40 @@ def create_app():
     logger = logging.getLogger("webserver_logger")
     logger.setLevel(logging.INFO)
 
-    handler = RotatingFileHandler("webserver.log", maxBytes=20000, backupCount=5)
-    handler.setLevel(logging.INFO)
-
-    formatter = logging.Formatter('%(asctime)s - %(message)s', datefmt='%Y-%m-%d %H:%M:%S %Z')
-    handler.setFormatter(formatter)
-
-    logger.addHandler(handler)
+    # records are written by a background thread, see log_pipeline
+    webserver.log_pipeline = setup_logging(logger)
     webserver.logger = logger
 
-    webserver.tasks_runner = ThreadPool()
+    webserver.tasks_runner = ThreadPool(make_result_store())
 
     # webserver.task_runner.start()
 
     webserver.data_path = "./nutrition_activity_obesity_usa_subset.csv"
-    webserver.data_ingestor = DataIngestor(webserver.data_path, webserver.tasks_runner.data_loaded)
-    webserver.job_counter = 1
+    # the admin endpoints only load CSVs from ADMIN_DATA_DIR, the dataset directory by default
+    webserver.data_dir = os.path.realpath(
+        os.environ.get('ADMIN_DATA_DIR', os.path.dirname(os.path.abspath(webserver.data_path)))
+    )
+    webserver.data_ingestor = DataIngestor(
+        webserver.data_path,
+        webserver.tasks_runner.data_loaded,
+        compact=os.environ.get('DI_COMPACT_LOAD', '0') == '1',
+        value_dtype=os.environ.get('DI_VALUE_DTYPE', 'float64'),
+        snapshot=os.environ.get('DI_SNAPSHOT', '0') == '1',
+        column_store=os.environ.get('DI_COLUMN_STORE', '0') == '1',
+    )
+    webserver.tasks_runner.set_dataset(webserver.data_ingestor)
+
+    # with TP_DURABLE=1, the jobs left queued by the previous run are queued again
+    recovered = webserver.tasks_runner.recover(webserver.data_ingestor)
+    if recovered:
+        logger.info("Recovered %s jobs of the previous run", recovered)
+
+    # background reloads and appends of the dataset, one at a time
+    webserver.dataset_load = {"lock": Lock(), "running": False, "error": None}
+
+    webserver.result_cache = ResultCache(
+        int(os.environ.get('RC_CACHE_SIZE', '1024')), webserver.tasks_runner.get_state
+    )
 
     from app import routes
 
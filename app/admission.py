@@ -0,0 +1,98 @@
+'''
+    This module is responsible for limiting the work accepted by the thread pool.
+'''
+import math
+import time
+
+from collections import deque
+from threading import Lock
+
+
+class AdmissionError(Exception):
+    '''
+        Raised when a job is rejected, retry_after is the estimated number of seconds
+        until the queue has drained enough to accept it.
+    '''
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    '''
+        Bounds the queue depth and the number of in-flight (queued or running) jobs
+        of each client. The service rate is measured over the latest completions and
+        used to estimate how long the queue takes to drain.
+    '''
+    def __init__(self, max_queue: int, max_client_jobs: int):
+        # 0 means unlimited
+        self.limits = {"queue": max_queue, "client_jobs": max_client_jobs}
+
+        self.lock = Lock()
+        # jobs admitted and not dequeued yet, counted under the lock that admits them
+        self.queued = set()
+        self.in_flight = {}
+        self.job_clients = {}
+        self.completions = deque(maxlen=256)
+        self.rejections = {"queue_full": 0, "client_limit": 0}
+
+    def admit(self, job_id: int, client: str) -> None:
+        '''Registers a new job of client, raises AdmissionError if it is over a limit'''
+        with self.lock:
+            if 0 < self.limits["queue"] <= len(self.queued):
+                self.rejections["queue_full"] += 1
+                raise AdmissionError("Job queue is full", self._retry_after(len(self.queued)))
+
+            in_flight = self.in_flight.get(client, 0)
+            if 0 < self.limits["client_jobs"] <= in_flight:
+                self.rejections["client_limit"] += 1
+                raise AdmissionError("Too many jobs in flight for client",
+                                     self._retry_after(in_flight))
+
+            self.in_flight[client] = in_flight + 1
+            self.job_clients[job_id] = client
+            self.queued.add(job_id)
+
+    def dequeued(self, job_id: int) -> None:
+        '''Frees the queue slot of a job taken off the queue by a TaskRunner'''
+        with self.lock:
+            self.queued.discard(job_id)
+
+    def release(self, job_id: int) -> None:
+        '''Unregisters a finished job, once: releasing it again does nothing'''
+        with self.lock:
+            if job_id not in self.job_clients:
+                return
+            client = self.job_clients.pop(job_id)
+            self.completions.append(time.monotonic())
+            self.in_flight[client] -= 1
+            if self.in_flight[client] == 0:
+                del self.in_flight[client]
+
+    def _service_rate(self) -> float:
+        # completed jobs per second since the oldest of the latest completions
+        if not self.completions:
+            return 0.0
+        elapsed = time.monotonic() - self.completions[0]
+        return len(self.completions) / elapsed if elapsed > 0 else 0.0
+
+    def _retry_after(self, jobs: int) -> int:
+        rate = self._service_rate()
+        if rate == 0.0:
+            return 1
+        return min(max(math.ceil(jobs / rate), 1), 300)
+
+    def get_stats(self, queue_depth: int) -> dict:
+        '''Returns the limits, rejections and estimated drain time of the queue'''
+        with self.lock:
+            rate = self._service_rate()
+            return {
+                "queue_depth": queue_depth,
+                "max_queue": self.limits["queue"],
+                "max_client_jobs": self.limits["client_jobs"],
+                "clients_in_flight": len(self.in_flight),
+                "rejections": dict(self.rejections),
+                "service_rate": rate,
+                "drain_time": queue_depth / rate if rate else None,
+            }
@@ -0,0 +1,291 @@
+'''
+    This module is responsible for serving the Flask routes from an asyncio event loop,
+    so idle and long-polling connections do not hold a thread each.
+'''
+import asyncio
+import functools
+import logging
+import math
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode
+from werkzeug.test import EnvironBuilder, run_wsgi_app
+
+# /api/get_results requests, whose ?wait= is awaited on the event loop
+GET_RESULTS = re.compile(r'^/api/get_results/(\d+)$')
+
+# maximum number of seconds a /api/get_results request can wait for its job, see routes
+MAX_WAIT = 30.0
+
+# bytes of a response body sent before the rest is read from the app, and request limits
+FIRST_CHUNK = 64 * 1024
+MAX_HEADER = 64 * 1024
+MAX_BODY = 16 * 1024 * 1024
+
+
+class BadRequest(Exception):
+    '''Raised for requests that cannot be parsed, answered with a 400'''
+
+
+class AsyncHTTPServer:
+    '''
+        HTTP/1.1 server running on an asyncio event loop in front of the Flask app. Each
+        connection is a coroutine, kept open between requests. Requests are handed to the
+        app, through WSGI, on a small thread pool: they only queue jobs or read results, so
+        they return quickly. ?wait= on /api/get_results is awaited on the loop instead, on
+        a future resolved when the ThreadPool completes the job, so a waiting client costs
+        a coroutine, not a thread. Responses without a length are sent chunked.
+    '''
+    def __init__(self, app, workers: int = 16, idle_timeout: float = 75.0):
+        self.app = app
+        self.tasks_runner = app.tasks_runner
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi")
+        self.idle_timeout = idle_timeout
+        self.logger = logging.getLogger("webserver_logger")
+        self.stats = {"connections": 0, "open": 0, "requests": 0, "waiting": 0}
+        self.server = None
+
+    async def start(self, host: str, port: int, sock=None, backlog: int = 4096) -> None:
+        '''Starts accepting connections, on sock if given'''
+        if sock is not None:
+            self.server = await asyncio.start_server(
+                self.handle, sock=sock, limit=MAX_HEADER, backlog=backlog
+            )
+        else:
+            self.server = await asyncio.start_server(
+                self.handle, host, port, limit=MAX_HEADER, backlog=backlog
+            )
+
+    async def stop(self) -> None:
+        '''Stops accepting connections, then drains the thread pool and the jobs'''
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.tasks_runner.graceful_shutdown)
+        self.executor.shutdown()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        '''Serves the requests of one connection, until it is closed or idle too long'''
+        self.stats["connections"] += 1
+        self.stats["open"] += 1
+        peer = writer.get_extra_info("peername")
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.idle_timeout)
+                except BadRequest as e:
+                    self.logger.error("Bad request from %s: %s", peer, e)
+                    await self.write_error(writer, 400, str(e))
+                    break
+                if request is None:
+                    break
+                self.stats["requests"] += 1
+                keep_alive = await self.respond(request, peer, writer)
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.stats["open"] -= 1
+            writer.close()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> dict:
+        '''Reads and parses one request, None if the connection was closed before it'''
+        try:
+            head = await reader.readuntil(b'\r\n\r\n')
+        except asyncio.IncompleteReadError as e:
+            if e.partial.strip():
+                raise BadRequest("Incomplete request") from e
+            return None
+        except asyncio.LimitOverrunError as e:
+            raise BadRequest("Request header too large") from e
+
+        method, target, version, headers = _parse_head(head)
+        fields = {name.lower(): value for name, value in headers}
+
+        if 'chunked' in fields.get('transfer-encoding', '').lower():
+            raise BadRequest("Chunked requests are not supported")
+        try:
+            length = int(fields.get('content-length', '0') or 0)
+        except ValueError as e:
+            raise BadRequest("Invalid Content-Length") from e
+        if length < 0:
+            raise BadRequest("Invalid Content-Length")
+        if length > MAX_BODY:
+            raise BadRequest("Request body too large")
+        body = await reader.readexactly(length) if length else b''
+
+        path, _, query = target.partition('?')
+        keep_alive = (fields.get('connection', '').lower() != 'close' if version == 'HTTP/1.1'
+                      else fields.get('connection', '').lower() == 'keep-alive')
+        return {"method": method, "path": path, "query": query, "version": version,
+                "headers": headers, "body": body, "keep_alive": keep_alive}
+
+    async def respond(self, request: dict, peer: tuple, writer: asyncio.StreamWriter) -> bool:
+        '''Answers a request, returns whether the connection can be reused'''
+        match = GET_RESULTS.match(request["path"])
+        if match is not None and request["method"] == 'GET':
+            request["query"] = await self.wait_result(int(match.group(1)), request["query"])
+
+        environ = EnvironBuilder(
+            path=request["path"],
+            method=request["method"],
+            query_string=request["query"],
+            headers=request["headers"],
+            data=request["body"],
+            environ_overrides={"REMOTE_ADDR": peer[0] if peer else "",
+                               "SERVER_PROTOCOL": request["version"]},
+        ).get_environ()
+
+        loop = asyncio.get_running_loop()
+        status, headers, pieces, rest = await loop.run_in_executor(
+            self.executor, self.call_app, environ
+        )
+        chunked = 'Content-Length' not in headers and rest is not None
+        if 'Content-Length' not in headers and rest is None:
+            headers['Content-Length'] = str(sum(len(piece) for piece in pieces))
+        keep_alive = request["keep_alive"] and (not chunked or request["version"] == 'HTTP/1.1')
+        if chunked and keep_alive:
+            headers['Transfer-Encoding'] = 'chunked'
+        headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+
+        head = [f"HTTP/1.1 {status}"] + [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        await self.send_body(writer, pieces, rest, chunked and keep_alive)
+        return keep_alive
+
+    async def send_body(
+        self, writer: asyncio.StreamWriter, pieces: list, rest, framed: bool
+    ) -> None:
+        '''
+            Writes the pieces of a response body, then reads and writes the rest of it
+            from the app iterator on the executor, in chunked frames if framed
+        '''
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                for piece in pieces:
+                    if piece:
+                        writer.write(b'%x\r\n%b\r\n' % (len(piece), piece) if framed else piece)
+                await writer.drain()
+                if rest is None:
+                    break
+                pieces, rest = await loop.run_in_executor(self.executor, self.read_body, rest)
+        finally:
+            if rest is not None:
+                await loop.run_in_executor(self.executor, self.close_body, rest)
+        if framed:
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+
+    async def wait_result(self, job_id: int, query: str) -> str:
+        '''
+            Awaits, for up to ?wait= seconds, the completion of a job without holding a
+            thread. Returns the query string without wait, so the app answers right away.
+        '''
+        params = parse_qsl(query, keep_blank_values=True)
+        try:
+            wait = min(float(dict(params).get('wait', 0)), MAX_WAIT)
+        except ValueError:
+            return query
+        if not math.isfinite(wait) or wait <= 0:
+            return query
+
+        tasks_runner = self.tasks_runner
+        loop = asyncio.get_running_loop()
+        done = loop.create_future()
+        callback = functools.partial(_notify, loop, done)
+        # the registry may be an SQLite database, which is only queried off the loop
+        if not await loop.run_in_executor(self.executor, self.watch, job_id, callback):
+            return urlencode([(name, value) for name, value in params if name != 'wait'])
+
+        self.stats["waiting"] += 1
+        try:
+            # a job finished by another server process sharing the registry does not
+            # call on_done, its waiter then answers once the wait times out
+            await asyncio.wait_for(done, wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # a waiter that timed out leaves no callback behind
+            tasks_runner.remove_on_done(job_id, callback)
+            self.stats["waiting"] -= 1
+        return urlencode([(name, value) for name, value in params if name != 'wait'])
+
+    def watch(self, job_id: int, callback: callable) -> bool:
+        '''
+            Calls callback() once the job is finished, right away if it already is.
+            Returns False, without calling it, if the job is unknown.
+        '''
+        if not self.tasks_runner.is_valid(job_id):
+            return False
+        self.tasks_runner.on_done(job_id, callback)
+        return True
+
+    def call_app(self, environ: dict) -> tuple:
+        '''
+            Runs the app on a request, in the thread pool. Returns the status, the headers,
+            the first pieces of the body and the rest of it, None if it was read entirely.
+        '''
+        body, status, headers = run_wsgi_app(self.app, environ)
+        pieces, rest = self.read_body((iter(body), body))
+        return status, headers, pieces, rest
+
+    @staticmethod
+    def read_body(rest: tuple) -> tuple:
+        '''
+            Reads about FIRST_CHUNK bytes from the (iterator, body) rest of a body, returns
+            them and the rest, None once the body is read entirely and closed
+        '''
+        pieces = []
+        size = 0
+        for piece in rest[0]:
+            pieces.append(piece)
+            size += len(piece)
+            if size >= FIRST_CHUNK:
+                return pieces, rest
+        AsyncHTTPServer.close_body(rest)
+        return pieces, None
+
+    @staticmethod
+    def close_body(rest: tuple) -> None:
+        '''Closes a body, which releases the request context of the app'''
+        if hasattr(rest[1], 'close'):
+            rest[1].close()
+
+    async def write_error(self, writer: asyncio.StreamWriter, code: int, reason: str) -> None:
+        '''Answers a request that did not reach the app'''
+        body = reason.encode()
+        writer.write(f"HTTP/1.1 {code} Bad Request\r\nContent-Type: text/plain\r\n"
+                     f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+
+
+def _parse_head(head: bytes) -> tuple:
+    '''Returns the method, target, version and header list of a request head'''
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError as e:
+        raise BadRequest("Invalid request line") from e
+    headers = []
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers.append((name.strip(), value.strip()))
+    return method, target, version, headers
+
+
+def _notify(loop: asyncio.AbstractEventLoop, future: asyncio.Future) -> None:
+    '''Resolves future from the thread completing its job, unless its loop is closed'''
+    try:
+        loop.call_soon_threadsafe(_resolve, future)
+    except RuntimeError:
+        pass
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -1,23 +1,104 @@
 '''
     This module is responsible for reading the dataset and providing methods for statistics.
 '''
+import itertools
 import json
+import logging
+import os
+import resource
 from threading import Event
+import numpy as np
 import pandas as pd
-
-
-class DataIngestor:
+from pandas.api.types import union_categoricals
+
+from app.snapshot import SnapshotLock, load_snapshot, save_snapshot, source_stat
+
+
+# columns read by the compact loader, the string ones are stored as categoricals
+CATEGORY_COLUMNS = ['Question', 'LocationDesc', 'StratificationCategory1', 'Stratification1']
+VALUE_COLUMN = 'Data_Value'
+# the year of each row, optional: year ranges are only available if the dataset has it
+YEAR_COLUMN = 'YearStart'
+
+# query methods of DataIngestor => whether they take a state besides the question
+QUERIES = {
+    'states_mean': False,
+    'state_mean': True,
+    'best5': False,
+    'worst5': False,
+    'global_mean': False,
+    'diff_from_mean': False,
+    'state_diff_from_mean': True,
+    'mean_by_category': False,
+    'state_mean_by_category': True,
+    'state_trend': True,
+}
+
+# cost class of each query: light ones are index lookups, heavy ones grow with the dataset
+QUERY_COST = {
+    'states_mean': 'medium',
+    'state_mean': 'light',
+    'best5': 'medium',
+    'worst5': 'medium',
+    'global_mean': 'light',
+    'diff_from_mean': 'medium',
+    'state_diff_from_mean': 'light',
+    'mean_by_category': 'heavy',
+    'state_mean_by_category': 'medium',
+    'state_trend': 'light',
+    'batch': 'heavy',
+}
+
+# queries answered from the sorted state means, computed once per question by a batch
+STATES_MEAN_QUERIES = {'states_mean', 'best5', 'worst5', 'diff_from_mean'}
+
+
+def resident_memory() -> int:
+    '''Returns the resident memory of the current process in bytes'''
+    try:
+        with open("/proc/self/statm", "r", encoding="utf-8") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # peak resident memory, reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _plain_index(index: pd.Index) -> pd.Index:
+    '''Returns index with its categorical levels converted to their values'''
+    if isinstance(index, pd.MultiIndex):
+        return pd.MultiIndex.from_arrays(
+            [index.get_level_values(level).astype(str) for level in range(index.nlevels)]
+        )
+    return index.astype(str)
+
+
+class DataIngestor:  # pylint: disable=too-many-instance-attributes
     '''
         This class is responsible for reading the dataset and providing methods
         to calculate statistics.
     '''
-    def __init__(self, csv_path: str, data_loaded: Event = None):
+    # every loaded dataset gets a new version, used to invalidate cached results
+    _versions = itertools.count(1)
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        csv_path: str | pd.DataFrame,
+        data_loaded: Event = None,
+        compact: bool = False,
+        value_dtype: str = 'float64',
+        snapshot: bool = False,
+        aggregates: dict = None,
+        column_store: bool = False,
+    ):
         self.data_loaded = data_loaded
-
-        # Read csv from csv_path
-        self.data = pd.read_csv(csv_path)
-        if self.data_loaded is not None:
-            self.data_loaded.set()
+        self.version = next(DataIngestor._versions)
+        # the column store is the compact snapshot, mapped by every process of the host
+        self.column_store = column_store and not isinstance(csv_path, pd.DataFrame)
+        if self.column_store:
+            compact, snapshot = True, True
+        self.compact = compact
+        self.value_dtype = value_dtype
+        self.csv_path = None if isinstance(csv_path, pd.DataFrame) else csv_path
 
         self.questions_best_is_min = [
             'Percent of adults aged 18 years and older who have an overweight classification',
@@ -34,173 +115,516 @@ class DataIngestor:
             'Percent of adults who engage in muscle-strengthening activities on 2 or more days a week',
         ]
 
+        # Read csv from csv_path, from its snapshot, or use an already loaded dataset
+        # (e.g. from shared memory). With a snapshot, the processes of the host load it
+        # one at a time: the first one parses the CSV and saves it, the others map it.
+        rss_before = resident_memory()
+        if isinstance(csv_path, pd.DataFrame):
+            self.data = csv_path
+            self._index(aggregates, "dataframe")
+        elif not snapshot:
+            self.data = self._read_csv(csv_path, compact, value_dtype)
+            self._index(aggregates, "csv")
+        else:
+            with SnapshotLock(csv_path):
+                options = {"compact": compact, "value_dtype": value_dtype}
+                csv_stat = source_stat(csv_path)
+                loaded = load_snapshot(csv_path, csv_stat, options)
+                if loaded is not None:
+                    self.data, aggregates = loaded
+                    self._index(aggregates, "snapshot")
+                else:
+                    self.data = self._read_csv(csv_path, compact, value_dtype)
+                    aggregates = self._aggregate()
+                    save_snapshot(csv_path, csv_stat, options, self.data, aggregates)
+                    self._index(aggregates, "csv")
+
+        self.memory_report.update(rss_before=rss_before, rss_after=resident_memory())
+        logging.getLogger("webserver_logger").info("Dataset loaded: %s", self.memory_report)
+
+        if self.data_loaded is not None:
+            self.data_loaded.set()
+
+
+    @staticmethod
+    def _read_csv(csv_path: str, compact: bool, value_dtype: str) -> pd.DataFrame:
+        '''Parses the CSV, only the queried columns if compact'''
+        if not compact:
+            return pd.read_csv(csv_path)
+        # only the columns used by queries, strings as integer coded categoricals
+        return pd.read_csv(
+            csv_path,
+            usecols=lambda column: column in CATEGORY_COLUMNS + [YEAR_COLUMN, VALUE_COLUMN],
+            dtype={**{column: 'category' for column in CATEGORY_COLUMNS},
+                   YEAR_COLUMN: 'int16', VALUE_COLUMN: value_dtype},
+        )
+
+
+    def _index(self, aggregates: dict, source: str) -> None:
+        '''
+            Builds the aggregate index used to answer every query from aggregates, or from
+            the rows if None, and records where the dataset was loaded from
+        '''
+        self.memory_report = {
+            "compact": self.compact,
+            "column_store": self.column_store,
+            "source": source,
+            "data_bytes": int(self.data.memory_usage(deep=True).sum()),
+        }
+        self.question_index = {}
+        self.state_index = {}
+        self.states_index = {}
+        self.category_index = {}
+        self.years = np.array([], dtype='int64')
+        self.year_index = {}
+        if aggregates is None:
+            aggregates = self._aggregate()
+        self.aggregates = aggregates
+        self._build_index(aggregates)
+
+
+    def _aggregate(self) -> dict:
+        '''
+            Aggregates Data_Value into sums and counts keyed by (Question, LocationDesc,
+            StratificationCategory1, Stratification1) and rolled up per state and per question.
+            Every level is aggregated directly from the rows, in the same order and with the
+            same summation as the pandas call it replaces, so the means are bit-identical
+            to masking the whole dataset on every request.
+            On a compact dataset the groupbys run on the categorical integer codes.
+        '''
+        values = self.data[VALUE_COLUMN].astype('float64')
+        data = self.data.assign(**{VALUE_COLUMN: values})
+        aggregates = {}
+
+        # (Question, LocationDesc, StratificationCategory1, Stratification1) and
+        # (Question, LocationDesc) => groupby sums
+        for name, keys in [('category', CATEGORY_COLUMNS), ('states', CATEGORY_COLUMNS[:2])]:
+            grouped = data.groupby(keys, observed=True)[VALUE_COLUMN]
+            aggregates[name] = pd.DataFrame({'sum': grouped.sum(), 'count': grouped.count()})
+
+        # Question and (Question, LocationDesc) => row sums, as computed by Series.mean
+        raw = values.to_numpy()
+        for name, keys in [('question', CATEGORY_COLUMNS[0]), ('state', CATEGORY_COLUMNS[:2])]:
+            groups = data.groupby(keys, sort=False, observed=True).indices
+            aggregates[name] = pd.DataFrame({
+                'sum': [float(np.nansum(raw[positions])) for positions in groups.values()],
+                'count': [int(np.count_nonzero(~np.isnan(raw[positions])))
+                          for positions in groups.values()],
+            }, index=(pd.MultiIndex.from_tuples(list(groups), names=keys) if isinstance(keys, list)
+                      else pd.Index(list(groups))))
+
+        # the same three levels per year, for the year range queries
+        if YEAR_COLUMN in data.columns:
+            for name, keys in [('question_year', CATEGORY_COLUMNS[:1]),
+                               ('states_year', CATEGORY_COLUMNS[:2]),
+                               ('category_year', CATEGORY_COLUMNS)]:
+                grouped = data.groupby(keys + [YEAR_COLUMN], observed=True)[VALUE_COLUMN]
+                aggregates[name] = pd.DataFrame({'sum': grouped.sum(), 'count': grouped.count()})
+
+        return aggregates
+
+
+    @staticmethod
+    def _question_rows(index: pd.MultiIndex) -> tuple:
+        '''
+            Returns the order that groups the rows of index by question, None if they already
+            are, and the (question, start, stop) row range of each question in that order
+        '''
+        codes = np.asarray(index.codes[0])
+        order = None
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind='stable')
+            codes = codes[order]
+        bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+        starts = np.concatenate([[0], bounds]).astype('int64')
+        stops = np.concatenate([bounds, [len(codes)]]).astype('int64')
+        questions = index.levels[0][codes[starts]] if len(codes) else []
+        return order, list(zip(questions, starts.tolist(), stops.tolist()))
+
+
+    def _build_index(self, aggregates: dict):
+        '''
+            Splits the aggregates into the per question lookups used by the queries. The
+            aggregates are sorted by question, so each lookup is a slice of their columns
+            rather than a copy, which keeps them on the pages of a memory-mapped snapshot.
+        '''
+        for index, name in [(self.category_index, 'category'), (self.states_index, 'states')]:
+            frame = aggregates[name]
+            order, questions = self._question_rows(frame.index)
+            if order is not None:
+                frame = frame.iloc[order]
+            for question, start, stop in questions:
+                index[question] = frame.iloc[start:stop].droplevel(0)
+
+        for index, name in [(self.question_index, 'question'), (self.state_index, 'state')]:
+            frame = aggregates[name]
+            index.update(zip(frame.index, zip(frame['sum'].tolist(), frame['count'].tolist())))
+
+        if 'question_year' in aggregates:
+            self._build_year_index(aggregates)
+
+
+    @staticmethod
+    def _prefix_sums(table: pd.DataFrame, years: np.ndarray) -> dict:
+        '''
+            Returns the sum and count arrays of a table of groups by year, with a column of
+            zeros first and then the running totals over years
+        '''
+        prefix = {}
+        for column, dtype in [('sum', 'float64'), ('count', 'int64')]:
+            values = table[column].reindex(columns=years, fill_value=0).to_numpy(dtype)
+            prefix[column] = np.concatenate(
+                [np.zeros((len(values), 1), dtype), np.cumsum(values, axis=1)], axis=1
+            )
+        return prefix
+
 
-    def global_mean(self, question: str):
+    def _build_year_index(self, aggregates: dict):
+        '''
+            Turns the per year aggregates into prefix sums over the sorted years: for each
+            question, the groups of a level and two arrays whose row i, column j holds the
+            sum and count of group i over the years before self.years[j]. The totals over
+            any range of years are then the difference of two columns.
+        '''
+        frames = {name: aggregates[f"{name}_year"] for name in ['question', 'states', 'category']}
+        for name, frame in frames.items():
+            # the years are stored as strings in snapshots and after an append
+            frames[name] = frame.rename(index=int, level=frame.index.nlevels - 1)
+        self.years = np.unique(frames['question'].index.get_level_values(-1).to_numpy())
+
+        for name, frame in frames.items():
+            table = frame.unstack(-1, fill_value=0)
+            prefix = self._prefix_sums(table, self.years)
+
+            self.year_index[name] = {}
+            if table.index.nlevels == 1:
+                for row, question in enumerate(table.index):
+                    self.year_index[name][question] = (
+                        None, prefix['sum'][row:row + 1], prefix['count'][row:row + 1]
+                    )
+                continue
+            # unstack sorts the groups, so the rows of a question are already contiguous
+            order, questions = self._question_rows(table.index)
+            groups = table.index if order is None else table.index[order]
+            if order is not None:
+                prefix = {column: values[order] for column, values in prefix.items()}
+            for question, start, stop in questions:
+                self.year_index[name][question] = (
+                    groups[start:stop].droplevel(0),
+                    prefix['sum'][start:stop], prefix['count'][start:stop]
+                )
+
+
+    def append(self, csv_path: str) -> 'DataIngestor':
+        '''
+            Returns a new DataIngestor with the rows of csv_path added, loaded with the
+            same options. Only the new rows are aggregated, their sums and counts are then
+            added to the existing ones, so the means can differ from a full reload in the
+            last digits.
+        '''
+        delta = DataIngestor(csv_path, compact=self.compact, value_dtype=self.value_dtype)
+
+        if self.compact:
+            # the categories of both parts are merged, which recodes the columns
+            data = pd.DataFrame({
+                column: union_categoricals([self.data[column], delta.data[column]],
+                                           sort_categories=True)
+                for column in CATEGORY_COLUMNS
+            })
+            for column in [YEAR_COLUMN, VALUE_COLUMN]:
+                if column in self.data.columns:
+                    data[column] = np.concatenate(
+                        [self.data[column].to_numpy(), delta.data[column].to_numpy()]
+                    )
+            data = data[self.data.columns]
+        else:
+            data = pd.concat([self.data, delta.data], ignore_index=True)
+
+        aggregates = {}
+        for name, frame in self.aggregates.items():
+            merged = pd.concat([frame, delta.aggregates[name]])
+            merged.index = _plain_index(merged.index)
+            merged = merged.groupby(level=list(range(merged.index.nlevels)),
+                                    sort=name in ('category', 'states')).sum()
+            aggregates[name] = merged.astype({'count': 'int64'})
+
+        return DataIngestor(data, compact=self.compact, value_dtype=self.value_dtype,
+                            aggregates=aggregates)
+
+
+    @staticmethod
+    def _mean(total: float, count: int) -> float:
+        '''Mean from an aggregate, NaN if no value was recorded'''
+        return total / count if count else float('nan')
+
+
+    @staticmethod
+    def _years(year_from: int, year_to: int) -> tuple:
+        '''The (year_from, year_to) range of a query, None for the whole dataset'''
+        return None if year_from is None and year_to is None else (year_from, year_to)
+
+
+    def _year_range(self, year_from: int, year_to: int) -> tuple:
+        '''The prefix sum columns bounding the years from year_from to year_to, inclusive'''
+        start = 0 if year_from is None else int(np.searchsorted(self.years, year_from, 'left'))
+        stop = (len(self.years) if year_to is None
+                else int(np.searchsorted(self.years, year_to, 'right')))
+        return start, max(start, stop)
+
+
+    def _year_frame(self, name: str, question: str, years: tuple) -> pd.DataFrame:
+        '''
+            Sums and counts of the groups of a level (question, states or category) for a
+            question over a range of years, from two columns of the prefix sums. Groups
+            without any value in the range are left out, as are unknown questions.
+        '''
+        entry = self.year_index.get(name, {}).get(question)
+        if entry is None:
+            return pd.DataFrame({'sum': np.zeros(0), 'count': np.zeros(0, dtype='int64')})
+        groups, sums, counts = entry
+        start, stop = self._year_range(*years)
+        frame = pd.DataFrame({'sum': sums[:, stop] - sums[:, start],
+                              'count': counts[:, stop] - counts[:, start]}, index=groups)
+        return frame[frame['count'] > 0]
+
+
+    def _question_mean(self, question: str, years: tuple = None) -> float:
+        '''Mean of a question over the entire dataset, or over a range of years'''
+        if years is not None:
+            frame = self._year_frame('question', question, years)
+            return self._mean(float(frame['sum'].sum()), int(frame['count'].sum()))
+        return self._mean(*self.question_index.get(question, (0.0, 0)))
+
+
+    def _state_mean(self, question: str, state: str, years: tuple = None) -> float:
+        '''Mean of a question for a single state, optionally over a range of years'''
+        if years is not None:
+            frame = self._year_frame('states', question, years)
+            if state not in frame.index:
+                return float('nan')
+            return self._mean(frame.at[state, 'sum'], frame.at[state, 'count'])
+        return self._mean(*self.state_index.get((question, state), (0.0, 0)))
+
+
+    def _states_mean(
+        self, question: str, ascending: bool, years: tuple = None, memo: dict = None
+    ) -> pd.Series:
+        '''
+            Mean of a question for each state, optionally over a range of years, sorted by
+            mean. Given a memo dict, each (question, order, years) is only computed once.
+        '''
+        key = (question, ascending, years)
+        if memo is not None and key in memo:
+            return memo[key]
+        states = (self.states_index.get(question) if years is None
+                  else self._year_frame('states', question, years))
+        if states is None:
+            res = pd.Series(dtype='float64')
+        else:
+            res = (states['sum'] / states['count']).sort_values(ascending=ascending, kind='stable')
+        if memo is not None:
+            memo[key] = res
+        return res
+
+
+    def _categories(self, question: str, years: tuple = None) -> pd.DataFrame:
+        '''Sums and counts of a question per (state, category, segment), None if unknown'''
+        if years is None:
+            return self.category_index.get(question)
+        return self._year_frame('category', question, years)
+
+
+    def global_mean(self, question: str, year_from: int = None, year_to: int = None):
         '''
             Receives a question (from the set of questions above) and calculates the average
-            of the recorded values (Data_Value) from the total time interval (2011-2022)
-            from the entire dataset.
+            of the recorded values (Data_Value) from the total time interval (2011-2022),
+            or from year_from to year_to, from the entire dataset.
         '''
         def inner_global_mean():
-            res =  self.data[self.data['Question'] == question]['Data_Value'].mean()
+            res = self._question_mean(question, self._years(year_from, year_to))
             return json.dumps({"global_mean": res})
 
         return inner_global_mean
 
 
-    def states_mean(self, question: str):
+    def states_mean(
+        self, question: str, year_from: int = None, year_to: int = None, memo: dict = None
+    ):
         '''
             Receives a question (from the set of questions above) and calculates the average
-            of the recorded values (Data_Value) from the total time interval (2011-2022)
-            for each state, and sorts them in ascending order by mean.
+            of the recorded values (Data_Value) from the total time interval (2011-2022),
+            or from year_from to year_to, for each state, and sorts them in ascending order
+            by mean. memo is shared by the queries of a batch, see batch.
         '''
         def inner_states_mean():
             ascending = question in self.questions_best_is_min
-            res = (
-                self.data[self.data['Question'] == question]
-                .groupby('LocationDesc')['Data_Value']
-                .mean()
-                .sort_values(ascending=ascending)
-            )
+            res = self._states_mean(question, ascending, self._years(year_from, year_to), memo)
             return json.dumps(res.to_dict())
 
         return inner_states_mean
 
 
-    def state_mean(self, question: str, state: str):
+    def state_mean(self, question: str, state: str, year_from: int = None, year_to: int = None):
         '''
             Receives a question (from the set of questions above) and a state, and calculates
             the average of the recorded values (Data_Value) from the total time interval
-            (2011-2022).
+            (2011-2022), or from year_from to year_to.
         '''
         def inner_state_mean():
-            res = (
-                self.data[
-                    (self.data['Question'] == question) &
-                    (self.data['LocationDesc'] == state)
-                ]['Data_Value']
-                .mean()
-            )
+            res = self._state_mean(question, state, self._years(year_from, year_to))
             return json.dumps({state: res})
 
         return inner_state_mean
 
 
-    def best5(self, question: str):
+    def best5(
+        self, question: str, year_from: int = None, year_to: int = None, memo: dict = None
+    ):
         '''
             Receives a question (from the set of questions above) and calculates the average
-            of the recorded values (Data_Value) from the total time interval (2011-2022)
-            and returns the top 5 states.
+            of the recorded values (Data_Value) from the total time interval (2011-2022),
+            or from year_from to year_to, and returns the top 5 states.
         '''
         def inner_best5():
             ascending = question in self.questions_best_is_min
-            res = (
-                self.data[self.data['Question'] == question]
-                .groupby('LocationDesc')['Data_Value']
-                .mean()
-                .sort_values(ascending=ascending)
-                .head(5)
-            )
+            years = self._years(year_from, year_to)
+            res = self._states_mean(question, ascending, years, memo).head(5)
             return json.dumps(res.to_dict())
 
         return inner_best5
 
 
-    def worst5(self, question: str):
+    def worst5(
+        self, question: str, year_from: int = None, year_to: int = None, memo: dict = None
+    ):
         '''
             Receives a question (from the set of questions above) and calculates the average
-            of the recorded values (Data_Value) from the total time interval (2011-2022)
-            and returns the last 5 states.
+            of the recorded values (Data_Value) from the total time interval (2011-2022),
+            or from year_from to year_to, and returns the last 5 states.
         '''
         def inner_worst5():
             ascending = question in self.questions_best_is_max
-            res = (
-                self.data[self.data['Question'] == question]
-                .groupby('LocationDesc')['Data_Value']
-                .mean()
-                .sort_values(ascending=ascending)
-                .head(5)
-            )
+            years = self._years(year_from, year_to)
+            res = self._states_mean(question, ascending, years, memo).head(5)
             return json.dumps(res.to_dict())
 
         return inner_worst5
 
 
-    def diff_from_mean(self, question: str):
+    def diff_from_mean(
+        self, question: str, year_from: int = None, year_to: int = None, memo: dict = None
+    ):
         '''
             Receives a question (from the set of questions above) and calculates the difference
-            between the global mean and the mean of each state.
+            between the global mean and the mean of each state, optionally from year_from
+            to year_to.
         '''
         def inner_diff_from_mean():
             ascending = question in self.questions_best_is_min
-            global_mean = self.data[self.data['Question'] == question]['Data_Value'].mean()
-            states_mean =  (
-                self.data[self.data['Question'] == question]
-                .groupby('LocationDesc')['Data_Value']
-                .mean()
-                .sort_values(ascending=ascending)
-            )
+            years = self._years(year_from, year_to)
+            global_mean = self._question_mean(question, years)
+            states_mean = self._states_mean(question, ascending, years, memo)
             res = global_mean - states_mean
             return json.dumps(res.to_dict())
 
         return inner_diff_from_mean
 
 
-    def state_diff_from_mean(self, question: str, state: str):
+    def state_diff_from_mean(
+        self, question: str, state: str, year_from: int = None, year_to: int = None
+    ):
         '''
             Receives a question (from the set of questions above) and a state, and calculates
-            the difference between the global mean and the mean of the state.
+            the difference between the global mean and the mean of the state, optionally
+            from year_from to year_to.
         '''
         def inner_state_diff_from_mean():
-            global_mean = self.data[self.data['Question'] == question]['Data_Value'].mean()
-            state_mean = (
-                self.data[
-                    (self.data['Question'] == question) &
-                    (self.data['LocationDesc'] == state)
-                ]['Data_Value']
-                .mean()
-            )
+            years = self._years(year_from, year_to)
+            global_mean = self._question_mean(question, years)
+            state_mean = self._state_mean(question, state, years)
             res = global_mean - state_mean
             return json.dumps({state: res})
 
         return inner_state_diff_from_mean
 
 
-    def state_mean_by_category(self, question: str, state: str):
+    def state_mean_by_category(
+        self, question: str, state: str, year_from: int = None, year_to: int = None
+    ):
         '''
             Receives a question (from the set of questions above) and a state, and calculates
             the average value for each segment (Stratification1)
-            from the categories (StratificationCategory1).
+            from the categories (StratificationCategory1), optionally from year_from to year_to.
         '''
         def inner_state_mean_by_category():
-            res = (
-                self.data[
-                    (self.data['Question'] == question) &
-                    (self.data['LocationDesc'] == state)
-                ].groupby(['StratificationCategory1', 'Stratification1'])
-                ['Data_Value'].mean()
-                .to_dict()
-            )
+            categories = self._categories(question, self._years(year_from, year_to))
+            res = {}
+            if categories is not None:
+                try:
+                    categories = categories.loc[state]
+                    res = (categories['sum'] / categories['count']).to_dict()
+                except KeyError:
+                    pass
             res = {str(k) : v for k, v in res.items()}
             return json.dumps({state: res})
 
         return inner_state_mean_by_category
 
 
-    def mean_by_category(self, question: str):
+    def mean_by_category(self, question: str, year_from: int = None, year_to: int = None):
         '''
             Receives a question (from the set of questions above) and calculates the average value
             for each segment (Stratification1) from the categories (StratificationCategory1)
-            of each state.
+            of each state, optionally from year_from to year_to.
         '''
         def inner_mean_by_category():
-            res = (
-                self.data[(self.data['Question'] == question)]
-                .groupby(['LocationDesc', 'StratificationCategory1', 'Stratification1'])
-                ['Data_Value'].mean()
-                .sort_index(level=0)
-                .to_dict()
-            )
+            categories = self._categories(question, self._years(year_from, year_to))
+            res = {}
+            if categories is not None:
+                res = (categories['sum'] / categories['count']).to_dict()
             return json.dumps({str(tuple([k0, k1, k2])): v for (k0, k1, k2), v in res.items()})
 
         return inner_mean_by_category
+
+
+    def state_trend(self, question: str, state: str, year_from: int = None, year_to: int = None):
+        '''
+            Receives a question (from the set of questions above) and a state, and calculates
+            the average of the recorded values (Data_Value) of the state for each year,
+            optionally from year_from to year_to. Years without values are left out.
+        '''
+        def inner_state_trend():
+            groups, sums, counts = self.year_index.get('states', {}).get(
+                question, (pd.Index([]), None, None)
+            )
+            res = {}
+            if state in groups:
+                row = groups.get_loc(state)
+                start, stop = self._year_range(year_from, year_to)
+                totals = np.diff(sums[row, start:stop + 1])
+                numbers = np.diff(counts[row, start:stop + 1])
+                res = {str(year): float(total / number)
+                       for year, total, number in zip(self.years[start:stop], totals, numbers)
+                       if number}
+            return json.dumps({state: res})
+
+        return inner_state_trend
+
+
+    def batch(self, queries: list):
+        '''
+            Receives a list of (method, args) queries, each naming one of the query methods
+            above, and answers all of them in one pass. Queries sharing a question reuse
+            the same sorted state means. Returns the list of answers, in the same format
+            as the individual methods.
+        '''
+        def inner_batch():
+            memo = {}
+            answers = [
+                getattr(self, method)(*args, memo=memo)() if method in STATES_MEAN_QUERIES
+                else getattr(self, method)(*args)()
+                for method, args in queries
+            ]
+            return '[' + ', '.join(answers) + ']'
+
+        return inner_batch
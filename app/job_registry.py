@@ -0,0 +1,390 @@
+'''
+    This module is responsible for keeping track of the submitted jobs.
+'''
+import bisect
+import itertools
+import json
+import os
+import time
+import uuid
+
+from collections import deque
+from enum import IntEnum
+from threading import Lock
+from app.sqlite_db import SQLiteDatabase
+
+
+class JobState(IntEnum):
+    '''
+        States of a job, reported in lowercase by the API
+    '''
+    RUNNING = 0
+    DONE = 1
+    # dropped before running: on a client request, or once past the job deadline
+    CANCELLED = 2
+    EXPIRED = 3
+    # raised an exception while running, or its result could not be stored
+    FAILED = 4
+
+
+class JobRecord:
+    '''
+        Compact record of a job
+    '''
+    __slots__ = ("state", "endpoint", "submitted", "finished", "version", "deadline")
+
+    def __init__(
+        self, endpoint: str, submitted: float, version: int = None, deadline: float = None
+    ):
+        self.state = JobState.RUNNING
+        self.endpoint = endpoint
+        self.submitted = submitted
+        self.finished = None
+        self.version = version
+        # unix time after which the job is not worth running anymore
+        self.deadline = deadline
+
+    def to_dict(self, job_id: int) -> dict:
+        '''Returns the record as served by /api/jobs'''
+        return {
+            "job_id": job_id,
+            "state": self.state.name.lower(),
+            "endpoint": self.endpoint,
+            "submitted": self.submitted,
+            "finished": self.finished,
+            "version": self.version,
+            "deadline": self.deadline,
+        }
+
+    def matches(self, filters: dict) -> bool:
+        '''Returns whether the job has the state and endpoint and was submitted since'''
+        state = filters.get("state")
+        endpoint = filters.get("endpoint")
+        since = filters.get("since")
+        return ((state is None or self.state == state)
+                and (endpoint is None or self.endpoint == endpoint)
+                and (since is None or self.submitted >= since))
+
+
+class JobRegistry:  # pylint: disable=too-many-instance-attributes
+    '''
+        Registry of jobs by integer id. Finished jobs are evicted once they are older
+        than ttl seconds, or oldest first once the registry holds more than max_jobs.
+        Running jobs are never evicted.
+    '''
+    # jobs only finish in this process, waiters are woken up instead of polling
+    poll_interval = None
+
+    def __init__(self, max_jobs: int, ttl: float, on_evict: callable = None):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.on_evict = on_evict
+
+        self.lock = Lock()
+        self.records = {}
+        self.finished = deque()
+        # ids of the registered jobs in ascending order, for paging from a cursor
+        self.live_ids = []
+        self.ids = itertools.count(1)
+
+    def allocate(self) -> int:
+        '''Returns a new job id'''
+        with self.lock:
+            return next(self.ids)
+
+    def add(
+        self,
+        job_id: int,
+        endpoint: str,
+        version: int = None,
+        deadline: float = None,
+        query: tuple = None,  # pylint: disable=unused-argument
+    ) -> None:
+        '''
+            Registers a running job, computed against the given dataset version,
+            expiring at the deadline unix time if it has not started by then.
+            The (method, args, priority) query of the job is only kept by durable
+            registries, to queue it again after a restart.
+        '''
+        with self.lock:
+            self.records[job_id] = JobRecord(endpoint, time.time(), version, deadline)
+            if not self.live_ids or self.live_ids[-1] < job_id:
+                self.live_ids.append(job_id)
+            else:
+                bisect.insort(self.live_ids, job_id)
+
+    def finish(self, job_id: int, state: JobState = JobState.DONE) -> bool:
+        '''
+            Marks a running job as done, cancelled or expired. Returns False if the job
+            is unknown or already finished, e.g. cancelled while it was running.
+        '''
+        now = time.time()
+        with self.lock:
+            record = self.records.get(job_id)
+            if record is None or record.state != JobState.RUNNING:
+                return False
+            record.state = state
+            record.finished = now
+            self.finished.append(job_id)
+            evicted = self._evict(now)
+        if self.on_evict is not None:
+            for evicted_id in evicted:
+                self.on_evict(evicted_id)
+        return True
+
+    def _evict(self, now: float) -> list:
+        evicted = []
+        while self.finished:
+            record = self.records[self.finished[0]]
+            if len(self.records) <= self.max_jobs and now - record.finished <= self.ttl:
+                break
+            evicted.append(self.finished.popleft())
+            del self.records[evicted[-1]]
+            del self.live_ids[bisect.bisect_left(self.live_ids, evicted[-1])]
+        return evicted
+
+    def record(self, job_id: int) -> JobRecord:
+        '''Returns the record of a job, None if it is unknown or evicted'''
+        return self.records.get(job_id)
+
+    def get(self, job_id: int) -> JobState:
+        '''Returns the state of a job, None if it is unknown or evicted'''
+        record = self.records.get(job_id)
+        return record.state if record is not None else None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def page(self, after: int = 0, limit: int = 100, **filters) -> tuple:
+        '''
+            Returns up to limit jobs with an id greater than after, in id order, and the
+            cursor of the next page (None on the last page). filters may hold a state,
+            an endpoint and a submission time range (since, until).
+        '''
+        until = filters.get("until")
+
+        jobs = []
+        with self.lock:
+            # only the live ids from the cursor on are examined, up to the first match
+            # past the page, so that a cursor is only returned when more jobs match
+            for position in range(bisect.bisect_right(self.live_ids, after), len(self.live_ids)):
+                job_id = self.live_ids[position]
+                record = self.records[job_id]
+                if not record.matches(filters):
+                    continue
+                if until is not None and record.submitted > until:
+                    # jobs are submitted in id order, the next ones are even later
+                    break
+                if len(jobs) == limit:
+                    # the jobs examined since the last one of the page did not match
+                    return jobs, job_id - 1
+                jobs.append(record.to_dict(job_id))
+        return jobs, None
+
+
+class SQLiteJobRegistry:
+    '''
+        Job registry kept in an SQLite database, shared by every server process: job ids
+        are allocated from a single counter, and any process can look up any job.
+        Eviction works as in JobRegistry, checked at most once per second.
+        The jobs outlive the server: those left running by a previous run, whose boot
+        id differs, are handed out by recover() to be queued again.
+    '''
+    # jobs finishing in other processes are noticed by polling their state, unless
+    # serve.py shares multiprocessing Conditions, created before forking its workers:
+    # the one of a job, by job id modulo their number, is notified when it finishes, so
+    # that only the waiters of jobs sharing that Condition wake up
+    poll_interval = 0.02
+    completions = ()
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS job_ids (id INTEGER PRIMARY KEY CHECK (id = 0), last INTEGER);
+        INSERT OR IGNORE INTO job_ids VALUES (0, 0);
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            state INTEGER NOT NULL,
+            endpoint TEXT,
+            submitted REAL NOT NULL,
+            finished REAL,
+            version INTEGER,
+            deadline REAL,
+            query TEXT,
+            boot TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_running ON jobs (state) WHERE state = 0;
+        CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished) WHERE finished IS NOT NULL;
+    '''
+
+    def __init__(self, path: str, max_jobs: int, ttl: float, on_evict: callable = None):
+        self.max_jobs = max_jobs
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+        self.last_eviction = 0.0
+        # identifies this run of the server, shared by its processes through TP_BOOT_ID
+        self.boot = os.environ.get('TP_BOOT_ID') or uuid.uuid4().hex
+
+    def allocate(self) -> int:
+        '''Returns a new job id, unique across processes'''
+        return self.db.execute("UPDATE job_ids SET last = last + 1 RETURNING last").fetchone()[0]
+
+    def add(
+        self,
+        job_id: int,
+        endpoint: str,
+        version: int = None,
+        deadline: float = None,
+        query: tuple = None,
+    ) -> None:
+        '''Registers a running job and its query, see JobRegistry.add'''
+        self.db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, NULL, ?, ?, ?, ?)",
+                        (job_id, int(JobState.RUNNING), endpoint, time.time(), version,
+                         deadline, json.dumps(query) if query is not None else None,
+                         self.boot))
+
+    def recover(self, version: int) -> list:
+        '''
+            Claims the jobs left running by a previous run of the server, for the
+            given dataset version, and returns their (job_id, endpoint, query). Claimed
+            jobs belong to this run, so only one of its processes gets each of them.
+            Jobs without a query cannot be queued again and expire.
+        '''
+        rows = self.db.execute(
+            "UPDATE jobs SET boot = ?, version = ? WHERE state = ? AND boot IS NOT ? "
+            "RETURNING id, endpoint, query",
+            (self.boot, version, int(JobState.RUNNING), self.boot)
+        ).fetchall()
+        lost = [(row[0],) for row in rows if row[2] is None]
+        self.db.transaction("UPDATE jobs SET state = ?, finished = ? WHERE id = ?",
+                            [(int(JobState.EXPIRED), time.time(), job_id) for (job_id,) in lost])
+        return sorted((row[0], row[1], json.loads(row[2])) for row in rows if row[2] is not None)
+
+    def compact(self) -> None:
+        '''Evicts the expired jobs and returns the space they used to the file system'''
+        now = time.time()
+        self.last_eviction = now
+        self._evict(now)
+        self.db.compact()
+
+    def finish(self, job_id: int, state: JobState = JobState.DONE) -> bool:
+        '''Marks a running job as done, cancelled or expired, see JobRegistry.finish'''
+        now = time.time()
+        finished = self.db.execute(
+            "UPDATE jobs SET state = ?, finished = ? WHERE id = ? AND state = ?",
+            (int(state), now, job_id, int(JobState.RUNNING))
+        ).rowcount > 0
+        if finished and self.completions:
+            completion = self._completion(job_id)
+            with completion:
+                completion.notify_all()
+        if now - self.last_eviction >= 1.0:
+            self.last_eviction = now
+            self._evict(now)
+        return finished
+
+    def wait_finished(self, job_id: int, timeout: float) -> bool:
+        '''
+            Blocks until the job is not running anymore or timeout seconds passed, woken
+            up by the process finishing it through its Condition, if shared, else polling.
+            Returns whether the job is finished.
+        '''
+        if self.completions:
+            completion = self._completion(job_id)
+            with completion:
+                return completion.wait_for(
+                    lambda: self.get(job_id) != JobState.RUNNING, timeout)
+
+        deadline = time.monotonic() + timeout
+        while self.get(job_id) == JobState.RUNNING:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+        return True
+
+    def _completion(self, job_id: int):
+        return self.completions[job_id % len(self.completions)]
+
+    def _evict(self, now: float) -> None:
+        evicted = [row[0] for row in self.db.execute(
+            "SELECT id FROM jobs WHERE finished < ?", (now - self.ttl,)
+        )]
+        excess = len(self) - len(evicted) - self.max_jobs
+        if excess > 0:
+            evicted += [row[0] for row in self.db.execute(
+                "SELECT id FROM jobs WHERE finished >= ? ORDER BY finished LIMIT ?",
+                (now - self.ttl, excess)
+            )]
+        self.db.transaction("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in evicted])
+        if self.on_evict is not None:
+            for job_id in evicted:
+                self.on_evict(job_id)
+
+    @staticmethod
+    def _record(row: tuple) -> JobRecord:
+        record = JobRecord(row[1], row[2], row[4], row[5])
+        record.state = JobState(row[0])
+        record.finished = row[3]
+        return record
+
+    def record(self, job_id: int) -> JobRecord:
+        '''Returns the record of a job, None if it is unknown or evicted'''
+        row = self.db.execute(
+            "SELECT state, endpoint, submitted, finished, version, deadline FROM jobs "
+            "WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def get(self, job_id: int) -> JobState:
+        '''Returns the state of a job, None if it is unknown or evicted'''
+        row = self.db.execute("SELECT state FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return JobState(row[0]) if row is not None else None
+
+    def __len__(self) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def page(self, after: int = 0, limit: int = 100, **filters) -> tuple:
+        '''
+            Returns up to limit jobs with an id greater than after, in id order, and the
+            cursor of the next page (None on the last page), see JobRegistry.page
+        '''
+        state = filters.get("state")
+        conditions = ["id > ?"]
+        parameters = [after]
+        for condition, value in [("state = ?", int(state) if state is not None else None),
+                                 ("endpoint = ?", filters.get("endpoint")),
+                                 ("submitted >= ?", filters.get("since")),
+                                 ("submitted <= ?", filters.get("until"))]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+
+        rows = self.db.execute(
+            "SELECT id, state, endpoint, submitted, finished, version, deadline FROM jobs "
+            "WHERE "
+            + " AND ".join(conditions) + " ORDER BY id LIMIT ?",
+            (*parameters, limit + 1)
+        ).fetchall()
+        jobs = [self._record(row[1:]).to_dict(row[0]) for row in rows[:limit]]
+        return jobs, rows[limit - 1][0] if len(rows) > limit else None
+
+    def close(self) -> None:
+        '''Closes the database connections'''
+        self.db.close()
+
+
+def make_job_registry(on_evict: callable = None):
+    '''
+        Creates the job registry selected by the environment: TP_REGISTRY (memory or
+        sqlite, shared by every server process, and always used with TP_DURABLE=1),
+        TP_REGISTRY_DB, TP_MAX_JOBS, TP_JOB_TTL.
+    '''
+    max_jobs = int(os.environ['TP_MAX_JOBS']) if 'TP_MAX_JOBS' in os.environ else 100000
+    ttl = float(os.environ['TP_JOB_TTL']) if 'TP_JOB_TTL' in os.environ else 3600
+    if (os.environ.get('TP_REGISTRY', 'memory') == 'sqlite'
+            or os.environ.get('TP_DURABLE', '0') == '1'):
+        return SQLiteJobRegistry(
+            os.environ.get('TP_REGISTRY_DB', './webserver.db'), max_jobs, ttl, on_evict
+        )
+    return JobRegistry(max_jobs, ttl, on_evict)
@@ -0,0 +1,138 @@
+'''
+    This module is responsible for the logging pipeline of the server: records are put on
+    a queue by the request threads and formatted and written by a background thread.
+'''
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# attributes of every LogRecord, the other ones come from extra= and are logged as fields
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message"}
+
+
+class StructuredFormatter(logging.Formatter):
+    '''
+        Formats a record as one compact JSON object: timestamp, level, message, thread,
+        and the fields given with extra=
+    '''
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for name, value in vars(record).items():
+            if name not in RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, separators=(",", ":"), default=str)
+
+
+class SamplingFilter(logging.Filter):  # pylint: disable=too-few-public-methods
+    '''
+        Keeps a fraction rate of the INFO (and lower) records of each message, evenly
+        spaced: with rate 0.1, the 1st, 11th, 21st... occurrence. Warnings and errors are
+        always kept. Kept records carry the rate, so their counts can be scaled back.
+    '''
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        # message template => occurrences, updated without a lock: a lost update only
+        # shifts which occurrence is kept
+        self.counts = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate >= 1:
+            return True
+        count = self.counts.get(record.msg, 0)
+        self.counts[record.msg] = count + 1
+        if count and int(count * self.rate) == int((count - 1) * self.rate):
+            return False
+        record.sample_rate = self.rate
+        return True
+
+
+class BoundedQueueHandler(QueueHandler):
+    '''
+        Puts records on a bounded queue without formatting them, so the request threads
+        only pay for a queue insertion. Records are dropped, and counted, when the
+        writer falls behind and the queue is full. The arguments of a record are
+        formatted later, by the writer thread, so they must not be mutated after logging.
+    '''
+    def __init__(self, records: queue.Queue):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the traceback is formatted now, the frames it refers to change afterwards
+        if record.exc_info:
+            record = copy.copy(record)
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DrainingQueueListener(QueueListener):
+    '''QueueListener whose stop waits for room in a full queue rather than failing'''
+    def enqueue_sentinel(self) -> None:
+        self.queue.put(self._sentinel)
+
+
+def setup_logging(logger: logging.Logger, path: str = "webserver.log") -> dict:
+    '''
+        Attaches the handlers selected by the environment to logger: LOG_MODE (async
+        writes from a background thread, sync from the logging thread), LOG_FORMAT
+        (json or text), LOG_SAMPLE (fraction of the info records kept), LOG_MAX_BYTES
+        and LOG_BACKUPS (rotation), LOG_QUEUE_SIZE. Returns the pipeline, which is
+        stopped at exit.
+    '''
+    handler = RotatingFileHandler(
+        path,
+        maxBytes=int(os.environ.get('LOG_MAX_BYTES', str(10 * 1024 * 1024))),
+        backupCount=int(os.environ.get('LOG_BACKUPS', '5')),
+    )
+    handler.setLevel(logging.INFO)
+    if os.environ.get('LOG_FORMAT', 'json') == 'json':
+        handler.setFormatter(StructuredFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(message)s',
+                                               datefmt='%Y-%m-%d %H:%M:%S %Z'))
+
+    pipeline = {"handler": handler, "listener": None}
+    if os.environ.get('LOG_MODE', 'async') == 'async':
+        front = BoundedQueueHandler(
+            queue.Queue(int(os.environ.get('LOG_QUEUE_SIZE', '10000')))
+        )
+        listener = DrainingQueueListener(front.queue, handler)
+        listener.start()
+        pipeline.update(handler=front, listener=listener)
+        atexit.register(stop_logging, pipeline)
+
+    sample = float(os.environ.get('LOG_SAMPLE', '1'))
+    if sample < 1:
+        pipeline["handler"].addFilter(SamplingFilter(sample))
+
+    logger.addHandler(pipeline["handler"])
+    return pipeline
+
+
+def stop_logging(pipeline: dict) -> None:
+    '''Writes out the queued records and stops the background thread, if any'''
+    listener, pipeline["listener"] = pipeline["listener"], None
+    if listener is not None:
+        listener.stop()
@@ -0,0 +1,98 @@
+'''
+    This module is responsible for collecting metrics in the Prometheus text format.
+'''
+from bisect import bisect_left
+from threading import Lock
+
+# upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    '''
+        Registry of counters and histograms, keyed by label values. Updating a metric
+        is a dict lookup and an increment under a lock, so it is cheap on the hot path.
+        Gauges are read from their source at scrape time.
+    '''
+    def __init__(self):
+        self.lock = Lock()
+        # name => (type, help, label names)
+        self.definitions = {}
+        # name => {label values => value, or [bucket counts..., sum, count] for histograms}
+        self.values = {}
+
+    def define(self, name: str, kind: str, description: str, labels: tuple) -> None:
+        '''Defines a counter or histogram'''
+        self.definitions[name] = (kind, description, labels)
+        self.values[name] = {}
+
+    def inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        '''Increments a counter'''
+        with self.lock:
+            values = self.values[name]
+            values[labels] = values.get(labels, 0) + value
+
+    def observe(self, name: str, labels: tuple, value: float) -> None:
+        '''Records a value in a histogram'''
+        with self.lock:
+            values = self.values[name]
+            histogram = values.get(labels)
+            if histogram is None:
+                histogram = values[labels] = [0] * (len(LATENCY_BUCKETS) + 3)
+            histogram[bisect_left(LATENCY_BUCKETS, value)] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def render(self, gauges: list) -> str:
+        '''
+            Returns every metric in the Prometheus text format. gauges is a list of
+            (name, description, label names, {label values => value}) read at scrape time.
+        '''
+        lines = []
+        with self.lock:
+            for name, (kind, description, labels) in self.definitions.items():
+                lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+                for values, value in self.values[name].items():
+                    if kind == "counter":
+                        lines.append(f"{name}{_labels(labels, values)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), value):
+                        cumulative += count
+                        bucket = _labels(labels + ("le",), values + (bound,))
+                        lines.append(f"{name}_bucket{bucket} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels, values)} {value[-2]}")
+                    lines.append(f"{name}_count{_labels(labels, values)} {value[-1]}")
+
+        for name, description, labels, values in gauges:
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_labels(labels, key)} {value}" for key, value in values.items()]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    '''Escapes a label value: backslash, double quote and line feed'''
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+METRICS.define("http_requests_total", "counter",
+               "HTTP requests by endpoint and status code", ("endpoint", "code"))
+METRICS.define("http_request_duration_seconds", "histogram",
+               "HTTP request latency by endpoint", ("endpoint",))
+METRICS.define("job_queue_wait_seconds", "histogram",
+               "Time jobs spent queued, by endpoint", ("endpoint",))
+METRICS.define("job_execution_seconds", "histogram",
+               "Time spent executing jobs, by endpoint", ("endpoint",))
+METRICS.define("taskrunner_scaling_total", "counter",
+               "TaskRunner threads added or retired by the autoscaler", ("direction",))
+METRICS.define("jobs_dropped_total", "counter",
+               "Jobs cancelled by their client, expired before running or failed",
+               ("state",))
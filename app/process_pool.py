@@ -0,0 +1,151 @@
+'''
+    This module is responsible for executing jobs on worker processes that share
+    the dataset through shared memory, or through the memory-mapped column store.
+'''
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from threading import Event, Lock
+
+import numpy as np
+import pandas as pd
+
+from app.data_ingestor import DataIngestor, CATEGORY_COLUMNS, VALUE_COLUMN, YEAR_COLUMN
+
+
+# dataset of the current worker process, attached by _attach_dataset
+_worker = {"ingestor": None, "segments": []}
+
+
+def run_query(method: str, args: tuple) -> str:
+    '''
+        Runs DataIngestor.<method>(*args) on the dataset of the worker. Jobs are sent to the
+        workers as partial(run_query, method, args), which pickles in a few bytes.
+    '''
+    return getattr(_worker["ingestor"], method)(*args)()
+
+
+def _attach_dataset(columns: dict, categories: dict) -> None:
+    '''
+        Worker initializer: maps the shared columns and builds the aggregate index over them.
+    '''
+    arrays = {}
+    for column, (name, dtype, length) in columns.items():
+        segment = SharedMemory(name=name)
+        _worker["segments"].append(segment)
+        arrays[column] = np.ndarray((length,), dtype=dtype, buffer=segment.buf)
+
+    data = {column: pd.Categorical.from_codes(arrays[column], categories[column])
+            for column in CATEGORY_COLUMNS}
+    if YEAR_COLUMN in arrays:
+        data[YEAR_COLUMN] = arrays[YEAR_COLUMN]
+    data[VALUE_COLUMN] = arrays[VALUE_COLUMN]
+    data = pd.DataFrame(data, copy=False)
+    _worker["ingestor"] = DataIngestor(data)
+
+
+def _map_column_store(csv_path: str, value_dtype: str) -> None:
+    '''
+        Worker initializer: maps the column store of the CSV and its aggregate index,
+        the same pages as every other process of the host.
+    '''
+    _worker["ingestor"] = DataIngestor(csv_path, value_dtype=value_dtype, column_store=True)
+
+
+class SharedMemoryExecutor:
+    '''
+        Runs run_query jobs on a pool of worker processes. The query columns of the dataset
+        are copied once into shared memory, strings as integer codes, so the workers
+        neither re-read the CSV nor receive the DataFrame with every task. A dataset
+        loaded from the column store is not copied: the workers map the store instead.
+        Every dataset version gets its own pool, kept until retire() is called for it, so
+        jobs queued before a reload still run against the dataset they were submitted for.
+    '''
+    def __init__(self, num_of_workers: int):
+        self.num_of_workers = num_of_workers
+        self.lock = Lock()
+
+        # dataset version => (process pool, shared memory segments)
+        self.pools = {}
+        self.version = None
+        self.ready = Event()
+
+    def start(self, data: pd.DataFrame, version: int = None, store: tuple = None) -> None:
+        '''
+            Publishes a dataset version to shared memory, or the (csv_path, value_dtype)
+            of its column store, and starts its workers
+        '''
+        segments = []
+        if store is not None:
+            initializer, initargs = _map_column_store, store
+        else:
+            columns = {}
+            categories = {}
+            for column in CATEGORY_COLUMNS:
+                if isinstance(data[column].dtype, pd.CategoricalDtype):
+                    codes = data[column].cat.codes.to_numpy()
+                    categories[column] = list(data[column].cat.categories)
+                else:
+                    codes, uniques = pd.factorize(data[column], sort=True)
+                    categories[column] = list(uniques)
+                columns[column] = self._share(codes, segments)
+            columns[VALUE_COLUMN] = self._share(
+                data[VALUE_COLUMN].to_numpy(dtype='float64'), segments
+            )
+            if YEAR_COLUMN in data.columns:
+                columns[YEAR_COLUMN] = self._share(data[YEAR_COLUMN].to_numpy(), segments)
+            initializer, initargs = _attach_dataset, (columns, categories)
+
+        pool = ProcessPoolExecutor(
+            max_workers=self.num_of_workers,
+            initializer=initializer,
+            initargs=initargs,
+        )
+        with self.lock:
+            self.pools[version] = (pool, segments)
+            self.version = version
+        self.ready.set()
+
+    @staticmethod
+    def _share(array: np.ndarray, segments: list) -> tuple:
+        segment = SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=segment.buf)[:] = array
+        segments.append(segment)
+        return segment.name, array.dtype.str, len(array)
+
+    def run(self, task: callable, version: int = None) -> str:
+        '''
+            Executes a job on a worker process of its dataset version, or of the latest one
+            for a job without a version, and returns its result. Raises LookupError if
+            the version was retired, rather than computing the job on other data.
+        '''
+        self.ready.wait()
+        with self.lock:
+            if version is None:
+                pool, _ = self.pools[self.version]
+            elif version in self.pools:
+                pool, _ = self.pools[version]
+            else:
+                raise LookupError(f"Dataset version {version} was retired")
+        return pool.submit(task).result()
+
+    def retire(self, version: int) -> None:
+        '''Stops the workers of an older dataset version and releases its shared memory'''
+        with self.lock:
+            if version == self.version or version not in self.pools:
+                return
+            pool, segments = self.pools.pop(version)
+        self._release(pool, segments)
+
+    def shutdown(self) -> None:
+        '''Stops the workers and releases the shared memory'''
+        with self.lock:
+            pools, self.pools = self.pools, {}
+        for pool, segments in pools.values():
+            self._release(pool, segments)
+
+    @staticmethod
+    def _release(pool: ProcessPoolExecutor, segments: list) -> None:
+        pool.shutdown()
+        for segment in segments:
+            segment.close()
+            segment.unlink()
@@ -0,0 +1,136 @@
+'''
+    This module is responsible for caching the jobs of identical requests.
+'''
+from collections import OrderedDict
+from threading import Event, Lock
+
+
+class ResultCache:
+    '''
+        Bounded LRU cache mapping a request key (endpoint, question, state) to the
+        job that computes its result. A request that hits a running job attaches to it,
+        one that hits a finished job reuses its result, so identical requests are only
+        computed once per dataset version. Requests bound to an older version than the
+        cached one are neither answered from the cache nor cached.
+        The requests attached to each cached job are counted, so that one of them
+        cancelling it only detaches it while others still wait for the job.
+    '''
+    def __init__(self, capacity: int, job_state: callable):
+        self.capacity = capacity
+        # returns "running", "done" or None if the job or its result is gone
+        self.job_state = job_state
+
+        # key => [job_id, number of requests that submitted or attached to the job]
+        self.entries = OrderedDict()
+        # key => Event set once the job of a miss is submitted, outside the lock
+        self.pending = {}
+        self.version = None
+        self.lock = Lock()
+
+        # statistics
+        self.counters = {"hits": 0, "coalesced": 0, "misses": 0, "evictions": 0}
+
+    def get_or_submit(self, key: tuple, version: int, submit: callable) -> tuple:
+        '''
+            Returns (job_id, hit) for key. On a miss, submit() is called to queue a new job
+            and its job_id is cached unless the submission failed (-1). submit() runs
+            outside the lock, identical requests arriving meanwhile wait for it.
+        '''
+        while True:
+            with self.lock:
+                if not self._current(version):
+                    self.counters["misses"] += 1
+                    pending = None
+                    break
+
+                entry = self.entries.get(key)
+                state = self.job_state(entry[0]) if entry is not None else None
+                if state is not None:
+                    self.entries.move_to_end(key)
+                    if state == "done":
+                        self.counters["hits"] += 1
+                    else:
+                        self.counters["coalesced"] += 1
+                        entry[1] += 1
+                    return entry[0], True
+
+                pending = self.pending.get(key)
+                if pending is None:
+                    self.counters["misses"] += 1
+                    pending = self.pending[key] = Event()
+                    break
+            # an identical request is submitting its job, attach to it once it is cached
+            pending.wait()
+
+        if pending is None:
+            return submit(), False
+
+        job_id = -1
+        try:
+            job_id = submit()
+        finally:
+            with self.lock:
+                del self.pending[key]
+                if job_id != -1 and self.capacity > 0 and version == self.version:
+                    self.entries[key] = [job_id, 1]
+                    if len(self.entries) > self.capacity:
+                        self.entries.popitem(last=False)
+                        self.counters["evictions"] += 1
+            pending.set()
+        return job_id, False
+
+    def lookup(self, key: tuple, version: int) -> int:
+        '''Returns the job_id of a done job for key, None if there is none'''
+        with self.lock:
+            if not self._current(version):
+                return None
+
+            entry = self.entries.get(key)
+            if entry is None or self.job_state(entry[0]) != "done":
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def detach(self, job_id: int) -> int:
+        '''
+            Detaches one request from a cached job, returns the number of requests still
+            attached to it. Once none is, the job is dropped from the cache, so that it
+            can be cancelled without identical requests attaching to it again.
+        '''
+        with self.lock:
+            for key, entry in self.entries.items():
+                if entry[0] == job_id:
+                    if entry[1] > 1:
+                        entry[1] -= 1
+                        return entry[1]
+                    del self.entries[key]
+                    break
+            return 0
+
+    def invalidate(self, version: int = None) -> None:
+        '''Drops every cached job, e.g. when the dataset changes'''
+        with self.lock:
+            self._invalidate(version)
+
+    def _current(self, version: int) -> bool:
+        '''Drops the cache for a newer dataset version, returns whether version is cached'''
+        if self.version is None or version > self.version:
+            self._invalidate(version)
+        return version == self.version
+
+    def _invalidate(self, version: int) -> None:
+        self.entries.clear()
+        self.version = version
+
+    def get_stats(self) -> dict:
+        '''Returns the cache size and hit/miss counters'''
+        with self.lock:
+            reused = self.counters["hits"] + self.counters["coalesced"]
+            lookups = reused + self.counters["misses"]
+            return {
+                "size": len(self.entries),
+                "capacity": self.capacity,
+                **self.counters,
+                "hit_ratio": reused / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,68 @@
+'''
+    This module is responsible for the compressed and binary encodings of the results,
+    computed once when a job completes and stored next to its result.
+'''
+import gzip
+import json
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+# content codings that can be precomputed => compression function, in order of preference
+CODINGS = {}
+if zstandard is not None:
+    CODINGS['zstd'] = lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+if brotli is not None:
+    CODINGS['br'] = lambda data: brotli.compress(data, quality=5)
+CODINGS['gzip'] = lambda data: gzip.compress(data, compresslevel=6)
+
+# media type of each result format
+MEDIA_TYPES = {'json': 'application/json', 'msgpack': 'application/msgpack'}
+
+
+def variant_key(job_id: int, variant: str) -> str:
+    '''Returns the result store key of an encoding of the result of a job'''
+    return f"{job_id}.{variant}"
+
+
+def json_body(data: bytes, version: int) -> bytes:
+    '''Returns the get_results body of a done job, wrapping its serialized result'''
+    return b'{"status": "done", "version": ' + str(version).encode() + b', "data": ' + data + b'}'
+
+
+def msgpack_body(data: bytes, version: int) -> bytes:
+    '''Returns the get_results body of a done job encoded as MessagePack'''
+    return msgpack.packb({"status": "done", "version": version, "data": json.loads(data)})
+
+
+def encode_variants(data: bytes, version: int, encodings: list, min_size: int) -> dict:
+    '''
+        Returns the get_results bodies of a result in the given encodings, keyed by variant:
+        "msgpack" and "<format>.<coding>" for each format (json, and msgpack if listed)
+        and each listed content coding. Bodies smaller than min_size are not compressed.
+    '''
+    bodies = {'json': json_body(data, version)}
+    if 'msgpack' in encodings and msgpack is not None:
+        bodies['msgpack'] = msgpack_body(data, version)
+
+    variants = {name: body for name, body in bodies.items() if name != 'json'}
+    for result_format, body in bodies.items():
+        if len(body) < min_size:
+            continue
+        for coding in encodings:
+            if coding in CODINGS:
+                variants[f"{result_format}.{coding}"] = CODINGS[coding](body)
+    return variants
@@ -0,0 +1,334 @@
+'''
+    This module is responsible for storing the serialized results of the jobs.
+'''
+import os
+import time
+
+from collections import OrderedDict
+from threading import Lock
+from app.sqlite_db import SQLiteDatabase
+
+
+class FileResultStore:
+    '''
+        Stores every result in its own file, ./results/job_{id} by default.
+    '''
+    def __init__(self, directory: str = "./results"):
+        self.directory = directory
+
+        # create the result directory if it doesn't exist
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+    def _path(self, job_id: int) -> str:
+        return os.path.join(self.directory, f"job_{job_id}")
+
+    def put(self, job_id: int, data: bytes) -> None:
+        '''Saves the result of a job'''
+        with open(self._path(job_id), "wb") as f:
+            f.write(data)
+
+    def get(self, job_id: int) -> bytes:
+        '''Returns the result of a job, None if it is not stored'''
+        try:
+            with open(self._path(job_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def contains(self, job_id: int) -> bool:
+        '''Checks if the result of a job is stored'''
+        return os.path.exists(self._path(job_id))
+
+    def get_chunks(self, job_id: int, chunk_size: int) -> tuple:
+        '''
+            Returns the size of the result of a job and an iterator over its bytes, read
+            chunk_size at a time, None if it is not stored
+        '''
+        try:
+            # closed by the iterator once it is exhausted or garbage collected
+            f = open(self._path(job_id), "rb")  # pylint: disable=consider-using-with
+        except FileNotFoundError:
+            return None
+
+        def chunks():
+            with f:
+                while chunk := f.read(chunk_size):
+                    yield chunk
+
+        return os.fstat(f.fileno()).st_size, chunks()
+
+    def remove(self, job_id: int) -> None:
+        '''Removes the result of a job'''
+        try:
+            os.remove(self._path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def get_stats(self) -> dict:
+        '''Returns the number of stored results'''
+        return {"backend": "file", "results": len(os.listdir(self.directory))}
+
+    def put_many(self, results: dict) -> None:
+        '''Saves several results, by job_id'''
+        for job_id, data in results.items():
+            self.put(job_id, data)
+
+    def close(self) -> None:
+        '''Removes the stored results, and the results directory unless it holds other files'''
+        for name in os.listdir(self.directory):
+            if name.startswith("job_"):
+                os.remove(os.path.join(self.directory, name))
+        try:
+            os.rmdir(self.directory)
+        except OSError:
+            pass
+
+
+class MemoryResultStore:
+    '''
+        Keeps the already serialized results in memory, in insertion order.
+        Results older than ttl seconds are evicted, and the oldest ones are evicted
+        once the stored bytes exceed max_bytes. If a spill store is given, results
+        larger than spill_threshold and results evicted for size are moved to it
+        instead of being held in (or dropped from) memory.
+        Results saved together by put_many are evicted together.
+    '''
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl: float,
+        spill: FileResultStore = None,
+        spill_threshold: int = 0,
+    ):
+        self.limits = {"bytes": max_bytes, "ttl": ttl, "spill": spill_threshold}
+        self.spill = spill
+
+        # job_id => (timestamp, data), data is None for spilled results
+        self.entries = OrderedDict()
+        # job_id => size of the results held in memory, oldest first, evicted for size
+        self.resident = OrderedDict()
+        # job_id => keys saved with it by put_many, removed along with it
+        self.groups = {}
+        self.stats = {"bytes": 0, "spilled": 0, "evicted": 0}
+        self.lock = Lock()
+
+    def put(self, job_id: int, data: bytes) -> None:
+        '''Saves the result of a job'''
+        self.put_many({job_id: data})
+
+    def put_many(self, results: dict) -> None:
+        '''
+            Saves several results, by job_id. The first one owns the others, e.g. the
+            encodings of a result, which are evicted and removed together with it.
+        '''
+        now = time.monotonic()
+        keys = list(results)
+        with self.lock:
+            self._evict_expired(now)
+            for job_id, data in results.items():
+                self._store(job_id, data, now)
+            if len(keys) > 1:
+                self.groups[keys[0]] = keys[1:]
+            self._evict_oversize()
+
+    def _store(self, job_id: int, data: bytes, now: float) -> None:
+        if self.spill is not None and 0 < self.limits["spill"] < len(data):
+            self.spill.put(job_id, data)
+            self.entries[job_id] = (now, None)
+            self.stats["spilled"] += 1
+            return
+
+        self.entries[job_id] = (now, data)
+        self.resident[job_id] = len(data)
+        self.stats["bytes"] += len(data)
+
+    def get(self, job_id: int) -> bytes:
+        '''Returns the result of a job, None if it is not stored or expired'''
+        entry = self._entry(job_id)
+        if entry is None:
+            return None
+        if entry[1] is None:
+            return self.spill.get(job_id)
+        return entry[1]
+
+    def contains(self, job_id: int) -> bool:
+        '''Checks if the result of a job is stored and not expired'''
+        with self.lock:
+            entry = self.entries.get(job_id)
+        return entry is not None and time.monotonic() - entry[0] <= self.limits["ttl"]
+
+    def get_chunks(self, job_id: int, chunk_size: int) -> tuple:
+        '''
+            Returns the size of the result of a job and an iterator over its bytes,
+            chunk_size at a time, None if it is not stored or expired
+        '''
+        entry = self._entry(job_id)
+        if entry is None:
+            return None
+        if entry[1] is None:
+            return self.spill.get_chunks(job_id, chunk_size)
+
+        data = entry[1]
+        return len(data), (data[i:i + chunk_size] for i in range(0, len(data), chunk_size))
+
+    def remove(self, job_id: int) -> None:
+        '''Removes the result of a job'''
+        with self.lock:
+            self._remove(job_id)
+
+    def _entry(self, job_id: int) -> tuple:
+        '''Returns the (timestamp, data) entry of a result, None if missing or expired'''
+        with self.lock:
+            entry = self.entries.get(job_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.limits["ttl"]:
+                self._remove(job_id)
+                self.stats["evicted"] += 1
+                return None
+        return entry
+
+    def _remove(self, job_id: int) -> None:
+        timestamp, data = self.entries.pop(job_id, (None, b""))
+        if timestamp is None:
+            return
+        for key in self.groups.pop(job_id, []):
+            self._remove(key)
+        if data is None:
+            self.spill.remove(job_id)
+        else:
+            del self.resident[job_id]
+            self.stats["bytes"] -= len(data)
+
+    def _evict_expired(self, now: float) -> None:
+        while self.entries:
+            job_id, (timestamp, _) = next(iter(self.entries.items()))
+            if now - timestamp <= self.limits["ttl"]:
+                break
+            self._remove(job_id)
+            self.stats["evicted"] += 1
+
+    def _evict_oversize(self) -> None:
+        while self.stats["bytes"] > self.limits["bytes"] and self.resident:
+            job_id = next(iter(self.resident))
+            if self.spill is not None:
+                timestamp, data = self.entries[job_id]
+                self.spill.put(job_id, data)
+                self.entries[job_id] = (timestamp, None)
+                self.stats["bytes"] -= self.resident.pop(job_id)
+                self.stats["spilled"] += 1
+            else:
+                self._remove(job_id)
+                self.stats["evicted"] += 1
+
+    def get_stats(self) -> dict:
+        '''Returns the number and size of the stored results'''
+        with self.lock:
+            return {"backend": "memory", "results": len(self.entries), **self.stats}
+
+    def close(self) -> None:
+        '''Drops every stored result'''
+        with self.lock:
+            for job_id in list(self.entries):
+                self._remove(job_id)
+        if self.spill is not None:
+            self.spill.close()
+
+
+class SQLiteResultStore:
+    '''
+        Stores the results in an SQLite database shared by every server process, so
+        any of them can serve the result of a job run by another.
+    '''
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, data BLOB NOT NULL);
+    '''
+
+    def __init__(self, path: str):
+        self.db = SQLiteDatabase(path, self.SCHEMA)
+
+    def put(self, job_id: int, data: bytes) -> None:
+        '''Saves the result of a job'''
+        self.db.execute("INSERT OR REPLACE INTO results VALUES (?, ?)", (str(job_id), data))
+
+    def put_many(self, results: dict) -> None:
+        '''Saves several results, by job_id, in a single transaction'''
+        self.db.transaction("INSERT OR REPLACE INTO results VALUES (?, ?)",
+                            [(str(job_id), data) for job_id, data in results.items()])
+
+    def get(self, job_id: int) -> bytes:
+        '''Returns the result of a job, None if it is not stored'''
+        row = self.db.execute("SELECT data FROM results WHERE key = ?", (str(job_id),)).fetchone()
+        return row[0] if row is not None else None
+
+    def contains(self, job_id: int) -> bool:
+        '''Checks if the result of a job is stored'''
+        return self.db.execute(
+            "SELECT 1 FROM results WHERE key = ?", (str(job_id),)
+        ).fetchone() is not None
+
+    def get_chunks(self, job_id: int, chunk_size: int) -> tuple:
+        '''
+            Returns the size of the result of a job and an iterator over its bytes, read
+            chunk_size at a time from the database, None if it is not stored
+        '''
+        connection = self.db.connection()
+        row = connection.execute(
+            "SELECT rowid, length(data) FROM results WHERE key = ?", (str(job_id),)
+        ).fetchone()
+        if row is None:
+            return None
+
+        def chunks():
+            with connection.blobopen("results", "data", row[0], readonly=True) as blob:
+                while chunk := blob.read(chunk_size):
+                    yield chunk
+
+        return row[1], chunks()
+
+    def remove(self, job_id: int) -> None:
+        '''Removes the result of a job'''
+        self.db.execute("DELETE FROM results WHERE key = ?", (str(job_id),))
+
+    def get_stats(self) -> dict:
+        '''Returns the number and size of the stored results'''
+        results, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length(data)), 0) FROM results"
+        ).fetchone()
+        return {"backend": "sqlite", "results": results, "bytes": size}
+
+    def compact(self) -> None:
+        '''Returns the space of the removed results to the file system'''
+        self.db.compact()
+
+    def close(self) -> None:
+        '''
+            Closes the database connections, the results stay for the other processes
+            and, with TP_DURABLE=1, for the next run of the server
+        '''
+        self.db.close()
+
+
+def make_result_store():
+    '''
+        Creates the result store selected by the environment: RS_BACKEND (memory, file,
+        or sqlite shared by every server process, the default with TP_DURABLE=1),
+        RS_MAX_BYTES, RS_TTL, RS_SPILL_THRESHOLD, RS_DIR, RS_DB.
+    '''
+    directory = os.environ.get('RS_DIR', './results')
+    backend = os.environ.get(
+        'RS_BACKEND', 'sqlite' if os.environ.get('TP_DURABLE', '0') == '1' else 'memory'
+    )
+    if backend == 'file':
+        return FileResultStore(directory)
+    if backend == 'sqlite':
+        return SQLiteResultStore(os.environ.get('RS_DB', './webserver.db'))
+
+    spill_threshold = int(os.environ.get('RS_SPILL_THRESHOLD', '0'))
+    return MemoryResultStore(
+        max_bytes=int(os.environ.get('RS_MAX_BYTES', str(256 * 1024 * 1024))),
+        ttl=float(os.environ.get('RS_TTL', '3600')),
+        spill=FileResultStore(directory) if spill_threshold > 0 else None,
+        spill_threshold=spill_threshold,
+    )
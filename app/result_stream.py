@@ -0,0 +1,156 @@
+'''
+    This module is responsible for streaming stored results in chunks, as JSON or NDJSON,
+    optionally one page of states at a time, without parsing the whole result.
+'''
+import ast
+import json
+import re
+
+# bytes read from the result store, and sent, at a time
+STREAM_CHUNK = 64 * 1024
+
+# one top-level "key": value entry of a JSON object, as written by json.dumps: the value is
+# a number (or NaN/Infinity) or a flat object, and is followed by ", " or the closing brace
+ENTRY = re.compile(
+    rb'\s*"((?:[^"\\]|\\.)*)"\s*:\s*'
+    rb'(\{(?:[^"{}]|"(?:[^"\\]|\\.)*")*\}|[^,{}\s]+)'
+    rb'\s*([,}])'
+)
+
+
+def is_object(chunk: bytes) -> bool:
+    '''Checks if a serialized result starting with chunk is a JSON object'''
+    return chunk.lstrip()[:1] == b'{'
+
+
+def iter_entries(chunks) -> iter:
+    '''
+        Yields the (key, value) entries of a serialized JSON object, read from an iterator
+        of byte chunks. Both are the raw JSON bytes, the key without its quotes. Only the
+        unconsumed part of the current chunk and the entry spanning it are buffered.
+        Raises ValueError if the object ends early or has an entry ENTRY cannot match,
+        rather than silently dropping the rest.
+    '''
+    buffer = b''
+    position = None
+    for chunk in chunks:
+        buffer += chunk
+        if position is None:
+            # skip the opening brace, an empty object has no entries
+            stripped = buffer.lstrip()
+            if len(stripped) < 2:
+                continue
+            if stripped[1:].lstrip()[:1] == b'}':
+                return
+            position = len(buffer) - len(stripped) + 1
+
+        while True:
+            match = ENTRY.match(buffer, position)
+            if match is None:
+                break
+            yield match.group(1), match.group(2)
+            if match.group(3) == b'}':
+                return
+            position = match.end()
+        buffer = buffer[position:]
+        position = 0
+    raise ValueError(f"Unterminated or unsupported JSON object entry: {buffer[:80]!r}")
+
+
+def entry_state(key: bytes, prefix: bytes = None, state=None) -> tuple:
+    '''
+        Returns the (prefix, state) of an entry: its state is the key itself, or the first
+        element of a (state, category, stratification) key, whose keys all start with prefix.
+        Keys of the same state are contiguous, so given the prefix and state of the previous
+        entry they are not parsed again.
+    '''
+    if prefix is not None and key.startswith(prefix):
+        return prefix, state
+    text = json.loads(b'"' + key + b'"')
+    if text.startswith('('):
+        try:
+            state = ast.literal_eval(text)[0]
+            return json.dumps(f"({state!r}, ")[1:-1].encode(), state
+        except (ValueError, SyntaxError, IndexError):
+            pass
+    return None, text
+
+
+def paginate(entries, offset: int, limit: int, cursor: dict) -> iter:
+    '''
+        Yields the entries of the states number offset to offset + limit - 1, in the
+        order of the result. cursor["next"] is then set to the offset of the next page,
+        None if this is the last one.
+    '''
+    index = -1
+    prefix = state = None
+    cursor["next"] = None
+    for key, value in entries:
+        prefix, current = entry_state(key, prefix, state)
+        # the first entry starts the first state
+        if index < 0 or current != state:
+            index += 1
+        state = current
+        if index < offset:
+            continue
+        if limit is not None and index >= offset + limit:
+            cursor["next"] = index
+            return
+        yield key, value
+
+
+def buffered(pieces, size: int = STREAM_CHUNK) -> iter:
+    '''Joins small byte pieces into chunks of about size bytes'''
+    chunk = []
+    length = 0
+    for piece in pieces:
+        chunk.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk = []
+            length = 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def stream_json(header: bytes, chunks, page: tuple = None) -> iter:
+    '''
+        Yields {<header>, "data": <result>} where the result comes from its chunks, and
+        with page=(offset, limit) only the entries of those states followed by "next"
+    '''
+    if page is None:
+        yield header + b', "data": '
+        yield from chunks
+        yield b'}'
+        return
+
+    def pieces():
+        cursor = {}
+        yield header + b', "data": {'
+        separator = b''
+        for key, value in paginate(iter_entries(chunks), *page, cursor):
+            yield separator + b'"' + key + b'": ' + value
+            separator = b', '
+        yield b'}, "next": ' + json.dumps(cursor["next"]).encode() + b'}'
+
+    yield from buffered(pieces())
+
+
+def stream_ndjson(header: bytes, chunks, page: tuple = None) -> iter:
+    '''
+        Yields the header line then one {"key": ..., "value": ...} line per entry of the
+        result, and with page=(offset, limit) only those states and a final {"next": ...}
+    '''
+    def pieces():
+        yield header + b'}\n'
+        cursor = {}
+        entries = iter_entries(chunks)
+        if page is not None:
+            entries = paginate(entries, *page, cursor)
+        for key, value in entries:
+            yield b'{"key": "' + key + b'", "value": ' + value + b'}\n'
+        if page is not None:
+            yield b'{"next": ' + json.dumps(cursor["next"]).encode() + b'}\n'
+
+    yield from buffered(pieces())
@@ -1,49 +1,309 @@
 '''
     This file contains the definition of the endpoints for the webserver.
 '''
-import json
-
+import hmac
+import itertools
+import math
+import os
+import signal
+import time
+
+from threading import Thread
 from flask import request, jsonify
 from app import webserver
+from app.admission import AdmissionError
+from app.data_ingestor import DataIngestor, QUERIES, QUERY_COST
+from app.job_registry import JobState
+from app.metrics import METRICS
+from app.result_encoding import CODINGS, MEDIA_TYPES, json_body, msgpack, msgpack_body
+from app.result_stream import STREAM_CHUNK, is_object, stream_json, stream_ndjson
+
+# maximum number of seconds a /api/get_results request can wait for its job
+MAX_WAIT = 30.0
+
+# priorities of the requests are clamped to [-MAX_PRIORITY, MAX_PRIORITY]
+MAX_PRIORITY = 10
+
+# longer deadlines of a request, in seconds, are cut to this one
+MAX_DEADLINE = 3600.0
 
 
 def verify_request_decorator(allowed_method):
     '''
-        Decorator that verifies the request method
+        Decorator that verifies the request method and records the request metrics
     '''
     def decorator(func):
         def wrapper(*args, **kwargs):
+            start = time.monotonic()
             if request.method == allowed_method:
-                return func(*args, **kwargs)
-            webserver.logger.error("Method not allowed for %s", request.url)
-            return jsonify({"error": "Method not allowed"}), 405
+                response = func(*args, **kwargs)
+            else:
+                webserver.logger.error("Method not allowed for %s", request.url)
+                response = jsonify({"error": "Method not allowed"}), 405
+
+            # count the request and its latency
+            code = response[1] if isinstance(response, tuple) else response.status_code
+            METRICS.inc("http_requests_total", (request.endpoint, code))
+            METRICS.observe("http_request_duration_seconds", (request.endpoint,),
+                            time.monotonic() - start)
+            return response
         return wrapper
     return decorator
 
 
+def admin_request_decorator(func):
+    '''
+        Decorator that only lets through requests with the ADMIN_TOKEN bearer token,
+        every request is refused if ADMIN_TOKEN is not set
+    '''
+    def wrapper(*args, **kwargs):
+        token = os.environ.get('ADMIN_TOKEN', '')
+        given = request.headers.get('Authorization', '')
+        if not token or not hmac.compare_digest(given.encode(), f"Bearer {token}".encode()):
+            webserver.logger.error("Unauthorized admin request for %s", request.url)
+            return jsonify({"status": "error", "reason": "Unauthorized"}), 403
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def data_file(path: str) -> str:
+    '''
+        Returns the real path of a CSV given to an admin endpoint, relative paths being
+        relative to the data directory. Raises ValueError unless it is a file inside it.
+    '''
+    real = os.path.realpath(os.path.join(webserver.data_dir, str(path)))
+    if (os.path.commonpath([real, webserver.data_dir]) != webserver.data_dir
+            or not os.path.isfile(real)):
+        raise ValueError(f"{path} is not a file of the data directory")
+    return real
+
+
+def json_response(body: bytes):
+    '''
+        Returns an already serialized JSON body as a response
+    '''
+    return webserver.response_class(body, mimetype='application/json')
+
+
+def text_field(data: dict, name: str) -> str:
+    '''
+        Returns the string field name of a query, raises TypeError if it is not a string,
+        e.g. a list, which could not be part of a result cache key
+    '''
+    value = data[name]
+    if not isinstance(value, str):
+        raise TypeError(f"{name} must be a string")
+    return value
+
+
+def year_range(data: dict, data_ingestor: DataIngestor) -> tuple:
+    '''
+        Returns the (year_from, year_to) arguments of a query, both optional, or an empty
+        tuple for the whole dataset. Raises ValueError if the dataset has no years, or
+        unless both are integer years of the dataset, in order.
+    '''
+    if data.get('year_from') is None and data.get('year_to') is None:
+        return ()
+    if not data_ingestor.years.size:
+        raise ValueError("the dataset has no YearStart column")
+
+    first, last = int(data_ingestor.years[0]), int(data_ingestor.years[-1])
+    years = []
+    for name in ('year_from', 'year_to'):
+        value = data.get(name)
+        if value is None:
+            years.append(None)
+            continue
+        # rejects fractions, infinities and NaN before int() rounds them or overflows
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{name} must be an integer year")
+        year = int(value)
+        if not first <= year <= last:
+            raise ValueError(f"{name} must be a year between {first} and {last}")
+        years.append(year)
+    if None not in years and years[0] > years[1]:
+        raise ValueError("year_from must not be after year_to")
+    return tuple(years)
+
+
+def job_priority(data: dict) -> int:
+    '''
+        Returns the optional integer priority of a request, 0 by default, clamped to
+        [-MAX_PRIORITY, MAX_PRIORITY] so that no client can jump ahead of every other one
+    '''
+    priority = int(data.get('priority') or 0)
+    return min(max(priority, -MAX_PRIORITY), MAX_PRIORITY)
+
+
+def job_deadline(data: dict) -> float:
+    '''
+        Returns the unix time after which a job is dropped instead of run, from the
+        optional deadline of a request, in seconds, None if it has none. Raises ValueError
+        unless the deadline is finite and positive, and caps it to MAX_DEADLINE.
+    '''
+    if data.get('deadline') is None:
+        return None
+    deadline = float(data['deadline'])
+    if not math.isfinite(deadline) or deadline <= 0:
+        raise ValueError(f"deadline must be a positive number of seconds: {data['deadline']}")
+    return time.time() + min(deadline, MAX_DEADLINE)
+
+
 def post_wrapper(func: callable, state: bool=False):
     '''
         Wrapper function that receives a function and a boolean state
         indicating if the function requires a state parameter.
+        The optional year_from and year_to restrict the query to those years, and a
+        job still queued after the optional deadline (in seconds) expires.
         It returns a jsonified response with the job_id.
+        With ?sync=1, cached and light queries are answered inline instead.
     '''
     data = request.json
-    webserver.logger.info("Received request: %s", data)
+    webserver.logger.info("Received %s request", request.endpoint, extra={"payload": data})
 
+    # the dataset func is bound to, its version does not change even if a reload swaps it
+    version = func.__self__.version
     try:
-        job = func(data['question'], data['state']) if state else func(data['question'])
-    except KeyError as e:
+        question = text_field(data, 'question')
+        args = (question, text_field(data, 'state')) if state else (question,)
+        years = year_range(data, func.__self__)
+        args += years
+        job = webserver.tasks_runner.make_task(func, *args)
+        key = (request.endpoint, question, args[1] if state else None, years)
+        priority = job_priority(data)
+        deadline = job_deadline(data)
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
         webserver.logger.error("Invalid format of %s", data)
-        return jsonify({"status": "error", "reason": f"Invalid format of {data} => {e}"})
+        return jsonify({"status": "error", "reason": f"Invalid format of {data} => {e}"}), 400
+
+    sync = request.args.get('sync', '0') in ('1', 'true')
+    if sync:
+        res = sync_result(key, func, args, version)
+        if res is not None:
+            return res
+
+    return submit_job(key, job, version, (priority, deadline), report_path=sync)
 
-    # try to add the task to be executed
-    if webserver.tasks_runner.add_task(job, webserver.job_counter) == -1:
+
+def done_response(res: bytes, version: int, path: str = None):
+    '''
+        Returns the response of a done job, wrapping its already serialized result
+        without parsing it again
+    '''
+    body = json_body(res, version)
+    if path is None:
+        return json_response(body)
+    # the path goes right after the status of the body, which is not repeated
+    status = b'{"status": "done", '
+    return json_response(status + b'"path": "' + path.encode() + b'", ' + body[len(status):])
+
+
+def encoded_response(job_id: int, result_format: str):
+    '''
+        Returns the result of a job in result_format, from its variant precomputed with the
+        best content coding accepted by the client, None if no such variant is stored
+    '''
+    tasks_runner = webserver.tasks_runner
+    coding = request.accept_encodings.best_match(
+        [coding for coding in CODINGS if coding in tasks_runner.encodings]
+    )
+    variants = [f"{result_format}.{coding}"] if coding is not None else []
+    if result_format != 'json':
+        variants.append(result_format)
+
+    for variant in variants:
+        stored = tasks_runner.get_result_chunks(job_id, STREAM_CHUNK, variant)
+        if stored is None:
+            continue
+        size, chunks = stored
+        response = webserver.response_class(
+            chunks if size > STREAM_CHUNK else b''.join(chunks),
+            mimetype=MEDIA_TYPES[result_format],
+        )
+        response.content_length = size
+        if variant != result_format:
+            response.headers['Content-Encoding'] = coding
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+    return None
+
+
+def sync_result(key: tuple, func: callable, args: tuple, version: int):
+    '''
+        Answers a query inline, from the result of a done identical job or by computing
+        it when it is light. Returns None if the query has to be queued.
+    '''
+    job_id = None
+    if not request.cache_control.no_cache:
+        job_id = webserver.result_cache.lookup(key, version)
+    res = webserver.tasks_runner.get_result(job_id) if job_id is not None else None
+    if res is not None:
+        webserver.logger.info("Request answered from job %s", job_id)
+        return done_response(res, version, "cache")
+
+    if QUERY_COST[key[0]] == 'light':
+        webserver.logger.info("Request answered inline")
+        return done_response(func(*args)().encode("utf-8"), version, "inline")
+
+    return None
+
+
+def client_id() -> str:
+    '''
+        Returns the client of a request, as counted by the admission limits: its address,
+        or its X-Client-Id header if it comes from one of the WS_TRUSTED_PROXIES addresses,
+        so that a client cannot pick a new identity for each request
+    '''
+    proxies = {address.strip() for address in os.environ.get('WS_TRUSTED_PROXIES', '').split(',')}
+    if request.remote_addr in proxies and request.headers.get('X-Client-Id'):
+        return request.headers['X-Client-Id']
+    return request.remote_addr
+
+
+def submit_job(
+    key: tuple, job: callable, version: int, schedule: tuple = (0, None), report_path: bool = False
+):
+    '''
+        Queues job, computed against the given dataset version, in the cost class of its
+        endpoint with the (priority, deadline unix time) of schedule, unless an identical
+        request (same key) already has a job, and returns a jsonified response with
+        the job_id.
+        If report_path is set, the response says whether the job was queued or reused.
+    '''
+    client = client_id()
+    priority, deadline = schedule
+
+    def submit():
+        # try to add the task to be executed, under an id unique across server processes
+        job_id = webserver.tasks_runner.jobs.allocate()
+        return webserver.tasks_runner.add_task(
+            job, job_id, key[0], priority, client, version, deadline
+        )
+
+    # identical requests share the job that computes (or computed) their result, unless
+    # the client asks for a new job with Cache-Control: no-cache
+    try:
+        if request.cache_control.no_cache:
+            job_id, cached = submit(), False
+        else:
+            job_id, cached = webserver.result_cache.get_or_submit(key, version, submit)
+    except AdmissionError as e:
+        webserver.logger.error("Job rejected for %s: %s", client, e.reason)
+        response = jsonify({"status": "error", "reason": e.reason, "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 429
+    if job_id == -1:
         webserver.logger.error("Thread pool is shutting down or already shut down.")
         return jsonify({"status": "error", "reason": "Thread pool was shut down."})
 
-    webserver.job_counter += 1
-    webserver.logger.info("Job %s added to the queue", {webserver.job_counter - 1})
-    return jsonify({"status": "success", "job_id": webserver.job_counter - 1})
+    if cached:
+        webserver.logger.info("Request attached to job %s", job_id)
+    else:
+        webserver.logger.info("Job %s added to the queue", job_id)
+    if report_path:
+        return jsonify({"status": "success", "path": "attached" if cached else "queued",
+                        "job_id": job_id})
+    return jsonify({"status": "success", "job_id": job_id})
 
 
 @webserver.route('/api/post_endpoint', methods=['POST'])
@@ -66,27 +326,117 @@ def post_endpoint():
     return jsonify({"error": "Method not allowed"}), 405
 
 
-@webserver.route('/api/get_results/<job_id>', methods=['GET'])
+@webserver.route('/api/get_results/<job_id>', methods=['GET'], endpoint='get_results')
 @verify_request_decorator('GET')
 def get_response(job_id):
     '''
-        Returns the result of a job given a job_id
+        Returns the result of a job given a job_id, optionally waiting for it
+        to finish for up to ?wait=<seconds>. Large results are streamed from the result
+        store, as JSON or as NDJSON with ?format=ndjson, and ?offset=<n>&limit=<n>
+        return only the entries of limit states, starting with the offset-th one.
+        Whole results are sent in the best precompressed content coding accepted by the
+        client, as JSON or as MessagePack with ?format=msgpack.
     '''
     webserver.logger.info("Getting response for job_id: %s", job_id)
 
+    job_id = int(job_id) if job_id.isdigit() else -1
     if not webserver.tasks_runner.is_valid(job_id):
         webserver.logger.error("Invalid job_id: %s", job_id)
         return jsonify({'status': 'error', 'reason': 'Invalid job_id'})
 
-    if not webserver.tasks_runner.is_done(job_id):
+    try:
+        result_format, page = result_request()
+    except ValueError as e:
+        webserver.logger.error("Invalid result format: %s", e)
+        return jsonify({'status': 'error', 'reason': 'Invalid format'})
+
+    # long-poll: with ?wait=<seconds>, block until the job is done instead of returning
+    wait = min(request.args.get('wait', 0.0, type=float), MAX_WAIT)
+    if wait > 0 and not webserver.tasks_runner.is_finished(job_id):
+        webserver.tasks_runner.wait(job_id, wait)
+
+    state = webserver.tasks_runner.jobs.get(job_id)
+    if state in (JobState.CANCELLED, JobState.EXPIRED, JobState.FAILED):
+        webserver.logger.info("Job %s was %s", job_id, state.name.lower())
+        return jsonify({'status': state.name.lower()})
+    if state != JobState.DONE:
         webserver.logger.info("Job %s is still running", job_id)
         return jsonify({'status': 'running'})
+    return result_response(job_id, result_format, page)
+
+
+def result_request() -> tuple:
+    '''
+        Returns the format of the result asked for by ?format= and its (offset, limit)
+        page, None for the whole result. Raises ValueError for an unknown format, or for
+        a page of a MessagePack result.
+    '''
+    result_format = request.args.get('format', 'json')
+    offset = request.args.get('offset', type=int)
+    limit = request.args.get('limit', type=int)
+    page = None if offset is None and limit is None else (
+        max(offset or 0, 0), max(limit, 0) if limit is not None else None
+    )
+    if result_format not in ('json', 'ndjson', 'msgpack') or (
+            result_format == 'msgpack' and page is not None):
+        raise ValueError(result_format)
+    return result_format, page
 
-    with open(f"./results/job_{job_id}", "r", encoding="utf-8") as f:
-        res = json.loads(f.read())
+
+def result_response(job_id: int, result_format: str, page: tuple):
+    '''
+        Returns the result of a done job in result_format, restricted to page if given:
+        a precomputed encoding when one is stored, else its stored bytes
+    '''
+    if page is None and result_format != 'ndjson':
+        response = encoded_response(job_id, result_format)
+        if response is not None:
+            webserver.logger.info("Returning encoded response for job_id: %s", job_id)
+            return response
+
+    stored = webserver.tasks_runner.get_result_chunks(job_id, STREAM_CHUNK)
+    if stored is None:
+        webserver.logger.error("Result of job_id %s was evicted", job_id)
+        return jsonify({'status': 'error', 'reason': 'Result expired'})
+    size, chunks = stored
+    version = webserver.tasks_runner.get_version(job_id)
 
     webserver.logger.info("Returning response for job_id: %s", job_id)
-    return jsonify({'status': 'done', 'data': res})
+    if result_format == 'msgpack':
+        return msgpack_response(b''.join(chunks), version)
+    if result_format == 'json' and page is None and size <= STREAM_CHUNK:
+        return done_response(b''.join(chunks), version)
+    return streamed_response(job_id, chunks, version, result_format, page)
+
+
+def msgpack_response(res: bytes, version: int):
+    '''
+        Returns the response of a done job encoded in MessagePack, which is not
+        precomputed unless RS_ENCODINGS lists msgpack
+    '''
+    if msgpack is None:
+        return jsonify({'status': 'error', 'reason': 'MessagePack is not available'}), 406
+    return webserver.response_class(msgpack_body(res, version), mimetype=MEDIA_TYPES['msgpack'])
+
+
+def streamed_response(job_id: int, chunks, version: int, result_format: str, page: tuple):
+    '''
+        Returns the response of a done job streamed from its stored chunks, as JSON or
+        NDJSON, with only the entries of page if given
+    '''
+    # split results are streamed entry by entry, from their stored bytes
+    first = next(chunks, b'')
+    chunks = itertools.chain([first], chunks)
+    if (result_format == 'ndjson' or page is not None) and not is_object(first):
+        webserver.logger.error("Result of job_id %s cannot be split", job_id)
+        return jsonify({'status': 'error', 'reason': 'Result is not an object'})
+
+    header = b'{"status": "done", "version": ' + str(version).encode()
+    if result_format == 'ndjson':
+        return webserver.response_class(stream_ndjson(header, chunks, page),
+                                        mimetype='application/x-ndjson')
+    return webserver.response_class(stream_json(header, chunks, page),
+                                    mimetype='application/json')
 
 
 @webserver.route('/api/states_mean', methods=['POST'], endpoint='states_mean')
@@ -170,27 +520,241 @@ def state_mean_by_category_request():
     return post_wrapper(webserver.data_ingestor.state_mean_by_category, state=True)
 
 
+@webserver.route('/api/state_trend', methods=['POST'], endpoint='state_trend')
+@verify_request_decorator('POST')
+def state_trend_request():
+    '''
+        Submit state_trend job to execution
+    '''
+    return post_wrapper(webserver.data_ingestor.state_trend, state=True)
+
+
+@webserver.route('/api/batch', methods=['POST'], endpoint='batch')
+@verify_request_decorator('POST')
+def batch_request():
+    '''
+        Submit a batch of queries as a single job. The body holds a list of
+        {"endpoint": ..., "question": ..., "state": ..., "year_from": ..., "year_to": ...}
+        queries and the result is the list of their answers, in order, with an optional
+        priority and deadline for the whole batch.
+    '''
+    data = request.json
+    if not isinstance(data, dict) or not isinstance(data.get('queries'), list):
+        webserver.logger.error("Invalid format of batch %s", data)
+        return jsonify({"status": "error", "reason": f"Invalid format of {data} => "
+                                                     "expected {\"queries\": [...]}"}), 400
+    webserver.logger.info("Received batch of %s queries", len(data['queries']))
+    data_ingestor = webserver.data_ingestor
+
+    try:
+        queries = []
+        for position, query in enumerate(data['queries']):
+            try:
+                endpoint = text_field(query, 'endpoint')
+                if endpoint not in QUERIES:
+                    raise KeyError(endpoint)
+                question = text_field(query, 'question')
+                args = (
+                    (question, text_field(query, 'state')) if QUERIES[endpoint]
+                    else (question,)
+                ) + year_range(query, data_ingestor)
+            except (KeyError, TypeError, ValueError, OverflowError) as e:
+                raise type(e)(f"query {position}: {e}") from e
+            queries.append((endpoint, args))
+        job = webserver.tasks_runner.make_task(data_ingestor.batch, queries)
+        priority = job_priority(data)
+        deadline = job_deadline(data)
+    except (KeyError, TypeError, ValueError, OverflowError) as e:
+        webserver.logger.error("Invalid format of batch %s", data)
+        return jsonify({"status": "error", "reason": f"Invalid format of {data} => {e}"}), 400
+
+    return submit_job(('batch', tuple(queries), None), job, data_ingestor.version,
+                      (priority, deadline))
+
+
 @webserver.route('/api/graceful_shutdown', methods=['GET'], endpoint='graceful_shutdown')
 @verify_request_decorator('GET')
 def graceful_shutdown():
     '''
-        Gracefully shuts down the webserver
+        Gracefully shuts down the webserver. Under serve.py, every worker is stopped:
+        the parent process forwards SIGTERM to all of them, and each one finishes its
+        queued jobs before exiting.
     '''
+    parent = os.environ.get('WS_PARENT_PID')
+    if parent is not None and int(parent) == os.getppid():
+        os.kill(int(parent), signal.SIGTERM)
+        webserver.logger.info("Webserver shutdown of every worker requested")
+        return jsonify({"status": "success"})
+
     webserver.tasks_runner.graceful_shutdown()
     webserver.logger.info("Webserver shutdown")
     return jsonify({"status": "success"})
 
 
+def swap_dataset(build: callable, data_path: str = None) -> None:
+    '''
+        Builds a new dataset version and swaps it in. Requests read webserver.data_ingestor
+        when they are submitted, so jobs submitted before the swap still run against the
+        version they were bound to.
+    '''
+    try:
+        data_ingestor = build()
+        webserver.tasks_runner.set_dataset(data_ingestor)
+        webserver.data_ingestor = data_ingestor
+        if data_path is not None:
+            webserver.data_path = data_path
+        webserver.dataset_load["error"] = None
+        webserver.logger.info("Dataset version %s loaded, %s rows",
+                              data_ingestor.version, len(data_ingestor.data))
+    except (OSError, ValueError, KeyError) as e:
+        webserver.dataset_load["error"] = str(e)
+        webserver.logger.error("Dataset load failed: %s", e)
+    finally:
+        with webserver.dataset_load["lock"]:
+            webserver.dataset_load["running"] = False
+
+
+def start_dataset_load(build: callable, data_path: str = None):
+    '''
+        Starts building a new dataset version in the background, one at a time. Refused
+        under serve.py with several workers: the load would only apply to the one that
+        receives the request, and the workers would then serve different datasets.
+    '''
+    if (os.environ.get('WS_SERVER') == 'prefork'
+            and int(os.environ.get('WS_PROCESSES', '1')) > 1):
+        webserver.logger.error("Dataset load refused, several serve.py workers are running")
+        return jsonify({"status": "error", "reason": "Dataset loads are not supported with "
+                                                     "several serve.py workers, restart the "
+                                                     "server instead"}), 409
+    with webserver.dataset_load["lock"]:
+        if webserver.dataset_load["running"]:
+            return jsonify({"status": "error", "reason": "A dataset load is already running"}), 409
+        webserver.dataset_load["running"] = True
+    Thread(target=swap_dataset, args=(build, data_path), daemon=True).start()
+    return jsonify({"status": "success", "version": webserver.data_ingestor.version}), 202
+
+
+@webserver.route('/api/admin/reload', methods=['POST'], endpoint='admin_reload')
+@verify_request_decorator('POST')
+@admin_request_decorator
+def admin_reload():
+    '''
+        Reloads the dataset from its CSV, or from {"path": ...} in the data directory,
+        which then replaces it
+    '''
+    data = request.get_json(silent=True)
+    data = data if isinstance(data, dict) else {}
+    data_path = webserver.data_path
+    if 'path' in data:
+        try:
+            data_path = data_file(data['path'])
+        except ValueError as e:
+            webserver.logger.error("Invalid dataset path: %s", e)
+            return jsonify({"status": "error", "reason": str(e)})
+    current = webserver.data_ingestor
+    webserver.logger.info("Reloading the dataset from %s", data_path)
+
+    def build():
+        return DataIngestor(data_path, compact=current.compact, value_dtype=current.value_dtype,
+                            snapshot=os.environ.get('DI_SNAPSHOT', '0') == '1',
+                            column_store=os.environ.get('DI_COLUMN_STORE', '0') == '1')
+
+    return start_dataset_load(build, data_path)
+
+
+@webserver.route('/api/admin/append', methods=['POST'], endpoint='admin_append')
+@verify_request_decorator('POST')
+@admin_request_decorator
+def admin_append():
+    '''
+        Appends the rows of the CSV at {"path": ...}, in the data directory, to the dataset,
+        in memory only
+    '''
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'path' not in data:
+        return jsonify({"status": "error", "reason": "Missing path"})
+    try:
+        data_path = data_file(data['path'])
+    except ValueError as e:
+        webserver.logger.error("Invalid dataset path: %s", e)
+        return jsonify({"status": "error", "reason": str(e)})
+    current = webserver.data_ingestor
+    webserver.logger.info("Appending %s to the dataset", data_path)
+    return start_dataset_load(lambda: current.append(data_path))
+
+
+@webserver.route('/api/admin/dataset', methods=['GET'], endpoint='admin_dataset')
+@verify_request_decorator('GET')
+def admin_dataset():
+    '''
+        Returns the current dataset version, whether a load is running and its last error
+    '''
+    data_ingestor = webserver.data_ingestor
+    return jsonify({"status": "done", "dataset": {
+        "version": data_ingestor.version,
+        "path": webserver.data_path,
+        "rows": len(data_ingestor.data),
+        "loading": webserver.dataset_load["running"],
+        "error": webserver.dataset_load["error"],
+    }})
+
+
 @webserver.route('/api/jobs', methods=['GET'], endpoint='jobs')
 @verify_request_decorator('GET')
 def get_jobs():
     '''
-        Returns the current status of all jobs
+        Returns a page of jobs, oldest first. Query parameters: after (job_id cursor),
+        limit (at most 1000), state, endpoint and since/until (submission unix time).
     '''
     webserver.logger.info("Getting jobs...")
-    jobs = webserver.tasks_runner.get_jobs()
+    try:
+        state = request.args.get('state')
+        jobs, cursor = webserver.tasks_runner.get_jobs(
+            after=request.args.get('after', 0, type=int),
+            limit=min(max(request.args.get('limit', 100, type=int), 1), 1000),
+            state=JobState[state.upper()] if state is not None else None,
+            endpoint=request.args.get('endpoint'),
+            since=request.args.get('since', type=float),
+            until=request.args.get('until', type=float),
+        )
+    except KeyError as e:
+        webserver.logger.error("Invalid job state %s", e)
+        return jsonify({"status": "error", "reason": f"Invalid job state {e}"})
     webserver.logger.info("Got jobs status")
-    return jsonify({"status": "done", "jobs": jobs})
+    return jsonify({"status": "done", "jobs": jobs, "next": cursor})
+
+
+@webserver.route('/api/jobs/<job_id>', methods=['DELETE'], endpoint='cancel_job')
+@verify_request_decorator('DELETE')
+def cancel_job(job_id):
+    '''
+        Cancels a job: a queued job is dropped without running, a running one has its
+        result discarded. While other requests share the job through the result cache,
+        the caller is only detached from it and the job keeps running for them.
+    '''
+    webserver.logger.info("Cancelling job_id: %s", job_id)
+
+    job_id = int(job_id) if job_id.isdigit() else -1
+    if not webserver.tasks_runner.is_valid(job_id):
+        webserver.logger.error("Invalid job_id: %s", job_id)
+        return jsonify({'status': 'error', 'reason': 'Invalid job_id'})
+
+    if webserver.tasks_runner.jobs.get(job_id) == JobState.RUNNING:
+        attached = webserver.result_cache.detach(job_id)
+        if attached > 0:
+            webserver.logger.info("Request detached from job %s, %s still attached",
+                                  job_id, attached)
+            return jsonify({'status': 'success', 'job_id': job_id, 'state': 'running',
+                            'attached': attached})
+
+    if not webserver.tasks_runner.cancel(job_id):
+        state = webserver.tasks_runner.jobs.get(job_id)
+        webserver.logger.error("Job %s cannot be cancelled, it is %s", job_id,
+                               state.name.lower() if state is not None else "evicted")
+        return jsonify({'status': 'error', 'reason': 'Job already finished',
+                        'state': state.name.lower() if state is not None else None})
+    webserver.logger.info("Job %s cancelled", job_id)
+    return jsonify({'status': 'success', 'job_id': job_id, 'state': 'cancelled'})
 
 
 @webserver.route('/api/num_jobs', methods=['GET'], endpoint='num_jobs')
@@ -205,6 +769,79 @@ def get_num_jobs():
     return jsonify({"status": "done", "num_jobs": num_jobs})
 
 
+@webserver.route('/api/load', methods=['GET'], endpoint='load')
+@verify_request_decorator('GET')
+def get_load():
+    '''
+        Returns the queue depth, limits, rejections and estimated drain time, and how
+        the server runs: its mode, processes and configured threads per process
+    '''
+    load = webserver.tasks_runner.get_load()
+    mode = os.environ.get('WS_SERVER', 'flask')
+    load["server"] = {
+        "mode": mode,
+        "processes": int(os.environ.get('WS_PROCESSES', '1')) if mode == 'prefork' else 1,
+        "threads": webserver.tasks_runner.num_of_threads,
+    }
+    return jsonify({"status": "done", "load": load})
+
+
+@webserver.route('/api/queue_stats', methods=['GET'], endpoint='queue_stats')
+@verify_request_decorator('GET')
+def get_queue_stats():
+    '''
+        Returns the queue length and queue wait times of each cost class
+    '''
+    return jsonify({"status": "done", "queues": webserver.tasks_runner.get_queue_stats()})
+
+
+@webserver.route('/api/cache_stats', methods=['GET'], endpoint='cache_stats')
+@verify_request_decorator('GET')
+def get_cache_stats():
+    '''
+        Returns the size and hit/miss counters of the result cache
+    '''
+    return jsonify({"status": "done", "cache": webserver.result_cache.get_stats()})
+
+
+@webserver.route('/metrics', methods=['GET'], endpoint='metrics')
+@verify_request_decorator('GET')
+def get_metrics():
+    '''
+        Returns the server, thread pool, result store and cache metrics
+        in the Prometheus text format
+    '''
+    tasks_runner = webserver.tasks_runner
+    queues = tasks_runner.get_queue_stats()
+    threads = tasks_runner.get_thread_times()
+    store = tasks_runner.result_store.get_stats()
+    cache = webserver.result_cache.get_stats()
+
+    gauges = [
+        ("job_queue_depth", "Queued jobs by cost class", ("class",),
+         {(job_class,): stats["queued"] for job_class, stats in queues.items()}),
+        ("jobs_registered", "Jobs in the job registry", (), {(): len(tasks_runner.jobs)}),
+        ("log_records_dropped", "Log records dropped because the log queue was full", (),
+         {(): getattr(webserver.log_pipeline["handler"], "dropped", 0)}),
+        ("taskrunner_threads", "Running TaskRunner threads", (),
+         {(): tasks_runner.get_num_threads()}),
+        ("taskrunner_busy_seconds", "Time each TaskRunner spent executing jobs", ("thread",),
+         {(thread_id,): busy for thread_id, (busy, _) in threads.items()}),
+        ("taskrunner_idle_seconds", "Time each TaskRunner spent idle", ("thread",),
+         {(thread_id,): idle for thread_id, (_, idle) in threads.items()}),
+        ("result_store_results", "Results held by the result store", (),
+         {(): store["results"]}),
+        ("result_store_bytes", "Bytes held in memory by the result store", (),
+         {(): store.get("bytes", 0)}),
+        ("result_cache_entries", "Entries of the result cache", (), {(): cache["size"]}),
+        ("result_cache_hit_ratio", "Ratio of requests served by an existing job", (),
+         {(): cache["hit_ratio"]}),
+    ]
+    return webserver.response_class(
+        METRICS.render(gauges), mimetype='text/plain; version=0.0.4'
+    )
+
+
 @webserver.route('/')
 @webserver.route('/index')
 def index():
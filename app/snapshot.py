@@ -0,0 +1,177 @@
+'''
+    This module is responsible for the binary snapshot of a parsed dataset, saved next
+    to its CSV so later starts skip parsing it and building the aggregate index.
+    Its column files are fixed-width arrays, strings as dictionary codes, memory-mapped
+    read-only by every process that loads them, which then share their pages.
+'''
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+# bumped whenever the layout below changes, older snapshots are then rebuilt
+SNAPSHOT_FORMAT = 2
+
+
+def snapshot_dir(csv_path: str) -> str:
+    '''Returns the directory of the snapshot of a CSV'''
+    return csv_path + ".snapshot"
+
+
+def source_stat(csv_path: str) -> dict:
+    '''Returns the size and modification time a snapshot of the CSV is valid for'''
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class SnapshotLock:
+    '''
+        Exclusive lock on the snapshot of a CSV, held by the processes of a host while they
+        load it, or parse the CSV and save it: the first one builds the snapshot, the
+        others wait and map it. Without fcntl (or write access), nothing is locked.
+    '''
+    def __init__(self, csv_path: str):
+        self.path = snapshot_dir(csv_path) + ".lock"
+        self.file = None
+
+    def __enter__(self) -> 'SnapshotLock':
+        if fcntl is None:
+            return self
+        try:
+            # released when the file is closed
+            self.file = open(self.path, "ab")  # pylint: disable=consider-using-with
+        except OSError:
+            return self
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *_) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _save_columns(tmp: str, data: pd.DataFrame) -> list:
+    '''Saves every column of data in tmp, returns their metadata'''
+    columns = []
+    for position, (column, values) in enumerate(data.items()):
+        categories = None
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = [str(category) for category in values.cat.categories]
+            array = values.cat.codes.to_numpy()
+        elif values.dtype.kind in 'biuf':
+            array = values.to_numpy()
+        else:
+            codes = values.astype('category')
+            categories = [str(category) for category in codes.cat.categories]
+            array = codes.cat.codes.to_numpy()
+        np.save(os.path.join(tmp, f"column-{position}.npy"), array)
+        columns.append({"name": column, "dtype": str(values.dtype), "categories": categories})
+    return columns
+
+
+def _save_aggregates(tmp: str, aggregates: dict) -> dict:
+    '''Saves every aggregate frame in tmp, returns the levels of their indexes'''
+    levels = {}
+    for name, frame in aggregates.items():
+        index = frame.index
+        if not isinstance(index, pd.MultiIndex):
+            index = pd.MultiIndex.from_arrays([index])
+        for level, codes in enumerate(index.codes):
+            np.save(os.path.join(tmp, f"{name}-codes-{level}.npy"), np.asarray(codes))
+        for column in ['sum', 'count']:
+            np.save(os.path.join(tmp, f"{name}-{column}.npy"), frame[column].to_numpy())
+        levels[name] = [[str(key) for key in level] for level in index.levels]
+    return levels
+
+
+def save_snapshot(csv_path: str, source: dict, options: dict,
+                  data: pd.DataFrame, aggregates: dict) -> bool:
+    '''
+        Saves every column of data as a .npy file, strings as integer codes and their
+        categories, and every aggregate frame as its index codes and its sum and count
+        columns. The snapshot is written in a temporary directory and renamed into place,
+        so readers never see a partial one. Returns whether it was saved.
+    '''
+    directory = snapshot_dir(csv_path)
+    tmp = tempfile.mkdtemp(prefix=".snapshot-", dir=os.path.dirname(os.path.abspath(csv_path)))
+    try:
+        meta = {"format": SNAPSHOT_FORMAT, "source": source, "options": options,
+                "columns": _save_columns(tmp, data),
+                "aggregates": _save_aggregates(tmp, aggregates)}
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as fout:
+            json.dump(meta, fout)
+
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.rename(tmp, directory)
+        return True
+    except OSError as err:
+        shutil.rmtree(tmp, ignore_errors=True)
+        logging.getLogger("webserver_logger").warning("Snapshot not saved: %s", err)
+        return False
+
+
+def _load_columns(directory: str, meta: dict) -> pd.DataFrame:
+    '''Loads the columns of a snapshot, memory-mapped'''
+    columns = {}
+    for position, column in enumerate(meta["columns"]):
+        array = np.load(os.path.join(directory, f"column-{position}.npy"), mmap_mode='r')
+        if column["categories"] is None:
+            columns[column["name"]] = array
+            continue
+        # the codes were checked when saved, validating them would read every page
+        values = pd.Categorical.from_codes(array, column["categories"], validate=False)
+        columns[column["name"]] = (
+            values if column["dtype"] == 'category' else values.astype(column["dtype"])
+        )
+    return pd.DataFrame(columns, copy=False)
+
+
+def _load_aggregates(directory: str, meta: dict) -> dict:
+    '''Loads the aggregate frames of a snapshot, their sums and counts memory-mapped'''
+    aggregates = {}
+    for name, levels in meta["aggregates"].items():
+        codes = [np.load(os.path.join(directory, f"{name}-codes-{level}.npy"))
+                 for level in range(len(levels))]
+        index = pd.MultiIndex(levels=levels, codes=codes)
+        aggregates[name] = pd.DataFrame({
+            column: np.load(os.path.join(directory, f"{name}-{column}.npy"), mmap_mode='r')
+            for column in ['sum', 'count']
+        }, index=index if len(levels) > 1 else index.get_level_values(0), copy=False)
+    return aggregates
+
+
+def load_snapshot(csv_path: str, source: dict, options: dict) -> tuple:
+    '''
+        Loads the snapshot of a CSV, if there is one made from this exact CSV (same size
+        and modification time) with the same load options. The numeric columns, the codes
+        and the aggregate sums and counts are memory-mapped read-only; the string columns
+        are only decoded if the snapshot was not loaded compact. Returns (data, aggregates),
+        None if there is no valid snapshot.
+    '''
+    directory = snapshot_dir(csv_path)
+    try:
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as fin:
+            meta = json.load(fin)
+    except (OSError, ValueError):
+        return None
+    if (meta.get("format") != SNAPSHOT_FORMAT or meta.get("source") != source
+            or meta.get("options") != options):
+        return None
+
+    try:
+        return _load_columns(directory, meta), _load_aggregates(directory, meta)
+    except (OSError, ValueError, KeyError) as err:
+        logging.getLogger("webserver_logger").warning("Snapshot not loaded: %s", err)
+        return None
@@ -0,0 +1,63 @@
+'''
+    This module is responsible for the SQLite database shared by the server processes.
+'''
+import sqlite3
+
+from threading import Lock, local
+
+
+class SQLiteDatabase:
+    '''
+        SQLite database in WAL mode, so readers never block the writer, shared by the
+        threads of every server process. Each thread gets its own connection, in
+        autocommit mode: every statement is its own transaction, unless grouped by
+        transaction(). Pages freed by deletions are returned to the file by compact().
+    '''
+    def __init__(self, path: str, schema: str):
+        self.path = path
+        self.local = local()
+        self.connections = []
+        self.lock = Lock()
+        self.connection().executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        '''Returns the connection of the current thread'''
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            # only applies to a new database, before it is switched to WAL
+            connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+        return connection
+
+    def execute(self, sql: str, parameters: tuple = ()) -> sqlite3.Cursor:
+        '''Executes a statement on the connection of the current thread'''
+        return self.connection().execute(sql, parameters)
+
+    def transaction(self, sql: str, rows: list) -> None:
+        '''Executes a statement for each row of parameters, in a single transaction'''
+        connection = self.connection()
+        with connection:
+            connection.execute("BEGIN")
+            connection.executemany(sql, rows)
+
+    def compact(self) -> None:
+        '''Frees the unused pages, then moves the write-ahead log into the database'''
+        connection = self.connection()
+        # run to completion, execute() would only free the first page
+        connection.executescript("PRAGMA incremental_vacuum;")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+
+    def close(self) -> None:
+        '''Closes the connections of every thread'''
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            connection.close()
+        self.local = local()
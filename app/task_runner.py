@@ -1,116 +1,717 @@
 '''
     This module is responsible for managing the task execution in a thread pool.
 '''
+import heapq
+import itertools
+import logging
 import os
+import time
 
-from queue import Queue
-from threading import Thread, Event
+from collections import Counter, deque
+from functools import partial
+from threading import Thread, Event, Lock, BoundedSemaphore, Condition
+from app.admission import AdmissionControl
+from app.data_ingestor import QUERY_COST
+from app.job_registry import JobState, make_job_registry
+from app.metrics import METRICS
+from app.process_pool import SharedMemoryExecutor, run_query
+from app.result_encoding import MEDIA_TYPES, encode_variants, variant_key
+from app.result_store import MemoryResultStore
 
-class ThreadPool:
+
+class FairQueue:  # pylint: disable=too-many-instance-attributes
+    '''
+        Weighted-fair job queue. Each cost class has its own queue, ordered by client
+        priority and then by arrival. Classes are served by stride scheduling, so each
+        one gets a share of the dequeues proportional to its weight: light jobs are not
+        stuck behind bursts of heavy ones, and heavy ones still progress.
+    '''
+    def __init__(self, weights: dict):
+        self.weights = weights
+        self.lock = Condition()
+
+        # job_class => heap of (-priority, arrival, enqueue time, item)
+        self.queues = {job_class: [] for job_class in weights}
+        self.passes = {job_class: 0.0 for job_class in weights}
+        self.virtual_time = 0.0
+        self.arrivals = itertools.count()
+
+        # shutdown markers, only handed out once every class is empty
+        self.sentinels = []
+
+        # queue wait statistics, per class
+        self.waits = {
+            job_class: {"dequeued": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=1024)}
+            for job_class in weights
+        }
+        # longest wait of the jobs dequeued since the last take_wait
+        self.window_wait = 0.0
+
+    def put(self, item, job_class: str, priority: int = 0) -> None:
+        '''Adds item to the queue of its class'''
+        with self.lock:
+            queue = self.queues[job_class]
+            if not queue:
+                # an idle class does not bank credit for when it becomes busy again
+                self.passes[job_class] = max(self.passes[job_class], self.virtual_time)
+            heapq.heappush(queue, (-priority, next(self.arrivals), time.monotonic(), item))
+            self.lock.notify()
+
+    def put_sentinel(self, item) -> None:
+        '''Adds an item returned only after every queued job'''
+        with self.lock:
+            self.sentinels.append(item)
+            self.lock.notify()
+
+    def get(self, timeout: float = None):
+        '''
+            Removes and returns the next item, blocking until there is one,
+            or returns None after timeout seconds without any
+        '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.lock:
+            while True:
+                active = [job_class for job_class, queue in self.queues.items() if queue]
+                if active:
+                    break
+                if self.sentinels:
+                    return self.sentinels.pop()
+                if deadline is None:
+                    self.lock.wait()
+                elif not self.lock.wait(deadline - time.monotonic()):
+                    return None
+
+            job_class = min(active, key=self.passes.get)
+            self.virtual_time = self.passes[job_class]
+            self.passes[job_class] += 1.0 / self.weights[job_class]
+            _, _, enqueued, item = heapq.heappop(self.queues[job_class])
+
+            wait = time.monotonic() - enqueued
+            stats = self.waits[job_class]
+            stats["dequeued"] += 1
+            stats["total"] += wait
+            stats["max"] = max(stats["max"], wait)
+            stats["recent"].append(wait)
+            self.window_wait = max(self.window_wait, wait)
+            return item
+
+    def qsize(self) -> int:
+        '''Returns the number of queued jobs'''
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+    def take_wait(self) -> float:
+        '''
+            Returns the longest queue wait, in seconds, since the last call: of the jobs
+            dequeued meanwhile and of the jobs still queued
+        '''
+        with self.lock:
+            now = time.monotonic()
+            wait, self.window_wait = self.window_wait, 0.0
+            for queue in self.queues.values():
+                if queue:
+                    wait = max(wait, now - min(entry[2] for entry in queue))
+            return wait
+
+    def get_stats(self) -> dict:
+        '''Returns the queue length and queue wait times (in seconds) of each class'''
+        with self.lock:
+            stats = {}
+            for job_class, waits in self.waits.items():
+                recent = sorted(waits["recent"])
+                stats[job_class] = {
+                    "weight": self.weights[job_class],
+                    "queued": len(self.queues[job_class]),
+                    "dequeued": waits["dequeued"],
+                    "avg_wait": waits["total"] / waits["dequeued"] if waits["dequeued"] else 0.0,
+                    "max_wait": waits["max"],
+                    "p95_wait": recent[int(0.95 * (len(recent) - 1))] if recent else 0.0,
+                }
+            return stats
+
+
+class ThreadPool:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
     '''
         This class is responsible for managing the task execution in a thread pool.
     '''
-    def __init__(self):
+    def __init__(self, result_store=None):
         # set number of threads
         self.num_of_threads = (
             int(os.environ['TP_NUM_OF_THREADS']) if 'TP_NUM_OF_THREADS' in os.environ
             else os.cpu_count()
         )
 
+        # with TP_AUTOSCALE=1 the number of threads varies between TP_MIN_THREADS and
+        # TP_MAX_THREADS, starting from TP_NUM_OF_THREADS
+        self.autoscaler = None
+        if os.environ.get('TP_AUTOSCALE', '0') == '1':
+            self.autoscaler = Autoscaler(
+                self,
+                int(os.environ['TP_MIN_THREADS']) if 'TP_MIN_THREADS' in os.environ else 1,
+                int(os.environ['TP_MAX_THREADS']) if 'TP_MAX_THREADS' in os.environ
+                else 4 * os.cpu_count(),
+                float(os.environ['TP_TARGET_WAIT']) if 'TP_TARGET_WAIT' in os.environ else 0.1,
+                float(os.environ['TP_SCALE_COOLDOWN']) if 'TP_SCALE_COOLDOWN' in os.environ
+                else 30,
+            )
+            self.num_of_threads = min(
+                max(self.num_of_threads, self.autoscaler.min_threads), self.autoscaler.max_threads
+            )
+
         # var to notify that the data was loaded
         self.data_loaded = Event()
 
-        # task management
-        self.task_state = {}
-        self.task_queue = Queue()
+        # jobs run on the TaskRunner threads, or on worker processes with TP_EXECUTOR=process
+        self.executor = (
+            SharedMemoryExecutor(
+                self.autoscaler.max_threads if self.autoscaler is not None else self.num_of_threads
+            )
+            if os.environ.get('TP_EXECUTOR', 'thread') == 'process' else None
+        )
 
-        # create and start the threads
-        self.threads = [
-            TaskRunner(i, self.task_queue, self.task_state, self.data_loaded)
-            for i in range(self.num_of_threads)
-        ]
-        for i in range(self.num_of_threads):
-            self.threads[i].start()
+        # task management, TP_CLASS_WEIGHTS overrides weights as <cost class>:<weight>,...
+        weights = {'light': 8.0, 'medium': 4.0, 'heavy': 1.0}
+        if 'TP_CLASS_WEIGHTS' in os.environ:
+            weights.update(
+                (job_class, float(weight)) for job_class, weight in
+                (pair.split(':') for pair in os.environ['TP_CLASS_WEIGHTS'].split(','))
+            )
+            if min(weights.values()) <= 0:
+                raise ValueError(f"TP_CLASS_WEIGHTS must be positive: {weights}")
+        self.task_queue = FairQueue(weights)
+        self.result_store = (
+            result_store if result_store is not None
+            else MemoryResultStore(max_bytes=256 * 1024 * 1024, ttl=3600)
+        )
 
-        # create the result directory if it doesn't exist
-        if not os.path.exists("./results"):
-            os.makedirs("./results")
+        # finished jobs expire after TP_JOB_TTL seconds or beyond TP_MAX_JOBS jobs
+        self.jobs = make_job_registry(on_evict=self.remove_result)
 
+        # encodings of the results precomputed when their job completes, see result_encoding
+        self.encodings = (
+            os.environ['RS_ENCODINGS'].split(',') if 'RS_ENCODINGS' in os.environ else ['gzip']
+        )
+        self.compress_min = (
+            int(os.environ['RS_COMPRESS_MIN']) if 'RS_COMPRESS_MIN' in os.environ else 1024
+        )
 
-    def add_task(self, task: callable, job_id: int) -> int:
-        '''adds task to queue and task_state'''
-        if not all(self.threads[i].is_alive() for i in range(self.num_of_threads)):
+        # queue depth and per client in-flight limits, 0 means unlimited
+        self.admission = AdmissionControl(
+            int(os.environ['TP_MAX_QUEUE']) if 'TP_MAX_QUEUE' in os.environ else 10000,
+            int(os.environ['TP_MAX_CLIENT_JOBS']) if 'TP_MAX_CLIENT_JOBS' in os.environ else 0,
+        )
+
+        # completion events and callbacks of the jobs someone is waiting for, the waiters
+        # limit and the number of unfinished jobs of each dataset version
+        self.completion = {"events": {}, "callbacks": {}, "lock": Lock(), "versions": Counter(),
+                           "waiting": Counter()}
+        self.waiters = BoundedSemaphore(
+            int(os.environ['TP_MAX_WAITERS']) if 'TP_MAX_WAITERS' in os.environ else 64
+        )
+
+        # with TP_DURABLE=1, the jobs and results are kept in SQLite across restarts,
+        # and compacted every TP_COMPACT_INTERVAL seconds
+        self.durable = os.environ.get('TP_DURABLE', '0') == '1'
+        self.compactor = None
+        if self.durable:
+            self.compactor = Compactor(
+                self,
+                float(os.environ['TP_COMPACT_INTERVAL']) if 'TP_COMPACT_INTERVAL' in os.environ
+                else 60,
+            )
+            self.compactor.start()
+
+        # create and start the threads, the autoscaler adds and retires some later on
+        self.stopping = Event()
+        self.threads_lock = Lock()
+        self.thread_ids = itertools.count()
+        self.threads = []
+        self.add_threads(self.num_of_threads)
+        if self.autoscaler is not None:
+            self.autoscaler.start()
+
+    def add_threads(self, count: int) -> bool:
+        '''Starts count more TaskRunner threads, unless the pool is shutting down'''
+        with self.threads_lock:
+            if self.stopping.is_set():
+                return False
+            for _ in range(count):
+                thread = TaskRunner(next(self.thread_ids), self)
+                self.threads.append(thread)
+                thread.start()
+            return True
+
+    def retire_thread(self, thread) -> bool:
+        '''
+            Removes an idle TaskRunner from the pool, unless the pool is at its minimum
+            size or shutting down. Returns whether the thread must exit.
+        '''
+        with self.threads_lock:
+            if self.stopping.is_set() or len(self.threads) <= self.autoscaler.min_threads:
+                return False
+            self.threads.remove(thread)
+            remaining = len(self.threads)
+        self.autoscaler.record("down", 1, remaining, f"TaskRunner {thread.thread_id} idle")
+        return True
+
+    def get_num_threads(self) -> int:
+        '''Returns the number of running TaskRunner threads'''
+        with self.threads_lock:
+            return len(self.threads)
+
+
+    def set_dataset(self, data_ingestor) -> None:
+        '''
+            Publishes a loaded dataset to the worker processes, if any: a dataset loaded
+            from the column store is mapped by the workers, others are copied to them.
+            The workers of older versions are stopped once their jobs are done.
+        '''
+        if self.executor is None:
+            return
+        store = ((data_ingestor.csv_path, data_ingestor.value_dtype)
+                 if data_ingestor.column_store else None)
+        self.executor.start(data_ingestor.data, data_ingestor.version, store)
+        with self.completion["lock"]:
+            idle = [version for version in self.executor.pools
+                    if not self.completion["versions"][version]]
+        for version in idle:
+            self.executor.retire(version)
+
+    def make_task(self, method: callable, *args) -> callable:
+        '''
+            Creates the job for a DataIngestor method: its closure when running on threads,
+            a picklable call by name when running on worker processes. Either way, the
+            job carries its (method, args) query, to be created again after a restart.
+        '''
+        if self.executor is not None:
+            task = partial(run_query, method.__name__, args)
+        else:
+            task = method(*args)
+        task.query = (method.__name__, args)
+        return task
+
+    def recover(self, data_ingestor) -> int:
+        '''
+            With TP_DURABLE=1, queues again the jobs a previous run of the server left
+            queued or running, against the current dataset. Returns their number.
+        '''
+        if not self.durable:
+            return 0
+        jobs = self.jobs.recover(data_ingestor.version)
+        for job_id, endpoint, (method, args, priority) in jobs:
+            task = self.make_task(getattr(data_ingestor, method), *args)
+            with self.completion["lock"]:
+                self.completion["versions"][data_ingestor.version] += 1
+            self.task_queue.put((task, job_id), QUERY_COST.get(endpoint, 'medium'), priority)
+        return len(jobs)
+
+    def add_task(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        task: callable,
+        job_id: int,
+        endpoint: str = None,
+        priority: int = 0,
+        client: str = None,
+        version: int = None,
+        deadline: float = None,
+    ) -> int:
+        '''
+            adds task to the queue of the cost class of its endpoint and to the registry,
+            with the version of the dataset it runs against and the unix time after which
+            it expires instead of running,
+            raises AdmissionError if the queue or the client is over its limit
+        '''
+        if self.stopping.is_set():
             return -1
 
-        self.task_queue.put((task, job_id))
-        self.task_state[f"job_id_{job_id}"] = "running"
+        self.admission.admit(job_id, client)
+        query = getattr(task, "query", None)
+        self.jobs.add(job_id, endpoint, version, deadline,
+                      (*query, priority) if query is not None else None)
+        with self.completion["lock"]:
+            self.completion["versions"][version] += 1
+        self.task_queue.put((task, job_id), QUERY_COST.get(endpoint, 'medium'), priority)
 
         return job_id
 
+    def complete(self, job_id: int, version: int = None, state: JobState = JobState.DONE) -> None:
+        '''
+            Marks a dequeued job of a dataset version as done (or expired, or failed) and
+            wakes up its waiters. If it was cancelled meanwhile, possibly by another server
+            process, its result is dropped and its slot and waiters are released anyway.
+        '''
+        if not self.finish(job_id, state):
+            self.remove_result(job_id)
+            self.release(job_id)
+        with self.completion["lock"]:
+            versions = self.completion["versions"]
+            versions[version] -= 1
+            drained = versions[version] <= 0
+            if drained:
+                del versions[version]
+
+        # the workers of an older dataset version are not needed anymore
+        if drained and self.executor is not None:
+            self.executor.retire(version)
+
+    def finish(self, job_id: int, state: JobState) -> bool:
+        '''
+            Moves a running job to its final state, releases its admission slot and wakes
+            up its waiters. Returns False if it had already finished.
+        '''
+        if not self.jobs.finish(job_id, state):
+            return False
+        if state != JobState.DONE:
+            METRICS.inc("jobs_dropped_total", (state.name.lower(),))
+        self.release(job_id)
+        return True
+
+    def release(self, job_id: int) -> None:
+        '''Releases the admission slot of a finished job and wakes up its waiters'''
+        self.admission.release(job_id)
+        with self.completion["lock"]:
+            event = self.completion["events"].pop(job_id, None)
+            callbacks = self.completion["callbacks"].pop(job_id, [])
+        if event is not None:
+            event.set()
+        for callback in callbacks:
+            callback()
+
+    def cancel(self, job_id: int) -> bool:
+        '''
+            Cancels a running job: it is skipped when dequeued, or its result is dropped
+            if it already started. Returns False if the job is unknown or finished.
+        '''
+        return self.finish(job_id, JobState.CANCELLED)
+
+    def wait(self, job_id: int, timeout: float) -> bool:
+        '''
+            Blocks until the job is done or timeout seconds passed. Returns whether the job
+            is done, immediately if the maximum number of waiters is already blocked.
+        '''
+        # released in the finally below, once the waiter is done
+        if not self.waiters.acquire(blocking=False):  # pylint: disable=consider-using-with
+            return self.is_done(job_id)
+        try:
+            if self.jobs.poll_interval is not None:
+                # the job may run in another process, which wakes up this one through
+                # the registry
+                self.jobs.wait_finished(job_id, timeout)
+                return self.is_done(job_id)
+
+            with self.completion["lock"]:
+                event = self.completion["events"].setdefault(job_id, Event())
+                self.completion["waiting"][job_id] += 1
+            try:
+                # the job may have finished before its event was registered
+                if not self.is_finished(job_id):
+                    event.wait(timeout)
+                return self.is_done(job_id)
+            finally:
+                # the last waiter to leave drops the event, even if the job is running
+                with self.completion["lock"]:
+                    self.completion["waiting"][job_id] -= 1
+                    if self.completion["waiting"][job_id] <= 0:
+                        del self.completion["waiting"][job_id]
+                        self.completion["events"].pop(job_id, None)
+        finally:
+            self.waiters.release()
+
+    def on_done(self, job_id: int, callback: callable) -> None:
+        '''
+            Calls callback() once the job is finished: right away if it already is,
+            otherwise from the thread finishing it, so it must not block. Jobs finished
+            by another server process do not call it.
+        '''
+        with self.completion["lock"]:
+            if not self.is_finished(job_id):
+                self.completion["callbacks"].setdefault(job_id, []).append(callback)
+                return
+        callback()
+
+    def remove_on_done(self, job_id: int, callback: callable) -> None:
+        '''Unregisters a callback of on_done that was not called yet'''
+        with self.completion["lock"]:
+            callbacks = self.completion["callbacks"].get(job_id)
+            if callbacks is None or callback not in callbacks:
+                return
+            callbacks.remove(callback)
+            if not callbacks:
+                del self.completion["callbacks"][job_id]
+
     def get_num_jobs(self) -> int:
         '''Returns the number of jobs in the queue'''
         return self.task_queue.qsize()
 
-    def get_jobs(self) -> list:
-        '''Returns job states'''
-        return list(self.task_state.items())
+    def get_queue_stats(self) -> dict:
+        '''Returns the queue length and queue wait times of each cost class'''
+        return self.task_queue.get_stats()
+
+    def get_load(self) -> dict:
+        '''Returns the queue depth, rejections and estimated drain time'''
+        return self.admission.get_stats(self.task_queue.qsize())
+
+    def get_thread_times(self) -> dict:
+        '''Returns the busy and idle seconds of each TaskRunner'''
+        now = time.monotonic()
+        with self.threads_lock:
+            threads = list(self.threads)
+        return {
+            thread.thread_id: (thread.busy_time, now - thread.started - thread.busy_time)
+            for thread in threads
+        }
+
+    def get_jobs(self, after: int = 0, limit: int = 100, **filters) -> tuple:
+        '''Returns a page of jobs and the cursor of the next one, see JobRegistry.page'''
+        return self.jobs.page(after, limit, **filters)
 
     def graceful_shutdown(self) -> None:
         '''ThreadPool shutdown'''
-        if not all(self.threads[i].is_alive() for i in range(self.num_of_threads)):
-            return
+        with self.threads_lock:
+            if self.stopping.is_set():
+                return
+            self.stopping.set()
+            threads = list(self.threads)
+
+        # no thread is added or retired from now on, every one drains the queue
+        if self.autoscaler is not None:
+            self.autoscaler.stop()
+        if self.compactor is not None:
+            self.compactor.stop()
 
-        for thread in self.threads:
-            self.task_queue.put((None, None))
+        for thread in threads:
+            self.task_queue.put_sentinel((None, None))
 
-        for thread in self.threads:
+        for thread in threads:
             thread.join()
 
-        # remove the results directory
-        os.rmdir("./results")
+        # release the stored results and the worker processes
+        self.result_store.close()
+        if self.executor is not None:
+            self.executor.shutdown()
 
     def is_valid(self, job_id: int) -> bool:
         '''Checks if job_id is valid'''
-        return f"job_id_{job_id}" in self.task_state
+        return self.jobs.get(job_id) is not None
 
     def is_done(self, job_id: int) -> bool:
         '''Checks if job is done'''
-        return self.task_state[f"job_id_{job_id}"] == "done"
+        return self.jobs.get(job_id) == JobState.DONE
+
+    def is_finished(self, job_id: int) -> bool:
+        '''Checks if job is not running anymore: done, cancelled, expired or evicted'''
+        return self.jobs.get(job_id) != JobState.RUNNING
+
+    def get_state(self, job_id: int) -> str:
+        '''
+            Returns the state of a job, "running" or "done", None if it is unknown,
+            its result was evicted, it was dropped before running or it failed
+        '''
+        state = self.jobs.get(job_id)
+        if state is None or state in (JobState.CANCELLED, JobState.EXPIRED, JobState.FAILED) or (
+                state == JobState.DONE and not self.result_store.contains(job_id)):
+            return None
+        return state.name.lower()
+
+    def get_version(self, job_id: int) -> int:
+        '''Returns the dataset version a job was computed against'''
+        record = self.jobs.record(job_id)
+        return record.version if record is not None else None
+
+    def get_result(self, job_id: int) -> bytes:
+        '''Returns the serialized result of a done job, None if it was evicted'''
+        return self.result_store.get(job_id)
+
+    def get_result_chunks(self, job_id: int, chunk_size: int, variant: str = None) -> tuple:
+        '''
+            Returns the size of the serialized result of a done job, or of one of its
+            encoded variants, and an iterator over its bytes, chunk_size at a time,
+            None if it was evicted or not encoded
+        '''
+        key = job_id if variant is None else variant_key(job_id, variant)
+        return self.result_store.get_chunks(key, chunk_size)
+
+    def save_result(self, job_id: int, version: int, data: bytes) -> None:
+        '''Stores the serialized result of a job and its encoded variants, at once'''
+        variants = encode_variants(data, version, self.encodings, self.compress_min)
+        self.result_store.put_many({
+            job_id: data,
+            **{variant_key(job_id, variant): body for variant, body in variants.items()},
+        })
+
+    def remove_result(self, job_id: int) -> None:
+        '''Removes the result of a job and its encoded variants'''
+        self.result_store.remove(job_id)
+        for result_format in MEDIA_TYPES:
+            for coding in [None] + self.encodings:
+                variant = result_format if coding is None else f"{result_format}.{coding}"
+                if variant != 'json':
+                    self.result_store.remove(variant_key(job_id, variant))
 
 
 class TaskRunner(Thread):
     '''
         This class is responsible for executing tasks in the ThreadPool.
     '''
-    def __init__(
-        self,
-        thread_id: int,
-        task_queue: Queue,
-        task_state: dict,
-        data_loaded: Event,
-    ):
+    def __init__(self, thread_id: int, pool: ThreadPool):
         Thread.__init__(self)
         self.thread_id = thread_id
-        self.task_queue = task_queue
-        self.task_state = task_state
-        self.data_loaded = data_loaded
+        self.pool = pool
+
+        # time spent executing jobs, the rest of the uptime is idle
+        self.started = time.monotonic()
+        self.busy_time = 0.0
 
     def run(self):
         # wait for data to process
-        self.data_loaded.wait()
+        self.pool.data_loaded.wait()
+
+        # with autoscaling, a thread idle for the cooldown leaves the pool
+        autoscaler = self.pool.autoscaler
+        cooldown = autoscaler.cooldown if autoscaler is not None else None
 
         while True:
             # Get the task
-            task, job_id = self.task_queue.get()
+            item = self.pool.task_queue.get(cooldown)
+            if item is None:
+                if self.pool.retire_thread(self):
+                    break
+                continue
+            task, job_id = item
+            self.pool.admission.dequeued(job_id)
             if task is None:
                 break
 
-            # Execute the job
-            result = task()
+            record = self.pool.jobs.record(job_id)
+            endpoint = record.endpoint if record is not None else None
+            version = record.version if record is not None else None
+            if record is not None:
+                METRICS.observe("job_queue_wait_seconds", (endpoint,),
+                                time.time() - record.submitted)
+
+                # abandoned jobs are dropped without running them
+                if record.state == JobState.CANCELLED:
+                    self.pool.complete(job_id, version, JobState.CANCELLED)
+                    continue
+                if record.deadline is not None and time.time() > record.deadline:
+                    self.pool.complete(job_id, version, JobState.EXPIRED)
+                    continue
+
+            # Update the task state and wake up its waiters, whether the job succeeded
+            state = self.execute(task, job_id, endpoint, version)
+            self.pool.complete(job_id, version, state)
+
+    def execute(self, task: callable, job_id: int, endpoint: str, version: int) -> JobState:
+        '''
+            Runs a job and stores its serialized result and its encodings. Returns its
+            final state: FAILED if the job, its worker process or the result store raised,
+            which is logged without stopping the thread.
+        '''
+        start = time.monotonic()
+        try:
+            executor = self.pool.executor
+            result = task() if executor is None else executor.run(task, version)
+            elapsed = time.monotonic() - start
+            self.pool.save_result(job_id, version, result.encode("utf-8"))
+            return JobState.DONE
+        except Exception:  # pylint: disable=broad-exception-caught
+            elapsed = time.monotonic() - start
+            logging.getLogger("webserver_logger").exception("Job %s failed", job_id)
+            return JobState.FAILED
+        finally:
+            self.busy_time += elapsed
+            METRICS.observe("job_execution_seconds", (endpoint,), elapsed)
+
+
+class Autoscaler(Thread):  # pylint: disable=too-many-instance-attributes
+    '''
+        Adds TaskRunner threads, up to max_threads, while jobs wait in the queue longer
+        than target_wait seconds. TaskRunners idle for cooldown seconds retire
+        themselves, down to min_threads. Decisions are logged and counted in METRICS.
+    '''
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        pool: ThreadPool,
+        min_threads: int,
+        max_threads: int,
+        target_wait: float,
+        cooldown: float,
+        interval: float = 0.5,
+    ):
+        Thread.__init__(self, daemon=True)
+        self.pool = pool
+        self.min_threads = max(min_threads, 1)
+        self.max_threads = max(max_threads, self.min_threads)
+        self.target_wait = target_wait
+        self.cooldown = cooldown
+        self.interval = interval
+        self.stopped = Event()
+        self.logger = logging.getLogger("webserver_logger")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            # jobs queued before the data is loaded are not waiting for a thread
+            if not self.pool.data_loaded.is_set():
+                continue
+            wait = self.pool.task_queue.take_wait()
+            queued = self.pool.task_queue.qsize()
+            threads = self.pool.get_num_threads()
+            if wait <= self.target_wait or not queued or threads >= self.max_threads:
+                continue
+
+            # at most double the pool at once, and no more threads than queued jobs
+            count = min(self.max_threads - threads, max(threads, 1), queued)
+            if not self.pool.add_threads(count):
+                continue
+            self.record(
+                "up", count, threads + count,
+                f"queue wait {wait:.3f}s > {self.target_wait}s, {queued} queued"
+            )
+
+    def record(self, direction: str, count: int, threads: int, reason: str) -> None:
+        '''Logs and counts a scaling decision'''
+        METRICS.inc("taskrunner_scaling_total", (direction,), count)
+        self.logger.info(
+            "Autoscaler: %s%d TaskRunner threads, %d running (%s)",
+            "+" if direction == "up" else "-", count, threads, reason,
+        )
+
+    def stop(self) -> None:
+        '''Stops scaling and waits for the current decision'''
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+
+
+class Compactor(Thread):
+    '''
+        Every interval seconds, evicts the expired jobs of a durable registry and their
+        results, then compacts the databases: freed pages are returned to the file
+        system and the write-ahead log is truncated, so neither grows with the uptime.
+    '''
+    def __init__(self, pool: ThreadPool, interval: float):
+        Thread.__init__(self, daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.stopped = Event()
+        self.logger = logging.getLogger("webserver_logger")
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.compact()
 
-            # Save the result to disk
-            with open(f"./results/job_{job_id}", "w", encoding="utf-8") as f:
-                f.write(result)
+    def compact(self) -> None:
+        '''Compacts the job registry and the result store'''
+        start = time.monotonic()
+        self.pool.jobs.compact()
+        compact = getattr(self.pool.result_store, "compact", None)
+        if compact is not None:
+            compact()
+        self.logger.info("Compacted the job registry and results in %.3fs",
+                         time.monotonic() - start)
 
-            # Update the task state
-            self.task_state[f"job_id_{job_id}"] = "done"
+    def stop(self) -> None:
+        '''Stops compacting and waits for the current compaction'''
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,64 @@
+'''
+    Asyncio entry point: serves the same routes as api_server.py from one event loop.
+    Connections are coroutines rather than request threads, and /api/get_results?wait=
+    awaits the completion of its job, so idle and long-polling clients are cheap.
+    See app/async_http.py.
+
+    Usage:
+        python async_server.py --port 5000
+'''
+import argparse
+import asyncio
+import os
+import signal
+import resource
+
+
+async def serve(host: str, port: int, workers: int) -> None:
+    '''Creates the app and serves requests until SIGTERM, SIGINT or graceful_shutdown'''
+    # pylint: disable=import-outside-toplevel
+    from app import create_app
+    from app.async_http import AsyncHTTPServer
+
+    webserver = create_app()
+    server = AsyncHTTPServer(webserver, workers)
+    await server.start(host, port)
+    print(f"Serving on http://{host}:{port} with asyncio")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+
+    # /api/graceful_shutdown stops the thread pool, the server then stops as well
+    while not stopping.is_set() and not webserver.tasks_runner.stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), 1.0)
+        except asyncio.TimeoutError:
+            pass
+    await server.stop()
+
+
+def main() -> None:
+    '''Parses the arguments and runs the event loop'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get('WS_ASYNC_WORKERS', '16')),
+                        help="threads running the Flask routes")
+    args = parser.parse_args()
+
+    # reported by /api/load
+    os.environ['WS_SERVER'] = 'async'
+
+    # every connection is a file descriptor, allow as many as the hard limit
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    asyncio.run(serve(args.host, args.port, args.workers))
+
+
+if __name__ == '__main__':
+    main()
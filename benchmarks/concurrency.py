@@ -0,0 +1,234 @@
+'''
+    Concurrency ceiling of a running server: for each number of clients, opens that many
+    keep-alive connections, each submitting a query, long-polling its result and then
+    staying idle for --think seconds, in a loop. Reports the completed round trips, the
+    errors, the latency percentiles and the peak threads and resident memory of the
+    server process. Compare the Flask mode (flask run, serve.py) with async_server.py:
+    the first needs a thread per open connection, the second a coroutine.
+
+    Usage:
+        python benchmarks/concurrency.py --pid <server pid> --clients 100,1000,5000
+        python benchmarks/concurrency.py --clients 100,1000 --think 1 --output async.json
+'''
+import argparse
+import asyncio
+import json
+import random
+import resource
+import time
+
+from urllib.parse import urlsplit
+
+from load_test import load_payloads, parse_mix, percentile
+
+
+def server_usage(pid: int) -> tuple:
+    '''Returns the number of threads and the resident memory in bytes of a process'''
+    threads = rss = 0
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as fin:
+            for line in fin:
+                if line.startswith("Threads:"):
+                    threads = int(line.split()[1])
+                elif line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return threads, rss
+
+
+class Connection:
+    '''Minimal HTTP/1.1 keep-alive client over asyncio streams'''
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self) -> None:
+        '''Connects to the server'''
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body: dict = None) -> dict:
+        '''Sends a request and returns its decoded JSON response'''
+        data = json.dumps(body).encode() if body is not None else b''
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Length: {len(data)}\r\n")
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        self.writer.write(head.encode() + b"\r\n" + data)
+        await self.writer.drain()
+
+        status = await self.reader.readline()
+        if not status:
+            raise ConnectionError("connection closed")
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "content-length" in headers:
+            payload = await self.reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding") == "chunked":
+            pieces = []
+            while (size := int((await self.reader.readline()).strip(), 16)) > 0:
+                pieces.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            await self.reader.readline()
+            payload = b"".join(pieces)
+        else:
+            payload = await self.reader.read()
+        if headers.get("connection") == "close":
+            self.close()
+            await self.open()
+        if int(status.split()[1]) >= 500:
+            raise ConnectionError(status.decode().strip())
+        return json.loads(payload)
+
+    def close(self) -> None:
+        '''Closes the connection'''
+        if self.writer is not None:
+            self.writer.close()
+
+
+class ConcurrencyTest:
+    '''Runs the clients of one concurrency level and collects their results'''
+    def __init__(self, args: argparse.Namespace, payloads: list):
+        self.args = args
+        self.payloads = payloads
+        address = urlsplit(args.url)
+        self.host, self.port = address.hostname, address.port or 80
+        self.latencies = []
+        self.errors = {}
+        self.peak = (0, 0)
+
+    def error(self, e: Exception) -> None:
+        '''Counts an error by type'''
+        name = type(e).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    async def client(self, seed: int, deadline: float) -> None:
+        '''Submits queries and long-polls their results until the deadline'''
+        rng = random.Random(seed)
+        connection = Connection(self.host, self.port)
+        try:
+            await asyncio.wait_for(connection.open(), self.args.timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error(e)
+            return
+
+        endpoints = [payload[0] for payload in self.payloads]
+        weights = [payload[2] for payload in self.payloads]
+        try:
+            # spread the first requests over the think time
+            await asyncio.sleep(rng.uniform(0, self.args.think))
+            while time.monotonic() < deadline:
+                index = rng.choices(range(len(endpoints)), weights)[0]
+                start = time.monotonic()
+                try:
+                    await asyncio.wait_for(self.round_trip(connection, index), self.args.timeout)
+                    self.latencies.append(time.monotonic() - start)
+                except (OSError, ValueError, asyncio.TimeoutError,
+                        asyncio.IncompleteReadError) as e:
+                    self.error(e)
+                    connection.close()
+                    await asyncio.wait_for(connection.open(), self.args.timeout)
+                await asyncio.sleep(self.args.think)
+        except (OSError, asyncio.TimeoutError) as e:
+            self.error(e)
+        finally:
+            connection.close()
+
+    async def round_trip(self, connection: Connection, index: int) -> None:
+        '''Submits one query and waits for its result'''
+        endpoint, payload, _ = self.payloads[index]
+        response = await connection.request("POST", f"/api/{endpoint}", payload)
+        if "job_id" not in response:
+            raise ValueError(response.get("reason", "rejected"))
+        while True:
+            result = await connection.request(
+                "GET", f"/api/get_results/{response['job_id']}?wait={self.args.wait}"
+            )
+            if result.get("status") == "done":
+                return
+            if result.get("status") != "running":
+                raise ValueError(result.get("reason", "error"))
+
+    async def sample(self) -> None:
+        '''Records the peak threads and resident memory of the server'''
+        while True:
+            threads, rss = server_usage(self.args.pid)
+            self.peak = (max(self.peak[0], threads), max(self.peak[1], rss))
+            await asyncio.sleep(0.1)
+
+    async def run(self, clients: int) -> dict:
+        '''Runs clients concurrent clients for the configured duration'''
+        deadline = time.monotonic() + self.args.duration
+        sampler = asyncio.create_task(self.sample()) if self.args.pid else None
+        start = time.monotonic()
+        await asyncio.gather(*(self.client(seed, deadline) for seed in range(clients)))
+        elapsed = time.monotonic() - start
+        if sampler is not None:
+            sampler.cancel()
+
+        latencies = sorted(self.latencies)
+        return {
+            "clients": clients,
+            "round_trips": len(latencies),
+            "throughput": len(latencies) / elapsed,
+            "errors": self.errors,
+            "p50": percentile(latencies, 0.50),
+            "p99": percentile(latencies, 0.99),
+            "server_threads": self.peak[0],
+            "server_rss": self.peak[1],
+        }
+
+
+def ms(value: float) -> str:
+    '''Formats seconds as milliseconds'''
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def main() -> None:
+    '''Runs every concurrency level and prints, and optionally saves, the results'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--clients", default="100,1000",
+                        help="comma separated numbers of concurrent clients")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--think", type=float, default=1.0,
+                        help="seconds each client stays idle between queries")
+    parser.add_argument("--wait", type=float, default=10, help="?wait= of the result polls")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mix", default="",
+                        help="endpoint=weight,... of the queries, every endpoint by default")
+    parser.add_argument("--pid", type=int, default=None,
+                        help="server process to sample the threads and memory of")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--output", default=None, help="file to save the JSON report to")
+    args = parser.parse_args()
+
+    # every client is a file descriptor, allow as many as the hard limit
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    payloads = load_payloads(parse_mix(args.mix))
+    levels = []
+    print(f"{'clients':>8} {'trips':>8} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>9} "
+          f"{'threads':>8} {'rss MB':>7}  errors")
+    for clients in [int(level) for level in args.clients.split(",")]:
+        level = asyncio.run(ConcurrencyTest(args, payloads).run(clients))
+        levels.append(level)
+        print(f"{clients:>8} {level['round_trips']:>8} {level['throughput']:>8.1f} "
+              f"{ms(level['p50']):>8} {ms(level['p99']):>9} {level['server_threads']:>8} "
+              f"{level['server_rss'] / 2 ** 20:>7.0f}  {level['errors'] or ''}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            json.dump({"label": args.label, "config": vars(args), "levels": levels},
+                      fout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
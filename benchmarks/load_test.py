@@ -0,0 +1,263 @@
+'''
+    Load generator replaying the tests/<endpoint>/input/in-*.json payloads against a
+    running server. Reports the throughput and the submit-to-result latency percentiles
+    of each endpoint, and saves them as JSON so runs can be compared. The requests skip
+    the result cache (Cache-Control: no-cache) unless --cache is given, so that every one
+    of them runs a job.
+
+    Usage:
+        python benchmarks/load_test.py --concurrency 16 --requests 2000 --output run.json
+        python benchmarks/load_test.py --mix state_mean=4,mean_by_category=1 --rate 200
+        python benchmarks/load_test.py --compare before.json after.json
+'''
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from collections import defaultdict
+from threading import Lock, Thread
+
+import requests
+
+TESTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests")
+
+
+def load_payloads(mix: dict) -> list:
+    '''
+        Returns the (endpoint, payload, weight) list to sample from. Each endpoint's
+        weight is split evenly across its inputs.
+    '''
+    payloads = []
+    for endpoint, weight in mix.items():
+        input_dir = os.path.join(TESTS_DIR, endpoint, "input")
+        files = sorted(os.listdir(input_dir))
+        for name in files:
+            with open(os.path.join(input_dir, name), "r", encoding="utf-8") as fin:
+                payloads.append((endpoint, json.load(fin), weight / len(files)))
+    return payloads
+
+
+def parse_mix(mix: str) -> dict:
+    '''Parses endpoint=weight,... into a dict, all endpoints with weight 1 if empty'''
+    if not mix:
+        return {endpoint: 1.0 for endpoint in sorted(os.listdir(TESTS_DIR))}
+    return {endpoint: float(weight) for endpoint, weight in
+            (pair.split("=") for pair in mix.split(","))}
+
+
+def percentile(values: list, fraction: float) -> float:
+    '''Nearest-rank percentile of sorted values'''
+    if not values:
+        return None
+    return values[min(int(fraction * len(values)), len(values) - 1)]
+
+
+class LoadTest:
+    '''
+        Runs the requests on concurrency client threads. With a rate, requests are
+        started on a fixed schedule (open loop), otherwise back to back (closed loop).
+    '''
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.payloads = load_payloads(parse_mix(args.mix))
+        self.tickets = itertools.count()
+        self.lock = Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.start = None
+        self.server = None
+
+    def run(self) -> dict:
+        '''Runs the load test and returns its report'''
+        self.server = self.server_config()
+        self.start = time.monotonic()
+        threads = [Thread(target=self.client, args=(i,)) for i in range(self.args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.monotonic() - self.start)
+
+    def server_config(self) -> dict:
+        '''Returns the mode, processes and threads of the server, None if unavailable'''
+        try:
+            response = requests.get(f"{self.args.url}/api/load", timeout=self.args.timeout)
+            return response.json()["load"].get("server")
+        except (requests.RequestException, ValueError, KeyError):
+            return None
+
+    def client(self, seed: int) -> None:
+        '''Sends requests until the requested number is reached'''
+        session = requests.Session()
+        if not self.args.cache:
+            session.headers["Cache-Control"] = "no-cache"
+        rng = random.Random(seed)
+        weights = [weight for _, _, weight in self.payloads]
+        while True:
+            ticket = next(self.tickets)
+            if ticket >= self.args.requests:
+                return
+            if self.args.rate > 0:
+                delay = self.start + ticket / self.args.rate - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            endpoint, payload, _ = rng.choices(self.payloads, weights)[0]
+            submitted = time.monotonic()
+            outcome = self.request(session, endpoint, payload)
+            with self.lock:
+                if outcome == "done":
+                    self.latencies[endpoint].append(time.monotonic() - submitted)
+                else:
+                    self.errors[endpoint][outcome] += 1
+
+    def request(self, session: requests.Session, endpoint: str, payload: dict) -> str:
+        '''Submits one job and waits for its result, returns "done" or the failure'''
+        url = f"{self.args.url}/api"
+        try:
+            response = session.post(f"{url}/{endpoint}", json=payload, timeout=self.args.timeout)
+            if response.status_code != 200:
+                return f"http_{response.status_code}"
+            job_id = response.json().get("job_id")
+            if job_id is None:
+                return "rejected"
+
+            deadline = time.monotonic() + self.args.timeout
+            while time.monotonic() < deadline:
+                result = session.get(f"{url}/get_results/{job_id}",
+                                     params={"wait": self.args.wait}, timeout=self.args.timeout)
+                status = result.json()["status"]
+                if status != "running":
+                    return status
+                if self.args.wait == 0:
+                    time.sleep(self.args.poll_interval)
+            return "timeout"
+        except requests.RequestException:
+            return "connection_error"
+
+    def report(self, elapsed: float) -> dict:
+        '''Builds the machine readable report of the run'''
+        endpoints = {}
+        for endpoint in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[endpoint])
+            endpoints[endpoint] = {
+                "completed": len(latencies),
+                "errors": dict(self.errors[endpoint]),
+                "throughput": len(latencies) / elapsed,
+                "p50": percentile(latencies, 0.50),
+                "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99),
+            }
+        completed = sum(stats["completed"] for stats in endpoints.values())
+        latencies = sorted(itertools.chain.from_iterable(self.latencies.values()))
+        return {
+            "label": self.args.label,
+            "commit": git_commit(),
+            "timestamp": time.time(),
+            "config": {
+                "url": self.args.url,
+                "concurrency": self.args.concurrency,
+                "requests": self.args.requests,
+                "rate": self.args.rate,
+                "mix": parse_mix(self.args.mix),
+                "wait": self.args.wait,
+                "cache": self.args.cache,
+                "server": self.server,
+            },
+            "elapsed": elapsed,
+            "throughput": completed / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "endpoints": endpoints,
+        }
+
+
+def git_commit() -> str:
+    '''Returns the current git commit, None outside a git checkout'''
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=TESTS_DIR).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def ms(value: float) -> str:
+    '''Formats seconds as milliseconds'''
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(report: dict) -> None:
+    '''Prints the per endpoint table of a report'''
+    print(f"{'endpoint':<24}{'done':>8}{'errors':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = list(report["endpoints"].items()) + [("total", report)]
+    for endpoint, stats in rows:
+        if endpoint == "total":
+            done = sum(s["completed"] for s in report["endpoints"].values())
+            errors = sum(sum(s["errors"].values()) for s in report["endpoints"].values())
+        else:
+            done, errors = stats["completed"], sum(stats["errors"].values())
+        print(f"{endpoint:<24}{done:>8}{errors:>8}{stats['throughput']:>10.1f}"
+              f"{ms(stats['p50']):>10}{ms(stats['p95']):>10}{ms(stats['p99']):>10}")
+
+
+def compare(paths: list) -> None:
+    '''Prints the throughput and latency percentiles of several saved runs side by side'''
+    print(f"{'run':<32}{'commit':>10}{'server':>16}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as fin:
+            report = json.load(fin)
+        name = report["label"] or os.path.basename(path)
+        server = report["config"].get("server")
+        # mode, processes x threads per process
+        server = (f"{server['mode']} {server['processes']}x{server['threads']}"
+                  if server else "-")
+        print(f"{name:<32}{report['commit'] or '-':>10}{server:>16}{report['throughput']:>10.1f}"
+              f"{ms(report['p50']):>10}{ms(report['p95']):>10}{ms(report['p99']):>10}")
+
+
+def main() -> None:
+    '''Parses the arguments and runs the load test or the comparison'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=0,
+                        help="requests per second, 0 sends them back to back")
+    parser.add_argument("--mix", default="",
+                        help="endpoint=weight,... (default: every endpoint, same weight)")
+    parser.add_argument("--wait", type=float, default=5,
+                        help="long-poll timeout of get_results, 0 polls instead")
+    parser.add_argument("--poll-interval", type=float, default=0.01)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--cache", action="store_true",
+                        help="let repeated payloads be answered from the result cache")
+    parser.add_argument("--label", default=None, help="name of the run in comparisons")
+    parser.add_argument("--output", default=None, help="file to save the JSON report to")
+    parser.add_argument("--compare", nargs="+", metavar="REPORT",
+                        help="compare saved reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    report = LoadTest(args).run()
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            json.dump(report, fout, indent=2)
+    failed = sum(sum(s["errors"].values()) for s in report["endpoints"].values())
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+    Microbenchmark of the logging cost paid by a request thread: each simulated request
+    makes the three info calls of a submission and a result poll, from several threads,
+    through every logging configuration, then waits --pause seconds like a request doing
+    its actual work. The former setup (synchronous text records, rotating every 20 KB) is
+    the baseline. Records dropped by a full queue are reported, as they are cheaper
+    than written ones.
+
+    Usage:
+        python benchmarks/logging_overhead.py --threads 8 --requests 2000
+'''
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from threading import Thread
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.log_pipeline import setup_logging, stop_logging  # pylint: disable=wrong-import-position
+
+PAYLOAD = {"question": "Percent of adults aged 18 years and older who have obesity",
+           "state": "Ohio"}
+
+# name => environment of setup_logging
+CONFIGS = {
+    "sync text, 20 KB rotation": {'LOG_MODE': 'sync', 'LOG_FORMAT': 'text',
+                                  'LOG_MAX_BYTES': '20000'},
+    "sync json, 10 MB rotation": {'LOG_MODE': 'sync', 'LOG_FORMAT': 'json'},
+    "async json": {'LOG_MODE': 'async', 'LOG_FORMAT': 'json'},
+    "async json, 10% sampled": {'LOG_MODE': 'async', 'LOG_FORMAT': 'json', 'LOG_SAMPLE': '0.1'},
+}
+
+
+def simulate(logger: logging.Logger, requests: int, pause: float, latencies: list) -> None:
+    '''Logs like requests requests, recording the time each one spent logging'''
+    for job_id in range(requests):
+        time.sleep(pause)
+        start = time.perf_counter()
+        logger.info("Received %s request", "state_mean", extra={"payload": PAYLOAD})
+        logger.info("Job %s added to the queue", job_id)
+        logger.info("Getting response for job_id: %s", job_id)
+        latencies.append(time.perf_counter() - start)
+
+
+def run(name: str, environ: dict, args: argparse.Namespace) -> dict:
+    '''Runs the simulated requests through one configuration'''
+    logger = logging.getLogger(f"benchmark.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, environ):
+        pipeline = setup_logging(logger, os.path.join(directory, "webserver.log"))
+        latencies = [[] for _ in range(args.threads)]
+        threads = [Thread(target=simulate, args=(logger, args.requests, args.pause, latencies[i]))
+                   for i in range(args.threads)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        # the time to write out the queued records is not paid by the requests
+        stop_logging(pipeline)
+        flushed = time.perf_counter() - start
+        logger.removeHandler(pipeline["handler"])
+        pipeline["handler"].close()
+
+    latencies = sorted(latency for thread in latencies for latency in thread)
+    return {
+        "mean": sum(latencies) / len(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p99": latencies[int(0.99 * (len(latencies) - 1))],
+        "elapsed": elapsed,
+        "flushed": flushed,
+        "dropped": getattr(pipeline["handler"], "dropped", 0),
+    }
+
+
+def main() -> None:
+    '''Runs every configuration and prints the per request logging latency'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per thread")
+    parser.add_argument("--pause", type=float, default=0.001,
+                        help="seconds between the requests of a thread")
+    args = parser.parse_args()
+
+    print(f"{'configuration':<28} {'mean us':>8} {'p50 us':>8} {'p99 us':>8} "
+          f"{'run s':>7} {'flushed s':>9} {'dropped':>8}")
+    for name, environ in CONFIGS.items():
+        result = run(name, environ, args)
+        print(f"{name:<28} {result['mean'] * 1e6:>8.1f} {result['p50'] * 1e6:>8.1f} "
+              f"{result['p99'] * 1e6:>8.1f} {result['elapsed']:>7.2f} {result['flushed']:>9.2f} "
+              f"{result['dropped']:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''
+    Memory benchmark of several server processes on one host: starts --processes fresh
+    interpreters per load mode, each loading the dataset and answering every query once,
+    then reads the Rss, Pss (shared pages divided among their users) and private memory
+    of each from /proc/<pid>/smaps_rollup. The baseline mode only imports the server, so
+    the difference with it is the memory of the dataset. --scale repeats the rows of the
+    CSV to show how each mode grows with the dataset. Linux only.
+
+    Usage:
+        python benchmarks/memory.py --csv nutrition_activity_obesity_usa_subset.csv --processes 4
+'''
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.data_ingestor import DataIngestor, QUERIES  # pylint: disable=wrong-import-position
+
+# name => DataIngestor options, None for the baseline
+MODES = {
+    "baseline": None,
+    "csv": {},
+    "csv compact": {"compact": True},
+    "column store": {"column_store": True},
+}
+
+
+def hold(csv_path: str, options: dict, connection) -> None:
+    '''Loads the dataset, answers every query, then waits to be measured'''
+    if options is not None:
+        data_ingestor = DataIngestor(csv_path, **options)
+        for question in data_ingestor.question_index:
+            for method, has_state in QUERIES.items():
+                args = (question, "Ohio") if has_state else (question,)
+                getattr(data_ingestor, method)(*args)()
+    connection.send("ready")
+    connection.recv()
+
+
+def smaps(pid: int) -> dict:
+    '''Returns the Rss, Pss and private memory of a process, in bytes'''
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup", "r", encoding="utf-8") as fin:
+        for line in fin:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {"rss": fields["Rss"], "pss": fields["Pss"],
+            "private": fields["Private_Clean"] + fields["Private_Dirty"]}
+
+
+def measure(csv_path: str, options: dict, processes: int) -> dict:
+    '''Starts processes holders of the dataset together, returns their mean memory'''
+    context = multiprocessing.get_context("spawn")
+    holders = []
+    for _ in range(processes):
+        parent, child = context.Pipe()
+        process = context.Process(target=hold, args=(csv_path, options, child))
+        process.start()
+        holders.append((process, parent))
+    for _, parent in holders:
+        parent.recv()
+
+    usage = [smaps(process.pid) for process, _ in holders]
+    for process, parent in holders:
+        parent.send("stop")
+        process.join()
+    return {key: sum(entry[key] for entry in usage) / processes for key in usage[0]}
+
+
+def scaled_csv(csv_path: str, scale: int, directory: str) -> str:
+    '''Returns a copy of the CSV with its rows repeated scale times'''
+    path = os.path.join(directory, os.path.basename(csv_path))
+    with open(csv_path, "r", encoding="utf-8") as fin:
+        header = fin.readline()
+        rows = fin.read()
+    if rows and not rows.endswith("\n"):
+        rows += "\n"
+    with open(path, "w", encoding="utf-8") as fout:
+        fout.write(header)
+        for _ in range(scale):
+            fout.write(rows)
+    return path
+
+
+def main() -> None:
+    '''Measures every load mode and prints the memory per process'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="nutrition_activity_obesity_usa_subset.csv")
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--scale", type=int, default=1, help="times the rows are repeated")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        csv_path = scaled_csv(args.csv, args.scale, directory)
+        # the column store is built once beforehand, as by the first server of a host
+        measure(csv_path, MODES["column store"], 1)
+
+        results = {mode: measure(csv_path, options, args.processes)
+                   for mode, options in MODES.items()}
+    finally:
+        shutil.rmtree(directory)
+
+    baseline = results["baseline"]
+    print(f"{os.path.getsize(args.csv) * args.scale / 2**20:.0f} MB of CSV, "
+          f"{args.processes} processes, MB per process")
+    print(f"{'mode':<14}{'rss':>8}{'pss':>8}{'private':>9}{'pss - baseline':>16}")
+    for mode, usage in results.items():
+        print(f"{mode:<14}{usage['rss'] / 2**20:>8.1f}{usage['pss'] / 2**20:>8.1f}"
+              f"{usage['private'] / 2**20:>9.1f}"
+              f"{(usage['pss'] - baseline['pss']) / 2**20:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+'''
+    Startup time benchmark: time to a ready DataIngestor when parsing the CSV, when
+    parsing it and saving its snapshot, and when loading the snapshot.
+
+    Usage:
+        python benchmarks/startup.py --csv nutrition_activity_obesity_usa_subset.csv --repeat 5
+'''
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.data_ingestor import DataIngestor
+from app.snapshot import snapshot_dir
+
+
+def measure(csv_path: str, compact: bool, snapshot: bool, repeat: int, fresh: bool) -> dict:
+    '''Loads the dataset repeat times, removing the snapshot first if fresh'''
+    times = []
+    report = None
+    for _ in range(repeat):
+        if fresh:
+            shutil.rmtree(snapshot_dir(csv_path), ignore_errors=True)
+        start = time.perf_counter()
+        report = DataIngestor(csv_path, compact=compact, snapshot=snapshot).memory_report
+        times.append(time.perf_counter() - start)
+    return {
+        "source": report["source"],
+        "min": min(times),
+        "median": statistics.median(times),
+        "rss_delta": report["rss_after"] - report["rss_before"],
+        "data_bytes": report["data_bytes"],
+    }
+
+
+def main() -> None:
+    '''Runs every startup path, prints and optionally saves the timings'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--csv", default="nutrition_activity_obesity_usa_subset.csv")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="file to save the JSON results to")
+    args = parser.parse_args()
+
+    results = {}
+    for compact in [False, True]:
+        mode = "compact" if compact else "full"
+        results[f"{mode}/csv"] = measure(args.csv, compact, False, args.repeat, False)
+        results[f"{mode}/csv+save"] = measure(args.csv, compact, True, args.repeat, True)
+        results[f"{mode}/snapshot"] = measure(args.csv, compact, True, args.repeat, False)
+    shutil.rmtree(snapshot_dir(args.csv), ignore_errors=True)
+
+    print(f"{'path':<20}{'source':>10}{'min s':>10}{'median s':>10}{'rss MB':>10}{'data MB':>10}")
+    for path, stats in results.items():
+        print(f"{path:<20}{stats['source']:>10}{stats['min']:>10.3f}{stats['median']:>10.3f}"
+              f"{stats['rss_delta'] / 2**20:>10.1f}{stats['data_bytes'] / 2**20:>10.1f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fout:
+            json.dump(results, fout, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+'''
+    Production entry point: serves the app from several worker processes, which accept
+    connections on one shared listening socket. The job ids, the job registry and the
+    results are kept in an SQLite database shared by the workers, so any of them can
+    answer /api/get_results for a job submitted to another. With TP_DURABLE=1, the
+    database is kept across restarts and the jobs of the previous run are resumed.
+
+    Usage:
+        python serve.py --processes 4 --port 5000
+'''
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import uuid
+
+
+# Conditions shared by the workers to wake up the waiters of the jobs that finish
+COMPLETIONS = 64
+
+
+def run_worker(sock: socket.socket, host: str, port: int, completions: tuple) -> None:
+    '''Creates the app in this process and serves requests until SIGTERM'''
+    # pylint: disable=import-outside-toplevel
+    from werkzeug.serving import make_server
+    from app import create_app
+    from app.job_registry import SQLiteJobRegistry
+
+    SQLiteJobRegistry.completions = completions
+    webserver = create_app()
+    server = make_server(host, port, webserver, threaded=True, fd=sock.fileno())
+
+    # stop accepting requests, then finish the queued jobs before exiting
+    def stop(*_):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    server.serve_forever()
+    webserver.tasks_runner.graceful_shutdown()
+
+
+def main() -> None:
+    '''Opens the listening socket and forks the worker processes'''
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--processes", type=int,
+                        default=int(os.environ.get('WS_PROCESSES', os.cpu_count())))
+    args = parser.parse_args()
+
+    # the workers share the job registry and the results through one database
+    database = os.environ.setdefault('TP_REGISTRY_DB', './webserver.db')
+    os.environ.setdefault('TP_REGISTRY', 'sqlite')
+    os.environ.setdefault('RS_BACKEND', 'sqlite')
+    os.environ.setdefault('RS_DB', database)
+
+    # jobs of a previous run are only resumed by a durable server, by one of its workers
+    if os.environ.get('TP_DURABLE', '0') == '1':
+        os.environ['TP_BOOT_ID'] = uuid.uuid4().hex
+    else:
+        for suffix in ['', '-wal', '-shm']:
+            if os.path.exists(database + suffix):
+                os.remove(database + suffix)
+
+    # wakes up the requests waiting for a job finished by another worker
+    context = multiprocessing.get_context("fork")
+    completions = tuple(context.Condition() for _ in range(COMPLETIONS))
+    # reported by /api/load
+    os.environ['WS_SERVER'] = 'prefork'
+    os.environ['WS_PROCESSES'] = str(args.processes)
+    # /api/graceful_shutdown sent to any worker stops them all through this process
+    os.environ['WS_PARENT_PID'] = str(os.getpid())
+
+    sock = socket.create_server((args.host, args.port), backlog=1024)
+    sock.set_inheritable(True)
+
+    children = []
+    for _ in range(args.processes):
+        pid = os.fork()
+        if pid == 0:
+            run_worker(sock, args.host, args.port, completions)
+            os._exit(0)
+        children.append(pid)
+    print(f"Serving on http://{args.host}:{args.port} with {len(children)} processes")
+
+    def stop(*_):
+        for child in children:
+            os.kill(child, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for child in children:
+        os.waitpid(child, 0)
+
+
+if __name__ == '__main__':
+    main()
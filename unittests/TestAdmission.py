@@ -0,0 +1,65 @@
+'''
+    This file is used to test the admission control
+'''
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.admission import AdmissionControl, AdmissionError
+
+import unittest
+
+
+class TestAdmission(unittest.TestCase):
+    '''
+        This class contains the unit tests for the admission control
+    '''
+    def test_queue_limit(self):
+        '''
+            Test that jobs are rejected once the queue is full
+        '''
+        admission = AdmissionControl(max_queue=2, max_client_jobs=0)
+        admission.admit(1, "client")
+        admission.admit(2, "client")
+        with self.assertRaises(AdmissionError) as error:
+            admission.admit(3, "client")
+        self.assertGreaterEqual(error.exception.retry_after, 1)
+        self.assertEqual(admission.get_stats(2)["rejections"]["queue_full"], 1)
+
+        # a dequeued job frees its slot in the queue, even while it runs
+        admission.dequeued(1)
+        admission.admit(3, "client")
+
+
+    def test_client_limit(self):
+        '''
+            Test that a client is limited until its jobs complete
+        '''
+        admission = AdmissionControl(max_queue=0, max_client_jobs=1)
+        admission.admit(1, "a")
+        admission.admit(2, "b")
+        with self.assertRaises(AdmissionError):
+            admission.admit(3, "a")
+
+        admission.release(1)
+        admission.admit(3, "a")
+        self.assertEqual(admission.get_stats(1)["clients_in_flight"], 2)
+
+
+    def test_drain_time(self):
+        '''
+            Test that the drain time is estimated from the completions
+        '''
+        admission = AdmissionControl(max_queue=0, max_client_jobs=0)
+        self.assertIsNone(admission.get_stats(5)["drain_time"])
+        for job_id in range(10):
+            admission.admit(job_id, "client")
+            admission.release(job_id)
+        stats = admission.get_stats(5)
+        self.assertGreater(stats["service_rate"], 0)
+        self.assertAlmostEqual(stats["drain_time"], 5 / stats["service_rate"])
+
+
+if __name__ == '__main__':
+    unittest.main()
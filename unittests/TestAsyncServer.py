@@ -0,0 +1,145 @@
+'''
+    This file is used to test the asyncio server
+'''
+import sys
+import os
+import asyncio
+import json
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from flask import Flask, jsonify
+from app.async_http import AsyncHTTPServer
+from app.task_runner import ThreadPool
+
+import unittest
+
+
+def make_app() -> Flask:
+    '''Returns a Flask app with a ThreadPool and a results route like the real one'''
+    webserver = Flask(__name__)
+    webserver.tasks_runner = ThreadPool()
+
+    @webserver.route('/api/get_results/<int:job_id>')
+    def get_results(job_id):
+        if not webserver.tasks_runner.is_done(job_id):
+            return jsonify({"status": "running"})
+        return jsonify({"status": "done", "data": json.loads(
+            webserver.tasks_runner.get_result(job_id))})
+
+    @webserver.route('/stream')
+    def stream():
+        return webserver.response_class((b'x' * 1000 for _ in range(200)))
+
+    return webserver
+
+
+async def request(reader, writer, path: str) -> tuple:
+    '''Sends a GET request on a keep-alive connection, returns its headers and body'''
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode().split('\r\n')
+    headers = dict(line.split(': ', 1) for line in head[1:] if line)
+    if 'Content-Length' in headers:
+        return headers, await reader.readexactly(int(headers['Content-Length']))
+    body = b''
+    while (size := int(await reader.readline(), 16)) > 0:
+        body += await reader.readexactly(size)
+        await reader.readline()
+    await reader.readline()
+    return headers, body
+
+
+class TestAsyncServer(unittest.TestCase):
+    '''
+        This class contains the unit tests for the asyncio server
+    '''
+    def setUp(self):
+        self.webserver = make_app()
+
+    def tearDown(self):
+        self.webserver.tasks_runner.data_loaded.set()
+        self.webserver.tasks_runner.graceful_shutdown()
+
+
+    def run_server(self, scenario: callable):
+        '''Runs scenario(server, reader, writer) against a server on a free port'''
+        async def main():
+            server = AsyncHTTPServer(self.webserver, workers=2)
+            await server.start('127.0.0.1', 0)
+            port = server.server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            try:
+                await scenario(server, reader, writer)
+            finally:
+                writer.close()
+                server.server.close()
+                server.executor.shutdown()
+        asyncio.run(main())
+
+
+    def test_wait_without_thread(self):
+        '''
+            Test that a waiting request is woken up by the completion of its job,
+            without holding one of the app threads
+        '''
+        tasks_runner = self.webserver.tasks_runner
+        tasks_runner.add_task(lambda: '{"global_mean": 30.0}', 1)
+
+        async def scenario(server, reader, writer):
+            waiting = asyncio.ensure_future(request(reader, writer, '/api/get_results/1?wait=5'))
+            await asyncio.sleep(0.1)
+            self.assertEqual(server.stats["waiting"], 1)
+            self.assertFalse(waiting.done())
+
+            tasks_runner.data_loaded.set()
+            _, body = await asyncio.wait_for(waiting, 2)
+            self.assertEqual(json.loads(body), {"status": "done", "data": {"global_mean": 30.0}})
+
+            # a timed out wait answers with the current state
+            tasks_runner.add_task(lambda: time.sleep(0.5) or '{}', 2)
+            _, body = await request(reader, writer, '/api/get_results/2?wait=0.1')
+            self.assertEqual(json.loads(body), {"status": "running"})
+            self.assertNotIn(2, tasks_runner.completion["callbacks"])
+
+        self.run_server(scenario)
+
+
+    def test_invalid_content_length(self):
+        '''
+            Test that a malformed Content-Length is answered with 400
+        '''
+        self.webserver.tasks_runner.data_loaded.set()
+
+        async def scenario(_, reader, writer):
+            writer.write(b"POST /api/get_results/1 HTTP/1.1\r\nHost: test\r\n"
+                         b"Content-Length: abc\r\n\r\n")
+            await writer.drain()
+            status = await asyncio.wait_for(reader.readline(), 2)
+            self.assertTrue(status.startswith(b"HTTP/1.1 400"))
+
+        self.run_server(scenario)
+
+
+    def test_chunked_keep_alive(self):
+        '''
+            Test that bodies without a length are sent chunked on a reused connection
+        '''
+        self.webserver.tasks_runner.data_loaded.set()
+
+        async def scenario(server, reader, writer):
+            headers, body = await request(reader, writer, '/stream')
+            self.assertEqual(headers['Transfer-Encoding'], 'chunked')
+            self.assertEqual(body, b'x' * 200000)
+
+            headers, body = await request(reader, writer, '/api/get_results/7')
+            self.assertEqual(headers['Connection'], 'keep-alive')
+            self.assertEqual(json.loads(body), {"status": "running"})
+            self.assertEqual(server.stats["connections"], 1)
+
+        self.run_server(scenario)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+'''
+    This file is used to test the job registry
+'''
+import sys
+import os
+import multiprocessing
+import tempfile
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.job_registry import JobRegistry, JobState, SQLiteJobRegistry
+
+import unittest
+
+
+class TestJobRegistry(unittest.TestCase):
+    '''
+        This class contains the unit tests for the job registry
+    '''
+    def test_size_eviction(self):
+        '''
+            Test that the oldest finished jobs are evicted, running ones are kept
+        '''
+        evicted = []
+        registry = JobRegistry(max_jobs=2, ttl=60, on_evict=evicted.append)
+        for job_id in range(1, 5):
+            registry.add(job_id, "best5")
+        registry.finish(2)
+        registry.finish(3)
+
+        self.assertEqual(evicted, [2, 3])
+        self.assertEqual(registry.get(1), JobState.RUNNING)
+        self.assertIsNone(registry.get(2))
+        self.assertEqual(len(registry), 2)
+
+
+    def test_ttl_eviction(self):
+        '''
+            Test that finished jobs expire
+        '''
+        registry = JobRegistry(max_jobs=100, ttl=0.01)
+        registry.add(1, "best5")
+        registry.add(2, "best5")
+        registry.finish(1)
+        time.sleep(0.02)
+        registry.finish(2)
+
+        self.assertIsNone(registry.get(1))
+        self.assertEqual(registry.get(2), JobState.DONE)
+
+
+    def test_pagination_and_filters(self):
+        '''
+            Test that jobs are listed in pages and filtered
+        '''
+        registry = JobRegistry(max_jobs=100, ttl=60)
+        for job_id in range(1, 8):
+            registry.add(job_id, "best5" if job_id % 2 else "state_mean")
+        registry.finish(3)
+
+        jobs, cursor = registry.page(limit=3)
+        self.assertEqual([job["job_id"] for job in jobs], [1, 2, 3])
+        jobs, cursor = registry.page(after=cursor, limit=3)
+        self.assertEqual([job["job_id"] for job in jobs], [4, 5, 6])
+        jobs, cursor = registry.page(after=cursor, limit=3)
+        self.assertEqual(([job["job_id"] for job in jobs], cursor), ([7], None))
+
+        jobs, _ = registry.page(endpoint="best5", state=JobState.RUNNING)
+        self.assertEqual([job["job_id"] for job in jobs], [1, 5, 7])
+        self.assertEqual(registry.page(state=JobState.DONE)[0][0]["state"], "done")
+        self.assertEqual(registry.page(until=time.time() - 60)[0], [])
+
+    def test_pagination_skips_gaps(self):
+        '''
+            Test that a page is filled past evicted and unmatched jobs, and that a
+            cursor is only returned while more jobs match
+        '''
+        registry = JobRegistry(max_jobs=4, ttl=60)
+        for job_id in range(1, 13):
+            registry.add(job_id, "best5" if job_id in (2, 9, 12) else "state_mean")
+        for job_id in (1, 3, 4, 5, 6):
+            registry.finish(job_id)
+        self.assertEqual(registry.live_ids, [2, 7, 8, 9, 10, 11, 12])
+
+        jobs, cursor = registry.page(limit=1, endpoint="best5")
+        self.assertEqual(([job["job_id"] for job in jobs], cursor), ([2], 8))
+        jobs, cursor = registry.page(after=cursor, limit=1, endpoint="best5")
+        self.assertEqual(([job["job_id"] for job in jobs], cursor), ([9], 11))
+        jobs, cursor = registry.page(after=cursor, limit=1, endpoint="best5")
+        self.assertEqual(([job["job_id"] for job in jobs], cursor), ([12], None))
+        jobs, cursor = registry.page(limit=2, endpoint="best5", state=JobState.RUNNING)
+        self.assertEqual(([job["job_id"] for job in jobs], cursor), ([2, 9], 11))
+        self.assertEqual(registry.page(after=12), ([], None))
+
+
+    def test_sqlite_shared(self):
+        '''
+            Test that registries on the same database share job ids and jobs
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            evicted = []
+            first = SQLiteJobRegistry(path, max_jobs=2, ttl=60, on_evict=evicted.append)
+            second = SQLiteJobRegistry(path, max_jobs=100, ttl=60)
+
+            job_ids = [first.allocate(), second.allocate(), first.allocate()]
+            self.assertEqual(job_ids, [1, 2, 3])
+            first.add(1, "best5", version=1)
+            second.add(2, "worst5", version=1)
+            first.add(3, "best5", version=2, deadline=1e10)
+            second.finish(2)
+            self.assertEqual(first.get(2), JobState.DONE)
+            self.assertEqual(first.record(3).version, 2)
+            self.assertEqual(first.record(3).deadline, 1e10)
+
+            jobs, cursor = second.page(limit=1, endpoint="best5")
+            self.assertEqual([job["job_id"] for job in jobs], [1])
+            jobs, cursor = second.page(after=cursor, limit=1, endpoint="best5")
+            self.assertEqual(([job["job_id"] for job in jobs], cursor), ([3], None))
+
+            # a job finishes once, a cancelled one does not become done
+            self.assertTrue(second.finish(3, JobState.CANCELLED))
+            self.assertFalse(first.finish(3))
+            self.assertEqual(first.get(3), JobState.CANCELLED)
+
+            first.finish(1)
+            self.assertEqual(evicted, [2])
+            self.assertEqual(len(second), 2)
+            first.close()
+            second.close()
+
+    def test_sqlite_wait(self):
+        '''
+            Test that a waiter is woken up by another process finishing the job through
+            the shared condition of the job, without polling
+        '''
+        def finish(path, completions):
+            registry = SQLiteJobRegistry(path, max_jobs=100, ttl=60)
+            registry.completions = completions
+            time.sleep(0.2)
+            registry.finish(1)
+            registry.close()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            context = multiprocessing.get_context("fork")
+            registry = SQLiteJobRegistry(path, max_jobs=100, ttl=60)
+            registry.completions = (context.Condition(), context.Condition())
+            registry.poll_interval = 60
+            registry.add(registry.allocate(), "best5", version=1)
+            self.assertFalse(registry.wait_finished(1, 0.05))
+
+            process = context.Process(target=finish, args=(path, registry.completions))
+            process.start()
+            start = time.monotonic()
+            self.assertTrue(registry.wait_finished(1, 10))
+            self.assertLess(time.monotonic() - start, 5)
+            self.assertEqual(registry.get(1), JobState.DONE)
+            process.join()
+            registry.close()
+
+    def test_sqlite_recover(self):
+        '''
+            Test that the jobs left running by a previous run are claimed once, by the
+            next run, and that jobs without a query expire
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            previous = SQLiteJobRegistry(path, max_jobs=100, ttl=60)
+            previous.add(1, "best5", 1, query=("best5", ["q"], 0))
+            previous.add(2, "state_mean", 1, query=("state_mean", ["q", "Ohio"], 5))
+            previous.add(3, "best5", 1)
+            previous.finish(1)
+            previous.close()
+
+            first, second = (SQLiteJobRegistry(path, max_jobs=100, ttl=60) for _ in range(2))
+            second.boot = first.boot
+            self.assertEqual(first.recover(7),
+                             [(2, "state_mean", ["state_mean", ["q", "Ohio"], 5])])
+            self.assertEqual(second.recover(7), [])
+            self.assertEqual(first.record(2).version, 7)
+            self.assertEqual(first.get(3), JobState.EXPIRED)
+            self.assertEqual(first.get(1), JobState.DONE)
+
+            first.compact()
+            self.assertEqual(os.path.getsize(path + "-wal"), 0)
+            first.close()
+            second.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+'''
+    This file is used to test the logging pipeline
+'''
+import sys
+import os
+import json
+import logging
+import queue
+import tempfile
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from unittest.mock import patch
+from app.log_pipeline import BoundedQueueHandler, SamplingFilter, setup_logging, stop_logging
+
+import unittest
+
+
+class TestLogPipeline(unittest.TestCase):
+    '''
+        This class contains the unit tests for the logging pipeline
+    '''
+    def setUp(self):
+        self.logger = logging.getLogger(f"test.{self.id()}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+
+    def test_async_structured(self):
+        '''
+            Test that records are written as JSON, with their extra fields,
+            once the background thread is stopped
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "webserver.log")
+            with patch.dict(os.environ, {'LOG_MODE': 'async', 'LOG_FORMAT': 'json'}):
+                pipeline = setup_logging(self.logger, path)
+            payload = {"question": "q"}
+            self.logger.info("Received %s request", "best5", extra={"payload": payload})
+            self.logger.error("Invalid job_id: %s", 7)
+            stop_logging(pipeline)
+            self.logger.removeHandler(pipeline["handler"])
+
+            with open(path, "r", encoding="utf-8") as fin:
+                records = [json.loads(line) for line in fin]
+        self.assertEqual([record["msg"] for record in records],
+                         ["Received best5 request", "Invalid job_id: 7"])
+        self.assertEqual(records[0]["payload"], payload)
+        self.assertEqual(records[1]["level"], "ERROR")
+
+
+    def test_sampling(self):
+        '''
+            Test that a fraction of each info message is kept, evenly spaced,
+            and every error
+        '''
+        sampling = SamplingFilter(0.25)
+        kept = []
+        for i in range(12):
+            for level, msg in [(logging.INFO, "a %s"), (logging.INFO, "b %s"),
+                               (logging.ERROR, "c %s")]:
+                record = self.logger.makeRecord(self.logger.name, level, "", 0, msg, (i,), None)
+                if sampling.filter(record):
+                    kept.append(record.getMessage())
+        self.assertEqual([message for message in kept if message[0] == "a"],
+                         ["a 0", "a 4", "a 8"])
+        self.assertEqual(len([message for message in kept if message[0] == "b"]), 3)
+        self.assertEqual(len([message for message in kept if message[0] == "c"]), 12)
+
+
+    def test_full_queue_drops(self):
+        '''
+            Test that records are dropped and counted instead of blocking on a full queue
+        '''
+        handler = BoundedQueueHandler(queue.Queue(2))
+        self.logger.addHandler(handler)
+        for i in range(5):
+            self.logger.info("Job %s added to the queue", i)
+        self.logger.removeHandler(handler)
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
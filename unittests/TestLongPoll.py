@@ -0,0 +1,110 @@
+'''
+    This file is used to test the long-poll of /api/get_results
+'''
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import create_app
+
+import unittest
+
+
+class TestLongPoll(unittest.TestCase):
+    '''
+        This class contains the unit tests for /api/get_results?wait=<seconds>, the
+        polling contract without wait is covered by checker/checker.py
+    '''
+    @classmethod
+    def setUpClass(cls):
+        # the app loads its dataset and writes its log relative to the working directory
+        cls.cwd = os.getcwd()
+        cls.directory = tempfile.mkdtemp()
+        shutil.copy(
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "input", "test_input.csv"),
+            os.path.join(cls.directory, "nutrition_activity_obesity_usa_subset.csv"),
+        )
+        os.chdir(cls.directory)
+        cls.webserver = create_app()
+        cls.client = cls.webserver.test_client()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.webserver.tasks_runner.graceful_shutdown()
+        os.chdir(cls.cwd)
+        shutil.rmtree(cls.directory)
+
+
+    def slow_job(self) -> tuple:
+        '''Queues a job that runs until the returned event is set, returns its id'''
+        release = threading.Event()
+        tasks_runner = self.webserver.tasks_runner
+        job_id = tasks_runner.add_task(
+            lambda: release.wait(5) and '{"global_mean": 30.0}',
+            tasks_runner.jobs.allocate(),
+            "global_mean",
+            version=self.webserver.data_ingestor.version,
+        )
+        return job_id, release
+
+
+    def test_wait_for_result(self):
+        '''
+            Test that a request with wait answers with the result of a job completing
+            during the wait
+        '''
+        job_id, release = self.slow_job()
+        threading.Timer(0.2, release.set).start()
+
+        start = time.monotonic()
+        response = self.client.get(f"/api/get_results/{job_id}?wait=5")
+        self.assertLess(time.monotonic() - start, 4)
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.data)
+        self.assertEqual((result["status"], result["data"]), ("done", {"global_mean": 30.0}))
+
+
+    def test_wait_timeout(self):
+        '''
+            Test that a wait ending before the job answers with the running state, and
+            that invalid waits do not block
+        '''
+        job_id, release = self.slow_job()
+        try:
+            start = time.monotonic()
+            response = self.client.get(f"/api/get_results/{job_id}?wait=0.2")
+            self.assertGreaterEqual(time.monotonic() - start, 0.2)
+            self.assertEqual(json.loads(response.data), {"status": "running"})
+
+            for wait in ("nan", "-1", "soon"):
+                start = time.monotonic()
+                response = self.client.get(f"/api/get_results/{job_id}?wait={wait}")
+                self.assertLess(time.monotonic() - start, 1)
+                self.assertEqual(json.loads(response.data), {"status": "running"})
+        finally:
+            release.set()
+
+
+    def test_wait_submitted_job(self):
+        '''
+            Test that a job submitted through the API is returned by a single request
+            with wait
+        '''
+        response = self.client.post("/api/global_mean", json={
+            "question": "Percent of adults aged 18 years and older who have obesity"
+        })
+        job_id = json.loads(response.data)["job_id"]
+        response = self.client.get(f"/api/get_results/{job_id}?wait=5")
+        result = json.loads(response.data)
+        self.assertEqual(result["status"], "done")
+        self.assertIn("global_mean", result["data"])
+
+
+if __name__ == '__main__':
+    unittest.main()
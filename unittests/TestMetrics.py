@@ -0,0 +1,47 @@
+'''
+    This file is used to test the metrics registry
+'''
+import sys
+import os
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.metrics import Metrics
+
+import unittest
+
+
+class TestMetrics(unittest.TestCase):
+    '''
+        This class contains the unit tests for the metrics registry
+    '''
+    def test_render(self):
+        '''
+            Test the Prometheus text format of counters, histograms and gauges
+        '''
+        metrics = Metrics()
+        metrics.define("requests_total", "counter", "Requests", ("endpoint",))
+        metrics.define("latency_seconds", "histogram", "Latency", ("endpoint",))
+        metrics.inc("requests_total", ("best5",))
+        metrics.inc("requests_total", ("best5",))
+        metrics.observe("latency_seconds", ("best5",), 0.002)
+        metrics.observe("latency_seconds", ("best5",), 20)
+
+        lines = metrics.render([("queue_depth", "Depth", (), {(): 3})]).splitlines()
+        self.assertIn('requests_total{endpoint="best5"} 2', lines)
+        self.assertIn('latency_seconds_bucket{endpoint="best5",le="0.001"} 0', lines)
+        self.assertIn('latency_seconds_bucket{endpoint="best5",le="0.0025"} 1', lines)
+        self.assertIn('latency_seconds_bucket{endpoint="best5",le="10"} 1', lines)
+        self.assertIn('latency_seconds_bucket{endpoint="best5",le="+Inf"} 2', lines)
+        self.assertIn('latency_seconds_count{endpoint="best5"} 2', lines)
+        self.assertIn('# TYPE queue_depth gauge', lines)
+        self.assertIn('queue_depth 3', lines)
+
+        # label values are escaped
+        metrics.inc("requests_total", ('a\\b"c\nd',))
+        self.assertIn('requests_total{endpoint="a\\\\b\\"c\\nd"} 1',
+                      metrics.render([]).splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+'''
+    This file is used to test the execution of jobs on worker processes
+'''
+import sys
+import os
+import shutil
+import tempfile
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from functools import partial
+from app.data_ingestor import DataIngestor
+from app.process_pool import SharedMemoryExecutor, run_query
+
+import unittest
+
+
+class TestProcessPool(unittest.TestCase):
+    '''
+        This class contains the unit tests for the shared memory executor
+    '''
+    def test_same_results_as_threads(self):
+        '''
+            Test that jobs run on worker processes give the same results
+        '''
+        data_ingestor = DataIngestor("unittests/input/test_input.csv")
+        executor = SharedMemoryExecutor(2)
+        executor.start(data_ingestor.data)
+        try:
+            test_question = "Percent of adults aged 18 years and older who have obesity"
+            for method in ['global_mean', 'states_mean', 'best5', 'worst5',
+                           'diff_from_mean', 'mean_by_category']:
+                self.assertEqual(executor.run(partial(run_query, method, (test_question,))),
+                                 getattr(data_ingestor, method)(test_question)())
+            for method in ['state_mean', 'state_diff_from_mean', 'state_mean_by_category']:
+                args = (test_question, "Alabama")
+                self.assertEqual(executor.run(partial(run_query, method, args)),
+                                 getattr(data_ingestor, method)(*args)())
+        finally:
+            executor.shutdown()
+
+
+    def test_retired_version(self):
+        '''
+            Test that a job of a retired dataset version is refused, not run on another one
+        '''
+        data_ingestor = DataIngestor("unittests/input/test_input.csv")
+        executor = SharedMemoryExecutor(1)
+        executor.start(data_ingestor.data, 1)
+        executor.start(data_ingestor.data, 2)
+        try:
+            executor.retire(1)
+            with self.assertRaises(LookupError):
+                executor.run(partial(run_query, 'global_mean', ("q",)), 1)
+            self.assertEqual(executor.run(partial(run_query, 'global_mean', ("q",)), 2),
+                             data_ingestor.global_mean("q")())
+        finally:
+            executor.shutdown()
+
+
+    def test_column_store(self):
+        '''
+            Test that workers map the column store of a dataset instead of a copy
+        '''
+        with tempfile.TemporaryDirectory() as directory:
+            csv_path = os.path.join(directory, "data.csv")
+            shutil.copy("unittests/input/test_input.csv", csv_path)
+            data_ingestor = DataIngestor(csv_path, column_store=True)
+            executor = SharedMemoryExecutor(1)
+            executor.start(data_ingestor.data, store=(csv_path, data_ingestor.value_dtype))
+            try:
+                self.assertEqual(executor.pools[None][1], [])
+                args = ("Percent of adults aged 18 years and older who have obesity", "Alabama")
+                for method in ['state_mean_by_category', 'state_diff_from_mean']:
+                    self.assertEqual(executor.run(partial(run_query, method, args)),
+                                     getattr(data_ingestor, method)(*args)())
+            finally:
+                executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,163 @@
+'''
+    This file is used to test the result cache
+'''
+import sys
+import os
+
+from threading import Event, Thread
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.result_cache import ResultCache
+
+import unittest
+
+
+class TestResultCache(unittest.TestCase):
+    '''
+        This class contains the unit tests for the result cache
+    '''
+    def setUp(self):
+        self.done = set()
+        self.next_job_id = 1
+        self.cache = ResultCache(2, self.job_state)
+
+    def job_state(self, job_id):
+        '''
+            Fake job state, jobs above 100 have an evicted result
+        '''
+        if job_id > 100:
+            return None
+        return "done" if job_id in self.done else "running"
+
+    def submit(self):
+        '''
+            Fake job submission
+        '''
+        job_id = self.next_job_id
+        self.next_job_id += 1
+        return job_id
+
+
+    def test_coalesce_and_hit(self):
+        '''
+            Test that identical requests share one job, running or done
+        '''
+        key = ("states_mean", "question", None)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (1, False))
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (1, True))
+        self.done.add(1)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (1, True))
+
+        stats = self.cache.get_stats()
+        self.assertEqual((stats["misses"], stats["coalesced"], stats["hits"]), (1, 1, 1))
+
+
+    def test_lookup_done_only(self):
+        '''
+            Test that lookup only returns done jobs
+        '''
+        key = ("state_mean", "question", "Ohio")
+        self.assertIsNone(self.cache.lookup(key, 1))
+        self.cache.get_or_submit(key, 1, self.submit)
+        self.assertIsNone(self.cache.lookup(key, 1))
+        self.done.add(1)
+        self.assertEqual(self.cache.lookup(key, 1), 1)
+
+
+    def test_lru_eviction(self):
+        '''
+            Test that the least recently used key is evicted
+        '''
+        keys = [("best5", f"question{i}", None) for i in range(3)]
+        self.cache.get_or_submit(keys[0], 1, self.submit)
+        self.cache.get_or_submit(keys[1], 1, self.submit)
+        self.cache.get_or_submit(keys[0], 1, self.submit)
+        self.cache.get_or_submit(keys[2], 1, self.submit)
+
+        self.assertEqual(list(self.cache.entries), [keys[0], keys[2]])
+        self.assertEqual(self.cache.get_stats()["evictions"], 1)
+
+
+    def test_invalidated_by_dataset_version(self):
+        '''
+            Test that a new dataset version drops the cached jobs
+        '''
+        key = ("state_mean", "question", "Alabama")
+        self.cache.get_or_submit(key, 1, self.submit)
+        self.assertEqual(self.cache.get_or_submit(key, 2, self.submit), (2, False))
+
+        # a request bound to the previous version does not drop the newer cache
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (3, False))
+        self.assertIsNone(self.cache.lookup(key, 1))
+        self.assertEqual(self.cache.get_or_submit(key, 2, self.submit), (2, True))
+
+
+    def test_detach(self):
+        '''
+            Test that a job is only dropped from the cache once every request attached
+            to it is detached
+        '''
+        key = ("best5", "question", None)
+        self.cache.get_or_submit(key, 1, self.submit)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (1, True))
+        self.assertEqual(self.cache.detach(1), 1)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (1, True))
+        self.assertEqual(self.cache.detach(1), 1)
+        self.assertEqual(self.cache.detach(1), 0)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (2, False))
+
+        # a job that is not cached has no other request attached
+        self.assertEqual(self.cache.detach(50), 0)
+
+
+    def test_submit_outside_lock(self):
+        '''
+            Test that submit() runs without the cache lock, and that an identical request
+            arriving meanwhile attaches to the job being submitted
+        '''
+        key = ("best5", "question", None)
+        submitting, release = Event(), Event()
+
+        def slow_submit():
+            submitting.set()
+            release.wait()
+            return self.submit()
+
+        first = Thread(target=self.cache.get_or_submit, args=(key, 1, slow_submit))
+        first.start()
+        submitting.wait()
+        # other keys are served while the job is submitted
+        self.assertEqual(self.cache.get_or_submit(("worst5", "question", None), 1,
+                                                  lambda: 50), (50, False))
+        results = []
+        second = Thread(target=lambda: results.append(
+            self.cache.get_or_submit(key, 1, self.submit)))
+        second.start()
+        release.set()
+        first.join()
+        second.join()
+        self.assertEqual(results, [(1, True)])
+
+
+    def test_evicted_result_resubmitted(self):
+        '''
+            Test that a job whose result was evicted is not reused
+        '''
+        key = ("best5", "question", None)
+        self.next_job_id = 101
+        self.cache.get_or_submit(key, 1, self.submit)
+        self.assertEqual(self.cache.get_or_submit(key, 1, self.submit), (102, False))
+
+
+    def test_failed_submission_not_cached(self):
+        '''
+            Test that a rejected job is not cached
+        '''
+        key = ("global_mean", "question", None)
+        self.assertEqual(self.cache.get_or_submit(key, 1, lambda: -1), (-1, False))
+        self.assertEqual(len(self.cache.entries), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
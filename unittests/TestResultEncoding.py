@@ -0,0 +1,49 @@
+'''
+    This file is used to test the precomputed encodings of the results
+'''
+import sys
+import os
+import gzip
+import json
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.result_encoding import CODINGS, encode_variants, json_body, msgpack
+
+import unittest
+
+RESULT = json.dumps({f"State {i}": i / 7 for i in range(100)}).encode()
+
+
+class TestResultEncoding(unittest.TestCase):
+    '''
+        This class contains the unit tests for the result encodings
+    '''
+    def test_compressed(self):
+        '''
+            Test that every available coding decodes to the JSON body
+        '''
+        variants = encode_variants(RESULT, 3, list(CODINGS), 0)
+        self.assertEqual(set(variants), {f"json.{coding}" for coding in CODINGS})
+        self.assertEqual(gzip.decompress(variants["json.gzip"]), json_body(RESULT, 3))
+        self.assertEqual(json.loads(json_body(RESULT, 3)),
+                         {"status": "done", "version": 3, "data": json.loads(RESULT)})
+
+    def test_small_not_compressed(self):
+        '''
+            Test that results below the minimum size are not compressed
+        '''
+        self.assertEqual(encode_variants(b'{"global_mean": 1.0}', 1, ['gzip'], 1024), {})
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        '''
+            Test that the MessagePack body holds the same result
+        '''
+        variants = encode_variants(RESULT, 3, ['msgpack', 'gzip'], 0)
+        self.assertEqual(msgpack.unpackb(variants["msgpack"]), json.loads(json_body(RESULT, 3)))
+        self.assertEqual(gzip.decompress(variants["msgpack.gzip"]), variants["msgpack"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+'''
+    This file is used to test the result stores
+'''
+import sys
+import os
+import tempfile
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.result_store import FileResultStore, MemoryResultStore, SQLiteResultStore
+
+import unittest
+
+
+class TestResultStore(unittest.TestCase):
+    '''
+        This class contains the unit tests for the result stores
+    '''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+        os.rmdir(self.directory)
+
+
+    def test_file_store(self):
+        '''
+            Test that the file store round-trips results
+        '''
+        store = FileResultStore(self.directory)
+        store.put(1, b'{"global_mean": 30.0}')
+        self.assertEqual(store.get(1), b'{"global_mean": 30.0}')
+        self.assertIsNone(store.get(2))
+        size, chunks = store.get_chunks(1, 4)
+        self.assertEqual(size, 21)
+        self.assertEqual(b''.join(chunks), b'{"global_mean": 30.0}')
+        self.assertIsNone(store.get_chunks(2, 4))
+        store.remove(1)
+        self.assertIsNone(store.get(1))
+
+        # the directory is removed with the results still in it
+        directory = os.path.join(self.directory, "results")
+        store = FileResultStore(directory)
+        store.put_many({1: b'{}', "1.json.gzip": b'compressed'})
+        store.close()
+        self.assertFalse(os.path.exists(directory))
+
+
+    def test_memory_store_size_cap(self):
+        '''
+            Test that the oldest results are evicted above max_bytes
+        '''
+        store = MemoryResultStore(max_bytes=10, ttl=60)
+        store.put(1, b'12345')
+        store.put(2, b'12345')
+        store.put(3, b'12345')
+        self.assertIsNone(store.get(1))
+        self.assertEqual(store.get(3), b'12345')
+        self.assertEqual(store.get_stats()["bytes"], 10)
+
+        # the encodings of a result are evicted with it
+        store = MemoryResultStore(max_bytes=10, ttl=60)
+        store.put_many({1: b'12345', "1.json.gzip": b'123'})
+        store.put(2, b'12345')
+        self.assertIsNone(store.get(1))
+        self.assertIsNone(store.get("1.json.gzip"))
+        self.assertEqual(store.get_stats()["bytes"], 5)
+        store.remove(2)
+        self.assertEqual(store.get_stats()["results"], 0)
+
+        # only the results held in memory are walked to make room
+        store = MemoryResultStore(max_bytes=10, ttl=60)
+        for job_id in range(1, 101):
+            store.put(job_id, b'12345')
+            self.assertLessEqual(len(store.resident), 2)
+        self.assertEqual(list(store.resident), [99, 100])
+        self.assertEqual(store.get_stats()["bytes"], 10)
+
+
+    def test_memory_store_ttl(self):
+        '''
+            Test that expired results are evicted
+        '''
+        store = MemoryResultStore(max_bytes=100, ttl=0.01)
+        store.put(1, b'{}')
+        store.put(2, b'{}')
+        time.sleep(0.02)
+        self.assertIsNone(store.get(1))
+        self.assertIsNone(store.get_chunks(2, 1))
+        self.assertEqual(store.get_stats()["results"], 0)
+
+
+    def test_memory_store_spill(self):
+        '''
+            Test that large and evicted results are spilled to disk
+        '''
+        store = MemoryResultStore(
+            max_bytes=10, ttl=60, spill=FileResultStore(self.directory), spill_threshold=8
+        )
+        store.put(1, b'123456789')
+        store.put(2, b'123456')
+        store.put(3, b'123456')
+        self.assertEqual(sorted(os.listdir(self.directory)), ["job_1", "job_2"])
+        self.assertEqual(store.get(1), b'123456789')
+        self.assertEqual(store.get(2), b'123456')
+        self.assertEqual(store.get_stats()["bytes"], 6)
+        self.assertEqual(list(store.resident), [3])
+        for job_id, data in [(1, b'123456789'), (3, b'123456')]:
+            size, chunks = store.get_chunks(job_id, 4)
+            self.assertEqual((size, b''.join(chunks)), (len(data), data))
+
+
+    def test_sqlite_store(self):
+        '''
+            Test that results stored by one process are read by another
+        '''
+        path = os.path.join(self.directory, "results.db")
+        writer = SQLiteResultStore(path)
+        reader = SQLiteResultStore(path)
+        writer.put_many({1: b'{"global_mean": 30.0}', "1.json.gzip": b'compressed'})
+        self.assertEqual(reader.get(1), b'{"global_mean": 30.0}')
+        self.assertTrue(reader.contains("1.json.gzip"))
+        size, chunks = reader.get_chunks(1, 4)
+        self.assertEqual((size, b''.join(chunks)), (21, b'{"global_mean": 30.0}'))
+        writer.remove(1)
+        self.assertIsNone(reader.get_chunks(1, 4))
+        self.assertEqual(reader.get_stats()["results"], 1)
+        writer.close()
+        reader.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
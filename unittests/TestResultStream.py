@@ -0,0 +1,76 @@
+'''
+    This file is used to test the streaming of stored results
+'''
+import ast
+import sys
+import os
+import json
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.data_ingestor import DataIngestor
+from app.result_stream import iter_entries, stream_json, stream_ndjson
+
+import unittest
+
+data_ingestor = DataIngestor("unittests/input/test_input.csv")
+TEST_QUESTION = "Percent of adults aged 18 years and older who have obesity"
+
+
+def split(data: bytes, size: int) -> iter:
+    '''Returns an iterator over data, size bytes at a time'''
+    return iter([data[i:i + size] for i in range(0, len(data), size)])
+
+
+class TestResultStream(unittest.TestCase):
+    '''
+        This class contains the unit tests for the result streaming
+    '''
+    def test_entries(self):
+        '''
+            Test that the entries of a result are found whatever the chunk boundaries
+        '''
+        for result in [data_ingestor.mean_by_category(TEST_QUESTION)(),
+                       data_ingestor.state_mean_by_category(TEST_QUESTION, "Alabama")(),
+                       data_ingestor.states_mean(TEST_QUESTION)(), '{}']:
+            for size in [1, 7, 4096]:
+                entries = iter_entries(split(result.encode(), size))
+                rebuilt = '{' + ', '.join(f'"{key.decode()}": {value.decode()}'
+                                          for key, value in entries) + '}'
+                self.assertEqual(rebuilt, result)
+
+        # a truncated result is reported, not cut short silently
+        with self.assertRaises(ValueError):
+            list(iter_entries(split(b'{"a": 1.0, "b": {"c": 2', 4)))
+
+    def test_pages(self):
+        '''
+            Test that pages of states put together give the whole result
+        '''
+        result = data_ingestor.mean_by_category(TEST_QUESTION)().encode()
+        merged = {}
+        offset = 0
+        pages = 0
+        while offset is not None:
+            body = b''.join(stream_json(b'{"status": "done"', split(result, 100), (offset, 5)))
+            page = json.loads(body)
+            self.assertLessEqual(len({ast.literal_eval(key)[0] for key in page["data"]}), 5)
+            merged.update(page["data"])
+            offset = page["next"]
+            pages += 1
+        self.assertEqual(merged, json.loads(result))
+        self.assertGreater(pages, 1)
+
+    def test_ndjson(self):
+        '''
+            Test that every entry of a result is streamed on its own line
+        '''
+        result = data_ingestor.states_mean(TEST_QUESTION)().encode()
+        lines = b''.join(stream_ndjson(b'{"status": "done"', split(result, 64))).splitlines()
+        self.assertEqual(json.loads(lines[0]), {"status": "done"})
+        self.assertEqual({json.loads(line)["key"]: json.loads(line)["value"]
+                          for line in lines[1:]}, json.loads(result))
+
+
+if __name__ == '__main__':
+    unittest.main()
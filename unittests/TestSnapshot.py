@@ -0,0 +1,94 @@
+'''
+    This file is used to test the binary snapshot of the dataset
+'''
+import sys
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.data_ingestor import DataIngestor
+from app.snapshot import snapshot_dir
+
+import unittest
+
+TEST_QUESTION = "Percent of adults aged 18 years and older who have obesity"
+
+class TestSnapshot(unittest.TestCase):
+    '''
+        This class contains the unit tests for the dataset snapshot
+    '''
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.csv_path = os.path.join(self.directory, "data.csv")
+        shutil.copy("unittests/input/test_input.csv", self.csv_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assert_same_answers(self, ingestor: DataIngestor, reference: DataIngestor) -> None:
+        '''Checks that both ingestors answer every query the same'''
+        for method in ['global_mean', 'states_mean', 'best5', 'worst5',
+                       'diff_from_mean', 'mean_by_category']:
+            self.assertEqual(getattr(ingestor, method)(TEST_QUESTION)(),
+                             getattr(reference, method)(TEST_QUESTION)())
+        for method in ['state_mean', 'state_diff_from_mean', 'state_mean_by_category']:
+            self.assertEqual(getattr(ingestor, method)(TEST_QUESTION, "Alabama")(),
+                             getattr(reference, method)(TEST_QUESTION, "Alabama")())
+
+    def test_snapshot_round_trip(self):
+        '''
+            Test that the first load saves a snapshot and the next one answers from it
+        '''
+        for compact in [False, True]:
+            first = DataIngestor(self.csv_path, compact=compact, snapshot=True)
+            self.assertEqual(first.memory_report["source"], "csv")
+            self.assertTrue(os.path.isdir(snapshot_dir(self.csv_path)))
+
+            second = DataIngestor(self.csv_path, compact=compact, snapshot=True)
+            self.assertEqual(second.memory_report["source"], "snapshot")
+            self.assertEqual(list(second.data.columns), list(first.data.columns))
+            self.assertEqual(list(second.data.dtypes), list(first.data.dtypes))
+            self.assert_same_answers(second, first)
+
+    def test_snapshot_invalidated(self):
+        '''
+            Test that a snapshot is not used once the CSV changed
+        '''
+        DataIngestor(self.csv_path, snapshot=True)
+        stat = os.stat(self.csv_path)
+        os.utime(self.csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+        ingestor = DataIngestor(self.csv_path, snapshot=True)
+        self.assertEqual(ingestor.memory_report["source"], "csv")
+        self.assertEqual(DataIngestor(self.csv_path, snapshot=True).memory_report["source"],
+                         "snapshot")
+
+    def test_column_store(self):
+        '''
+            Test that the column store is loaded compact, that its columns and the
+            lookups of its index are views of the mapped files, and that it answers
+            like a CSV load
+        '''
+        DataIngestor(self.csv_path, column_store=True)
+        ingestor = DataIngestor(self.csv_path, column_store=True)
+        self.assertEqual(ingestor.memory_report["source"], "snapshot")
+        self.assertTrue(ingestor.compact)
+
+        def mapped(array: np.ndarray) -> bool:
+            while array.base is not None and not isinstance(array, np.memmap):
+                array = array.base
+            return isinstance(array, np.memmap)
+
+        self.assertTrue(mapped(ingestor.data['Question'].array.codes))
+        self.assertTrue(mapped(ingestor.data['Data_Value'].to_numpy()))
+        self.assertTrue(mapped(ingestor.category_index[TEST_QUESTION]['sum'].to_numpy()))
+        self.assertTrue(mapped(ingestor.states_index[TEST_QUESTION]['count'].to_numpy()))
+        self.assert_same_answers(ingestor, DataIngestor(self.csv_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
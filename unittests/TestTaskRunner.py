@@ -0,0 +1,261 @@
+'''
+    This file is used to test the thread pool
+'''
+import sys
+import os
+import tempfile
+import time
+
+# Add the parent directory to the Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from threading import BoundedSemaphore, Event, Timer
+from app.job_registry import JobState
+from app.result_store import make_result_store
+from app.task_runner import FairQueue, ThreadPool
+
+import unittest
+from unittest.mock import patch
+
+
+class TestThreadPool(unittest.TestCase):
+    '''
+        This class contains the unit tests for the thread pool
+    '''
+    def setUp(self):
+        self.pool = ThreadPool()
+
+    def tearDown(self):
+        self.pool.data_loaded.set()
+        self.pool.graceful_shutdown()
+
+
+    def test_run_job(self):
+        '''
+            Test that a job runs and its result is stored
+        '''
+        self.pool.data_loaded.set()
+        self.pool.add_task(lambda: '{"global_mean": 30.0}', 1)
+        self.assertTrue(self.pool.wait(1, 5))
+        self.assertEqual(self.pool.get_result(1), b'{"global_mean": 30.0}')
+
+
+    def test_wait_woken_by_completion(self):
+        '''
+            Test that a waiter is woken up as soon as its job completes
+        '''
+        self.pool.add_task(lambda: '{}', 1)
+        self.assertFalse(self.pool.wait(1, 0.05))
+        # a timed out waiter leaves nothing behind
+        self.assertEqual(self.pool.completion["events"], {})
+        self.assertEqual(self.pool.completion["waiting"], {})
+
+        Timer(0.05, self.pool.data_loaded.set).start()
+        start = time.monotonic()
+        self.assertTrue(self.pool.wait(1, 5))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+    def test_waiters_limit(self):
+        '''
+            Test that waiters above the limit return immediately
+        '''
+        self.pool.waiters = BoundedSemaphore(1)
+        self.pool.waiters.acquire()
+        self.pool.add_task(lambda: '{}', 1)
+
+        start = time.monotonic()
+        self.assertFalse(self.pool.wait(1, 5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.pool.waiters.release()
+
+
+    def test_failed_job(self):
+        '''
+            Test that a job raising an exception fails, wakes up its waiters and releases
+            its slot, and that its thread keeps running the next jobs
+        '''
+        def broken():
+            raise ValueError("broken")
+
+        self.pool.add_task(broken, 1, client="c")
+        Timer(0.05, self.pool.data_loaded.set).start()
+        start = time.monotonic()
+        with self.assertLogs("webserver_logger", "ERROR"):
+            self.assertFalse(self.pool.wait(1, 5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.pool.jobs.get(1).name, "FAILED")
+        self.assertEqual(self.pool.get_state(1), None)
+        self.assertEqual(self.pool.admission.in_flight, {})
+        self.assertEqual(self.pool.completion["versions"], {})
+
+        for job_id in range(2, 2 + self.pool.num_of_threads):
+            self.pool.add_task(lambda: '{}', job_id)
+            self.assertTrue(self.pool.wait(job_id, 5))
+
+
+    def test_cancel_and_expire(self):
+        '''
+            Test that cancelled and expired jobs are dropped without running, and that
+            their waiters are woken up
+        '''
+        ran = []
+        self.pool.add_task(lambda: ran.append(1) or '{}', 1, client="c")
+        self.pool.add_task(lambda: ran.append(2) or '{}', 2, client="c", deadline=time.time() - 1)
+        self.pool.add_task(lambda: ran.append(3) or '{}', 3, client="c", deadline=time.time() + 60)
+
+        Timer(0.05, self.pool.cancel, args=(1,)).start()
+        start = time.monotonic()
+        self.assertFalse(self.pool.wait(1, 5))
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(self.pool.get_state(1), None)
+
+        self.pool.data_loaded.set()
+        self.assertTrue(self.pool.wait(3, 5))
+        self.assertFalse(self.pool.wait(2, 5))
+        self.assertEqual(ran, [3])
+        self.assertEqual([self.pool.jobs.get(job_id).name for job_id in (1, 2, 3)],
+                         ["CANCELLED", "EXPIRED", "DONE"])
+        self.assertFalse(self.pool.cancel(3))
+        self.assertEqual(self.pool.admission.in_flight, {})
+
+
+    def test_cancelled_elsewhere(self):
+        '''
+            Test that a job cancelled while it runs, e.g. by another server process through
+            the shared registry, has its result dropped and its admission slot released
+        '''
+        started, cancelled = Event(), Event()
+        self.pool.add_task(lambda: started.set() or cancelled.wait(5) and '{}', 1, client="c")
+        self.pool.data_loaded.set()
+        self.assertTrue(started.wait(5))
+        self.assertTrue(self.pool.jobs.finish(1, JobState.CANCELLED))
+        cancelled.set()
+
+        deadline = time.monotonic() + 5
+        while self.pool.admission.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.admission.in_flight, {})
+        self.assertFalse(self.pool.result_store.contains(1))
+
+
+    def test_durable_restart(self):
+        '''
+            Test that results outlive the server with TP_DURABLE=1, and that queued jobs
+            are queued again by the next run
+        '''
+        class Ingestor:
+            '''Dataset stand-in with a single query'''
+            version = 3
+
+            def global_mean(self, question):
+                '''Returns the job of the query'''
+                return lambda: f'{{"{question}": {self.version}}}'
+
+        ingestor = Ingestor()
+        self.pool.data_loaded.set()
+        self.pool.graceful_shutdown()
+        with tempfile.TemporaryDirectory() as directory, patch.dict(os.environ, {
+                'TP_DURABLE': '1', 'TP_REGISTRY_DB': os.path.join(directory, "jobs.db"),
+                'RS_DB': os.path.join(directory, "jobs.db")}):
+            self.pool = ThreadPool(make_result_store())
+            self.pool.data_loaded.set()
+            self.pool.add_task(self.pool.make_task(ingestor.global_mean, "a"), 1, "global_mean")
+            self.assertTrue(self.pool.wait(1, 5))
+            self.pool.graceful_shutdown()
+
+            # a job still queued when the server stopped: no thread ever dequeues it
+            with patch.dict(os.environ, {'TP_NUM_OF_THREADS': '0'}):
+                self.pool = ThreadPool(make_result_store())
+            self.pool.add_task(self.pool.make_task(ingestor.global_mean, "b"), 2, "global_mean")
+            self.pool.graceful_shutdown()
+
+            self.pool = ThreadPool(make_result_store())
+            self.assertEqual(self.pool.get_result(1), b'{"a": 3}')
+            self.assertEqual(self.pool.recover(ingestor), 1)
+            self.pool.data_loaded.set()
+            self.assertTrue(self.pool.wait(2, 5))
+            self.assertEqual(self.pool.get_result(2), b'{"b": 3}')
+            self.pool.graceful_shutdown()
+
+
+    def test_autoscale(self):
+        '''
+            Test that threads are added while jobs wait, retired once idle, and that
+            shutdown still runs every queued job
+        '''
+        self.pool.data_loaded.set()
+        self.pool.graceful_shutdown()
+        environ = {'TP_AUTOSCALE': '1', 'TP_NUM_OF_THREADS': '1', 'TP_MIN_THREADS': '1',
+                   'TP_MAX_THREADS': '4', 'TP_TARGET_WAIT': '0.01', 'TP_SCALE_COOLDOWN': '0.5'}
+        with patch.dict(os.environ, environ):
+            self.pool = ThreadPool()
+        self.pool.autoscaler.interval = 0.05
+        self.pool.data_loaded.set()
+
+        for job_id in range(1, 41):
+            self.pool.add_task(lambda: time.sleep(0.02) or '{}', job_id)
+        deadline = time.monotonic() + 5
+        while self.pool.get_num_threads() < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.pool.get_num_threads(), 4)
+
+        self.assertTrue(self.pool.wait(40, 5))
+        deadline = time.monotonic() + 5
+        while self.pool.get_num_threads() > 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self.pool.get_num_threads(), 1)
+
+        for job_id in range(41, 61):
+            self.pool.add_task(lambda: '{}', job_id)
+        self.pool.graceful_shutdown()
+        self.assertTrue(all(self.pool.is_done(job_id) for job_id in range(1, 61)))
+        self.assertEqual(self.pool.add_task(lambda: '{}', 61), -1)
+
+
+
+
+class TestFairQueue(unittest.TestCase):
+    '''
+        This class contains the unit tests for the weighted-fair queue
+    '''
+    def test_weighted_share(self):
+        '''
+            Test that light jobs overtake a backlog of heavy ones, by weight
+        '''
+        queue = FairQueue({'light': 4.0, 'heavy': 1.0})
+        for i in range(10):
+            queue.put(f"heavy{i}", 'heavy')
+        for i in range(8):
+            queue.put(f"light{i}", 'light')
+
+        order = [queue.get() for _ in range(10)]
+        self.assertEqual(sum(item.startswith('light') for item in order), 8)
+        self.assertEqual(order[0], "light0")
+
+
+    def test_priority_and_sentinel(self):
+        '''
+            Test that higher priorities go first and sentinels come last
+        '''
+        queue = FairQueue({'medium': 1.0})
+        queue.put_sentinel(None)
+        queue.put("low", 'medium', -1)
+        queue.put("normal", 'medium')
+        queue.put("high", 'medium', 5)
+
+        self.assertEqual([queue.get() for _ in range(4)], ["high", "normal", "low", None])
+        stats = queue.get_stats()['medium']
+        self.assertEqual((stats["queued"], stats["dequeued"]), (0, 3))
+
+
+    def test_invalid_weights(self):
+        '''
+            Test that a class weight of 0 is refused when the pool is created
+        '''
+        with patch.dict(os.environ, {'TP_CLASS_WEIGHTS': 'light:0', 'TP_NUM_OF_THREADS': '0'}):
+            with self.assertRaises(ValueError):
+                ThreadPool()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,13 @@
 '''
 import sys
 import os
+import json
+import math
+import tempfile
 
 # Add the parent directory to the Python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.data_ingestor import DataIngestor
+from app.data_ingestor import DataIngestor, QUERIES
 
 import unittest
 
@@ -15,7 +18,7 @@ data_ingestor = DataIngestor("unittests/input/test_input.csv")
 
 # total score
 total_score = 0
-NUM_TESTS = 9
+NUM_TESTS = 14
 
 class TestDataIngestor(unittest.TestCase):
     '''
@@ -110,6 +113,133 @@ class TestDataIngestor(unittest.TestCase):
         self.generic_test(data_ingestor.state_mean_by_category(question=test_question, state=test_state), "unittests/ref/state_mean_by_category.json")
 
 
+    def test_unknown_state(self):
+        '''
+            Test that a state missing from the index yields NaN / empty results
+        '''
+        global total_score
+        test_question = "Percent of adults aged 18 years and older who have obesity"
+        test_state = "Atlantis"
+        self.assertEqual(data_ingestor.state_mean(test_question, test_state)(), '{"Atlantis": NaN}')
+        self.assertEqual(data_ingestor.state_mean_by_category(test_question, test_state)(),
+                         '{"Atlantis": {}}')
+        total_score += 1
+
+
+    def test_compact_load(self):
+        '''
+            Test that the compact loader gives the same results as the full one
+        '''
+        global total_score
+        compact_ingestor = DataIngestor("unittests/input/test_input.csv", compact=True)
+        test_question = "Percent of adults aged 18 years and older who have obesity"
+        self.assertEqual(list(compact_ingestor.data.columns),
+                         ['LocationDesc', 'Question', 'Data_Value',
+                          'Stratification1', 'StratificationCategory1'])
+        self.assertEqual(compact_ingestor.data['Question'].dtype, 'category')
+        for method in ['global_mean', 'states_mean', 'best5', 'worst5',
+                       'diff_from_mean', 'mean_by_category']:
+            self.assertEqual(getattr(compact_ingestor, method)(test_question)(),
+                             getattr(data_ingestor, method)(test_question)())
+        for method in ['state_mean', 'state_diff_from_mean', 'state_mean_by_category']:
+            self.assertEqual(getattr(compact_ingestor, method)(test_question, "Alabama")(),
+                             getattr(data_ingestor, method)(test_question, "Alabama")())
+        total_score += 1
+
+
+    def test_batch(self):
+        '''
+            Test that a batch answers every query like the individual methods
+        '''
+        global total_score
+        test_question = "Percent of adults aged 18 years and older who have obesity"
+        queries = [
+            ('states_mean', (test_question,)),
+            ('best5', (test_question,)),
+            ('worst5', (test_question,)),
+            ('diff_from_mean', (test_question,)),
+            ('state_mean', (test_question, "Alabama")),
+            ('state_mean_by_category', (test_question, "Alabama")),
+        ]
+        res = json.loads(data_ingestor.batch(queries)())
+        self.assertEqual(res, [json.loads(getattr(data_ingestor, method)(*args)())
+                               for method, args in queries])
+        total_score += 1
+
+
+    def test_append(self):
+        '''
+            Test that appending rows gives the same results as loading all of them
+        '''
+        global total_score
+        test_question = "Percent of adults aged 18 years and older who have obesity"
+        with open("unittests/input/test_input.csv", "r", encoding="utf-8") as fin:
+            lines = fin.readlines()
+        with tempfile.TemporaryDirectory() as directory:
+            for name, rows in [("base.csv", lines[:len(lines) // 2]),
+                               ("delta.csv", lines[:1] + lines[len(lines) // 2:])]:
+                with open(os.path.join(directory, name), "w", encoding="utf-8") as fout:
+                    fout.writelines(rows)
+            for compact in [False, True]:
+                base = DataIngestor(os.path.join(directory, "base.csv"), compact=compact)
+                appended = base.append(os.path.join(directory, "delta.csv"))
+                self.assertGreater(appended.version, base.version)
+                self.assertEqual(len(appended.data), len(data_ingestor.data))
+                for method in ['global_mean', 'states_mean', 'mean_by_category']:
+                    res = json.loads(getattr(appended, method)(test_question)())
+                    ref = json.loads(getattr(data_ingestor, method)(test_question)())
+                    self.assertEqual(list(res), list(ref))
+                    for key, value in res.items():
+                        self.assertTrue(math.isclose(value, ref[key], rel_tol=1e-9))
+        total_score += 1
+
+
+    def test_year_range(self):
+        '''
+            Test that year ranges and trends match filtering the rows by year
+        '''
+        global total_score
+        test_question = "Percent of adults aged 18 years and older who have obesity"
+        data = data_ingestor.data.assign(YearStart=2011 + data_ingestor.data.index % 4)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "years.csv")
+            data.to_csv(path, index=False)
+            for compact in [False, True]:
+                yearly = DataIngestor(path, compact=compact)
+                self.assertEqual(list(yearly.years), [2011, 2012, 2013, 2014])
+                for year_from, year_to in [(2012, 2013), (None, 2011), (2014, None), (2020, None)]:
+                    rows = data[(data.Question == test_question)
+                                & (data.YearStart >= (year_from or 0))
+                                & (data.YearStart <= (year_to or 9999))]
+                    ref = rows.groupby('LocationDesc').Data_Value.mean().dropna()
+                    res = json.loads(yearly.states_mean(test_question, year_from, year_to)())
+                    self.assertEqual(sorted(res), sorted(ref.index))
+                    for state, value in res.items():
+                        self.assertTrue(math.isclose(value, ref[state], rel_tol=1e-9))
+                    res = json.loads(yearly.global_mean(test_question, year_from, year_to)())
+                    if len(rows):
+                        self.assertTrue(math.isclose(res["global_mean"], rows.Data_Value.mean(),
+                                                     rel_tol=1e-9))
+
+                state = data[data.Question == test_question].LocationDesc.iloc[0]
+                rows = data[(data.Question == test_question) & (data.LocationDesc == state)]
+                ref = rows.groupby('YearStart').Data_Value.mean().dropna()
+                res = json.loads(yearly.state_trend(test_question, state)())[state]
+                self.assertEqual(list(res), [str(year) for year in ref.index])
+                for year, value in ref.items():
+                    self.assertTrue(math.isclose(res[str(year)], value, rel_tol=1e-9))
+
+                # an unknown question gets the same answer with a range as without one
+                for method, has_state in QUERIES.items():
+                    args = ("unknown", state) if has_state else ("unknown",)
+                    self.assertEqual(getattr(yearly, method)(*args, 2011)(),
+                                     getattr(yearly, method)(*args)())
+
+        # without a YearStart column, there is no year to restrict to
+        self.assertEqual(len(data_ingestor.years), 0)
+        total_score += 1
+
+
 if __name__ == '__main__':
     try:
         unittest.main(exit=False)